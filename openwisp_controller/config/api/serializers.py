@@ -1,3 +1,5 @@
+import io
+
 from django.db import transaction
 from django.db.models import Q
 from django.utils.translation import ugettext_lazy as _
@@ -7,6 +9,8 @@ from swapper import load_model
 from openwisp_users.api.mixins import FilterSerializerByOrgManaged
 from openwisp_utils.api.serializers import ValidatedModelSerializer
 
+from ..importer import DeviceImporter, read_device_rows
+
 Template = load_model('config', 'Template')
 Vpn = load_model('config', 'Vpn')
 Device = load_model('config', 'Device')
@@ -167,6 +171,29 @@ class DeviceListSerializer(FilterSerializerByOrgManaged, serializers.ModelSerial
         return device
 
 
+class DeviceImportSerializer(FilterSerializerByOrgManaged, serializers.Serializer):
+    organization = serializers.PrimaryKeyRelatedField(
+        queryset=Organization.objects.all()
+    )
+    file = serializers.FileField(
+        help_text=_('CSV file or JSON lines file (one JSON object per line)')
+    )
+    format = serializers.ChoiceField(
+        choices=['csv', 'json'],
+        required=False,
+        help_text=_('inferred from the file name if omitted'),
+    )
+
+    def create(self, validated_data):
+        file = validated_data['file']
+        format = validated_data.get('format') or (
+            'csv' if file.name.endswith('.csv') else 'json'
+        )
+        stream = io.TextIOWrapper(file, encoding='utf-8', newline='')
+        importer = DeviceImporter(validated_data['organization'])
+        return importer.run(read_device_rows(stream, format))
+
+
 class DeviceDetailConfigSerializer(BaseConfigSerializer):
     config = serializers.JSONField(
         initial={}, help_text=_('Configuration in NetJSON format')
@@ -33,6 +33,11 @@ def get_api_urls(api_views):
                 name='download_vpn_config',
             ),
             path('controller/device/', api_views.device_list, name='device_list',),
+            path(
+                'controller/device/import/',
+                api_views.device_import,
+                name='device_import',
+            ),
             path(
                 'controller/device/<str:pk>/',
                 api_views.device_detail,
@@ -3,14 +3,16 @@ from django.core.exceptions import ObjectDoesNotExist
 from django.db.models import F, Q
 from django.http import Http404
 from django.urls.base import reverse
-from rest_framework import pagination
+from rest_framework import pagination, status
 from rest_framework.authentication import SessionAuthentication
 from rest_framework.generics import (
+    GenericAPIView,
     ListCreateAPIView,
     RetrieveAPIView,
     RetrieveUpdateDestroyAPIView,
 )
 from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
 from swapper import load_model
 
 from openwisp_users.api.authentication import BearerAuthentication
@@ -21,6 +23,7 @@ from ..admin import BaseConfigAdmin
 from .serializers import (
     DeviceDetailSerializer,
     DeviceGroupSerializer,
+    DeviceImportSerializer,
     DeviceListSerializer,
     TemplateSerializer,
     VpnSerializer,
@@ -103,6 +106,26 @@ class DeviceListCreateView(ProtectedAPIMixin, ListCreateAPIView):
     pagination_class = ListViewPagination
 
 
+class DeviceImportView(ProtectedAPIMixin, GenericAPIView):
+    """
+    Creates devices and their configuration in bulk from a CSV file
+    or a JSON lines file, invalid rows are skipped and reported
+    in the response, eg: `{"created": 2, "errors": [{"row": 3, "errors": {..}}]}`;
+    if no device is created the response has status code 400
+    """
+
+    serializer_class = DeviceImportSerializer
+    queryset = Device.objects.none()
+
+    def post(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        result = serializer.save()
+        if not result['created']:
+            return Response(result, status=status.HTTP_400_BAD_REQUEST)
+        return Response(result, status=status.HTTP_201_CREATED)
+
+
 class DeviceDetailView(ProtectedAPIMixin, RetrieveUpdateDestroyAPIView):
     """
     Templates: Templates flagged as _required_ will be added automatically
@@ -259,6 +282,7 @@ vpn_list = VpnListCreateView.as_view()
 vpn_detail = VpnDetailView.as_view()
 download_vpn_config = DownloadVpnView.as_view()
 device_list = DeviceListCreateView.as_view()
+device_import = DeviceImportView.as_view()
 device_detail = DeviceDetailView.as_view()
 devicegroup_list = DeviceGroupListCreateView.as_view()
 devicegroup_detail = DeviceGroupDetailView.as_view()
@@ -12,8 +12,14 @@ from swapper import get_model_name, load_model
 from openwisp_utils.admin_theme import register_dashboard_chart
 from openwisp_utils.admin_theme.menu import register_menu_group
 
+from ..pki.signals import certs_bulk_updated
 from . import settings as app_settings
-from .signals import config_modified, device_group_changed, device_name_changed
+from .signals import (
+    config_modified,
+    config_modified_bulk,
+    device_group_changed,
+    device_name_changed,
+)
 
 # ensure Device.hardware_id field is not flagged as unique
 # (because it's flagged as unique_together with organization)
@@ -40,6 +46,12 @@ class ConfigConfig(AppConfig):
         self.devicegroup_model = load_model('config', 'DeviceGroup')
         self.config_model = load_model('config', 'Config')
         self.vpnclient_model = load_model('config', 'VpnClient')
+        self.org_config_settings_model = load_model(
+            'config', 'OrganizationConfigSettings'
+        )
+        self.template_model = load_model('config', 'Template')
+        self.templatetag_model = load_model('config', 'TemplateTag')
+        self.org_model = load_model('openwisp_users', 'Organization')
         self.cert_model = load_model('django_x509', 'Cert')
 
     def connect_signals(self):
@@ -49,6 +61,7 @@ class ConfigConfig(AppConfig):
         * enforcement of required templates
         * automatic vpn client management on m2m_changed
         * automatic vpn client removal
+        * recalculation of the stored checksum
         * cache invalidation
         """
         from . import handlers  # noqa
@@ -79,11 +92,21 @@ class ConfigConfig(AppConfig):
             sender=self.vpnclient_model,
             dispatch_uid='vpnclient.post_delete',
         )
+        config_modified.connect(
+            self.config_model.checksum_outdated,
+            sender=self.config_model,
+            dispatch_uid='config.checksum_outdated',
+        )
         post_save.connect(
             self.config_model.certificate_updated,
             sender=self.cert_model,
             dispatch_uid='cert_update_invalidate_checksum_cache',
         )
+        certs_bulk_updated.connect(
+            self.config_model.certificates_bulk_updated,
+            sender=self.cert_model,
+            dispatch_uid='certs_bulk_update_invalidate_checksum_cache',
+        )
 
     def register_menu_groups(self):
         register_menu_group(
@@ -189,8 +212,9 @@ class ConfigConfig(AppConfig):
         Triggers the cache invalidation for the
         device config checksum (view and model method)
         """
-        from .controller.views import DeviceChecksumView
+        from .controller.views import DeviceChecksumView, DeviceRegisterView
         from .handlers import devicegroup_change_handler, devicegroup_delete_handler
+        from .utils import invalidate_organization_polling_interval
 
         post_save.connect(
             DeviceChecksumView.invalidate_get_device_cache,
@@ -201,6 +225,10 @@ class ConfigConfig(AppConfig):
             DeviceChecksumView.invalidate_checksum_cache,
             dispatch_uid='invalidate_checksum_cache',
         )
+        config_modified_bulk.connect(
+            DeviceChecksumView.invalidate_checksum_cache_bulk,
+            dispatch_uid='invalidate_checksum_cache_bulk',
+        )
         device_group_changed.connect(
             devicegroup_change_handler,
             sender=self.device_model,
@@ -226,6 +254,53 @@ class ConfigConfig(AppConfig):
             sender=self.cert_model,
             dispatch_uid='invalidate_devicegroup_cache_on_certificate_delete',
         )
+        post_save.connect(
+            invalidate_organization_polling_interval,
+            sender=self.org_config_settings_model,
+            dispatch_uid='invalidate_organization_polling_interval',
+        )
+        post_delete.connect(
+            invalidate_organization_polling_interval,
+            sender=self.org_config_settings_model,
+            dispatch_uid='invalidate_organization_polling_interval_on_delete',
+        )
+        # the registration cache holds organization
+        # settings and the templates resolved from tags
+        post_save.connect(
+            DeviceRegisterView.invalidate_registration_cache,
+            sender=self.org_config_settings_model,
+            dispatch_uid='invalidate_registration_cache_on_org_config_settings_save',
+        )
+        post_delete.connect(
+            DeviceRegisterView.invalidate_registration_cache,
+            sender=self.org_config_settings_model,
+            dispatch_uid='invalidate_registration_cache_on_org_config_settings_delete',
+        )
+        post_save.connect(
+            DeviceRegisterView.invalidate_registration_cache,
+            sender=self.org_model,
+            dispatch_uid='invalidate_registration_cache_on_organization_save',
+        )
+        post_save.connect(
+            DeviceRegisterView.invalidate_registration_cache,
+            sender=self.template_model,
+            dispatch_uid='invalidate_registration_cache_on_template_save',
+        )
+        post_delete.connect(
+            DeviceRegisterView.invalidate_registration_cache,
+            sender=self.template_model,
+            dispatch_uid='invalidate_registration_cache_on_template_delete',
+        )
+        post_save.connect(
+            DeviceRegisterView.invalidate_registration_cache,
+            sender=self.templatetag_model,
+            dispatch_uid='invalidate_registration_cache_on_templatetag_save',
+        )
+        m2m_changed.connect(
+            DeviceRegisterView.invalidate_registration_cache,
+            sender=self.template_model.tags.through,
+            dispatch_uid='invalidate_registration_cache_on_template_tags_change',
+        )
 
     def register_dashboard_charts(self):
         register_dashboard_chart(
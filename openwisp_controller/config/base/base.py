@@ -2,7 +2,9 @@ import collections
 import hashlib
 import json
 from copy import deepcopy
+from io import BytesIO
 
+from django.core.cache import cache
 from django.core.exceptions import ValidationError
 from django.db import models
 from django.utils.functional import cached_property
@@ -54,6 +56,7 @@ class BaseConfig(BaseModel):
 
     __template__ = False
     __vpn__ = False
+    _RENDER_CACHE_TIMEOUT = 60 * 60 * 24  # 1 day
 
     class Meta:
         abstract = True
@@ -164,6 +167,8 @@ class BaseConfig(BaseModel):
             context.update(self.get_context())
             kwargs['context'] = context
         backend_instance = backend(**kwargs)
+        # the archive containing private keys is not cached
+        self._has_private_keys = self.has_private_keys(context)
         # remove accidentally duplicated files when combining config and templates
         # this may happen if a device uses multiple VPN client templates
         # which share the same Certification Authority, hence the CA
@@ -182,11 +187,43 @@ class BaseConfig(BaseModel):
                 unique_files.append(file)
         backend_instance.config['files'] = unique_files
 
-    def generate(self):
+    def has_private_keys(self, context):
+        """
+        returns ``True`` if the configuration variables in ``context``
+        contain private keys (eg: keys of the certificates of VPN clients),
+        redefined by the models which add private keys to the context
+        """
+        return False
+
+    def get_render_cache_key(self):
         """
-        shortcut for self.backend_instance.generate()
+        returns the cache key of the generated configuration archive,
+        which is derived from the content of the configuration (merged
+        with templates and with configuration variables evaluated),
+        hence objects resulting in the same configuration share the archive;
+        returns ``None`` if the configuration contains private keys
+        (see ``has_private_keys``), which must not be stored
+        in the shared cache
+        """
+        backend_instance = self.backend_instance
+        if self._has_private_keys:
+            return None
+        content = json.dumps([self.backend, backend_instance.config])
+        return f'config_render_{hashlib.sha256(content.encode()).hexdigest()}'
+
+    def generate(self):
         """
-        return self.backend_instance.generate()
+        shortcut for self.backend_instance.generate(),
+        the archive is cached (see ``get_render_cache_key``)
+        """
+        cache_key = self.get_render_cache_key()
+        if cache_key is None:
+            return self.backend_instance.generate()
+        archive = cache.get(cache_key)
+        if archive is None:
+            archive = self.backend_instance.generate().getvalue()
+            cache.set(cache_key, archive, self._RENDER_CACHE_TIMEOUT)
+        return BytesIO(archive)
 
     @property
     def checksum(self):
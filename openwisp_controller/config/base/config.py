@@ -4,6 +4,7 @@ import logging
 from cache_memoize import cache_memoize
 from django.core.exceptions import ObjectDoesNotExist, PermissionDenied, ValidationError
 from django.db import models, transaction
+from django.utils import timezone
 from django.utils.translation import ugettext_lazy as _
 from jsonfield import JSONField
 from model_utils import Choices
@@ -11,8 +12,13 @@ from model_utils.fields import StatusField
 from swapper import get_model_name
 
 from .. import settings as app_settings
-from ..signals import config_modified, config_status_changed
+from ..signals import config_modified, config_modified_bulk, config_status_changed
 from ..sortedm2m.fields import SortedManyToManyField
+from ..tasks import (
+    create_vpn_client_certs,
+    update_config_checksum,
+    update_config_checksums,
+)
 from ..utils import get_default_templates_queryset
 from .base import BaseConfig
 
@@ -80,6 +86,24 @@ class AbstractConfig(BaseConfig):
         load_kwargs={'object_pairs_hook': collections.OrderedDict},
         dump_kwargs={'indent': 4},
     )
+    # filled automatically, allows the controller views
+    # to return the checksum without generating the configuration
+    checksum_db = models.CharField(
+        _('configuration checksum'),
+        max_length=32,
+        blank=True,
+        null=True,
+        editable=False,
+    )
+    checksum_updated = models.DateTimeField(
+        _('checksum updated'), blank=True, null=True, editable=False
+    )
+    # set while the certificates of VPN clients are being
+    # generated in the background (see ``create_vpn_client_certs``),
+    # the configuration must not be sent to the device until then
+    vpn_certs_pending = models.BooleanField(
+        _('VPN certificates pending'), default=False, editable=False
+    )
 
     _CHECKSUM_CACHE_TIMEOUT = 60 * 60 * 24 * 30  # 10 days
 
@@ -134,11 +158,65 @@ class AbstractConfig(BaseConfig):
         """
         Handles caching,
         timeout=None means value is cached indefinitely
-        (invalidation handled on post_save/post_delete signal)
+        (invalidation handled on post_save/post_delete signal);
+        the checksum stored in the database is used if available
+        (see ``update_checksum_db``), otherwise it's calculated;
+        returns ``None`` while the configuration is not ready
+        (see ``vpn_certs_pending``)
         """
+        if self.vpn_certs_pending:
+            return None
+        if self.checksum_db:
+            return self.checksum_db
         logger.debug(f'calculating checksum for config ID {self.pk}')
         return self.checksum
 
+    def update_checksum_db(self):
+        """
+        Recalculates the checksum, stores it in the
+        database and refreshes the checksum cache
+        (called by the ``update_config_checksum`` background task)
+        """
+        if self.vpn_certs_pending:
+            return None
+        self._save_checksum_db(self.checksum)
+        return self.get_cached_checksum(_refresh=True)
+
+    def _save_checksum_db(self, checksum):
+        self.checksum_db = checksum
+        self.checksum_updated = timezone.now()
+        # update() is used to avoid emitting signals
+        self._meta.model.objects.filter(pk=self.pk).update(
+            checksum_db=self.checksum_db, checksum_updated=self.checksum_updated
+        )
+        return checksum
+
+    def _clear_checksum_db(self, save=True):
+        """
+        Flags the stored checksum as outdated, a new one will be
+        calculated in the background (see ``checksum_outdated``)
+        """
+        if not self.checksum_db:
+            return
+        self.checksum_db = None
+        if save:
+            self._meta.model.objects.filter(pk=self.pk).update(checksum_db=None)
+
+    @classmethod
+    def checksum_outdated(cls, instance, **kwargs):
+        """
+        this method is called from a django signal (config_modified)
+        see config.apps.ConfigConfig.connect_signals;
+        schedules the recalculation of the stored checksum
+        """
+        # recalculated once per chunk by update_config_checksums
+        if kwargs.get('action') in [
+            'related_template_changed',
+            'related_certificate_changed',
+        ]:
+            return
+        transaction.on_commit(lambda: update_config_checksum.delay(instance.pk))
+
     @classmethod
     def get_template_model(cls):
         return cls.templates.rel.model
@@ -203,6 +281,8 @@ class AbstractConfig(BaseConfig):
             if instance.status != 'modified':
                 # sends both status modified and config modified signals
                 instance.set_status_modified(send_config_modified_signal=False)
+            else:
+                instance._clear_checksum_db()
 
     @classmethod
     def manage_vpn_clients(cls, action, instance, pk_set, **kwargs):
@@ -233,6 +313,7 @@ class AbstractConfig(BaseConfig):
         if action == 'post_add':
             vpn_list = instance.templates.filter(type='vpn').values_list('vpn')
             instance.vpnclient_set.exclude(vpn__in=vpn_list).delete()
+        deferred_certs = False
         # when adding or removing specific templates
         for template in templates.filter(type='vpn'):
             if action == 'post_add':
@@ -244,10 +325,25 @@ class AbstractConfig(BaseConfig):
                     config=instance, vpn=template.vpn, auto_cert=template.auto_cert
                 )
                 client.full_clean()
+                if client.auto_cert and app_settings.ASYNC_VPN_CLIENT_CERTS:
+                    # skips save(), the certificate is generated in the background
+                    vpn_client_model.objects.bulk_create([client])
+                    deferred_certs = True
+                    continue
                 client.save()
             elif action == 'post_remove':
                 for client in instance.vpnclient_set.filter(vpn=template.vpn):
                     client.delete()
+        if deferred_certs:
+            instance.vpn_certs_pending = True
+            # modified tells retry_pending_vpn_client_certs
+            # when the certificates have been requested
+            instance.modified = timezone.now()
+            cls.objects.filter(pk=instance.pk).update(
+                vpn_certs_pending=True, modified=instance.modified
+            )
+            pk = str(instance.pk)
+            transaction.on_commit(lambda: create_vpn_client_certs.delay([pk]))
 
     @classmethod
     def clean_templates_org(cls, action, instance, pk_set, **kwargs):
@@ -329,6 +425,58 @@ class AbstractConfig(BaseConfig):
         else:
             transaction.on_commit(config.set_status_modified)
 
+    @classmethod
+    def certificates_bulk_updated(cls, instances, **kwargs):
+        """
+        bulk version of ``certificate_updated``, flags the
+        configurations of the VPN clients using the certificates
+        updated by a bulk renewal or revocation as modified
+        """
+        cert_pks = [cert.pk for cert in instances]
+
+        def set_status_modified():
+            configs = list(
+                cls.objects.filter(vpnclient__cert__in=cert_pks)
+                .select_related('device')
+                .prefetch_related('templates')
+            )
+            cls.bulk_set_status_modified(configs, action='related_certificate_changed')
+
+        transaction.on_commit(set_status_modified)
+
+    @classmethod
+    def bulk_set_status_modified(cls, configs, action):
+        """
+        flags ``configs`` as modified with one query;
+        the signal receivers which need to query the database
+        or the cache (checksum invalidation, scheduling of the
+        configuration push) are executed once for all the
+        configs (see ``config_modified_bulk``)
+        """
+        if not configs:
+            return
+        # use atomic to ensure any code bound to
+        # be executed via transaction.on_commit
+        # is executed after the whole block
+        with transaction.atomic():
+            for config in configs:
+                # config modified signal sent regardless
+                config._send_config_modified_signal(action=action)
+                # config status changed signal sent only if status changed
+                if config.status != 'modified':
+                    config._send_config_status_changed_signal()
+                config.status = 'modified'
+                config.checksum_db = None
+            cls.objects.filter(pk__in=[config.pk for config in configs]).update(
+                status='modified', checksum_db=None
+            )
+            config_modified_bulk.send(sender=cls, instances=configs, action=action)
+            # the stored checksums are recalculated by another task,
+            # so that nothing is left to do once this block is committed
+            # (callers may repeat the whole operation if interrupted)
+            pk_list = [str(config.pk) for config in configs]
+            transaction.on_commit(lambda: update_config_checksums.delay(pk_list))
+
     def get_default_templates(self):
         """
         retrieves default templates of a Config object
@@ -363,6 +511,16 @@ class AbstractConfig(BaseConfig):
         # check if config has been modified (so we can emit signals)
         if not created:
             self._check_changes()
+            # the stored checksum is outdated if the configuration
+            # has changed or if the status is being set to modified
+            if self._send_config_modified_after_save or (
+                self._send_config_status_changed and self.status == 'modified'
+            ):
+                self._clear_checksum_db(save=False)
+                if kwargs.get('update_fields'):
+                    kwargs['update_fields'] = list(kwargs['update_fields']) + [
+                        'checksum_db'
+                    ]
         self._just_created = created
         result = super().save(*args, **kwargs)
         # add default templates if config has just been created
@@ -403,6 +561,7 @@ class AbstractConfig(BaseConfig):
         assert action in [
             'config_changed',
             'related_template_changed',
+            'related_certificate_changed',
             'm2m_templates_changed',
         ]
         config_modified.send(
@@ -482,6 +641,10 @@ class AbstractConfig(BaseConfig):
                 )
         return c
 
+    def has_private_keys(self, context):
+        # keys of the certificates of VPN clients (see get_vpn_context)
+        return any(key.startswith('key_contents_') for key in context)
+
     def get_context(self, system=False):
         """
         additional context passed to netjsonconfig
@@ -1,4 +1,6 @@
+from collections import defaultdict
 from hashlib import md5
+from ipaddress import ip_address
 
 from django.core.exceptions import ObjectDoesNotExist, ValidationError
 from django.db import models
@@ -10,7 +12,12 @@ from openwisp_users.mixins import OrgMixin
 from openwisp_utils.base import KeyField
 
 from .. import settings as app_settings
-from ..signals import device_group_changed, device_name_changed, management_ip_changed
+from ..signals import (
+    device_group_changed,
+    device_name_changed,
+    management_ip_changed,
+    management_ip_cleared_bulk,
+)
 from ..validators import device_name_validator, mac_address_validator
 from .base import BaseModel
 
@@ -261,6 +268,72 @@ class AbstractDevice(OrgMixin, BaseModel):
 
         self._initial_management_ip = self.management_ip
 
+    @classmethod
+    def clear_duplicated_ips(cls, devices):
+        """
+        avoids that any other device in the same organization
+        stays with the same management_ip or private last_ip
+        of the specified devices (this can happen when management
+        interfaces are using DHCP and they get an address which was
+        previously used by another device that may now be offline);
+        executes one UPDATE query per organization and field and
+        emits ``management_ip_cleared_bulk`` once for all the devices
+        which had their management_ip cleared (``management_ip_changed``
+        is emitted for each of them only if it has receivers),
+        returns the list of PKs of the devices which have been updated
+        """
+        pk_list = [device.pk for device in devices]
+        duplicated_ips = {
+            'management_ip': defaultdict(set),
+            'last_ip': defaultdict(set),
+        }
+        for device in devices:
+            if device.management_ip:
+                duplicated_ips['management_ip'][device.organization_id].add(
+                    device.management_ip
+                )
+            # last_ip may be a public IP, in that case duplicates are allowed
+            if device.last_ip and ip_address(device.last_ip).is_private:
+                duplicated_ips['last_ip'][device.organization_id].add(device.last_ip)
+        updated = set()
+        management_ip_dupes = []
+        for field, ips_by_org in duplicated_ips.items():
+            for organization_id, ips in ips_by_org.items():
+                queryset = cls.objects.filter(
+                    organization_id=organization_id, **{f'{field}__in': ips}
+                ).exclude(pk__in=pk_list)
+                dupes = list(queryset.only('pk', 'organization', 'key', field))
+                if not dupes:
+                    continue
+                queryset.filter(pk__in=[dupe.pk for dupe in dupes]).update(
+                    **{field: ''}
+                )
+                updated.update(dupe.pk for dupe in dupes)
+                if field == 'management_ip':
+                    management_ip_dupes.extend(dupes)
+        # the signal is sent once, after all the duplicates have been cleared
+        if management_ip_dupes:
+            old_management_ips = [dupe.management_ip for dupe in management_ip_dupes]
+            for dupe in management_ip_dupes:
+                dupe.management_ip = None
+                dupe._initial_management_ip = None
+            management_ip_cleared_bulk.send(
+                sender=cls,
+                instances=management_ip_dupes,
+                old_management_ips=old_management_ips,
+            )
+            if management_ip_changed.has_listeners(cls):
+                for dupe, old_management_ip in zip(
+                    management_ip_dupes, old_management_ips
+                ):
+                    management_ip_changed.send(
+                        sender=cls,
+                        management_ip=None,
+                        old_management_ip=old_management_ip,
+                        instance=dupe,
+                    )
+        return list(updated)
+
     @property
     def backend(self):
         """
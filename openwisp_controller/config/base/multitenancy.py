@@ -25,6 +25,15 @@ class AbstractOrganizationConfigSettings(UUIDModel):
         verbose_name=_('shared secret'),
         help_text=_('used for automatic registration of devices'),
     )
+    polling_interval = models.PositiveIntegerField(
+        _('polling interval'),
+        null=True,
+        blank=True,
+        help_text=_(
+            'interval (in seconds) suggested to devices for checking '
+            'configuration changes, overrides the global default'
+        ),
+    )
 
     class Meta:
         verbose_name = _('Configuration management settings')
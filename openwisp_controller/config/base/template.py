@@ -1,7 +1,9 @@
 import json
 from collections import OrderedDict
 from copy import copy
+from uuid import uuid4
 
+from django.core.cache import cache
 from django.core.exceptions import ValidationError
 from django.db import models, transaction
 from django.utils.translation import ugettext_lazy as _
@@ -10,8 +12,11 @@ from swapper import get_model_name
 from taggit.managers import TaggableManager
 
 from ...base import ShareableOrgMixinUniqueName
-from ..settings import DEFAULT_AUTO_CERT
-from ..tasks import update_template_related_config_status
+from ..settings import DEFAULT_AUTO_CERT, RELATED_CONFIG_CHUNK_SIZE
+from ..tasks import (
+    update_template_related_config_status,
+    update_template_related_config_status_chunk,
+)
 from .base import BaseConfig
 
 TYPE_CHOICES = (('generic', _('Generic')), ('vpn', _('VPN-client')))
@@ -98,6 +103,10 @@ class AbstractTemplate(ShareableOrgMixinUniqueName, BaseConfig):
         dump_kwargs={'indent': 4},
     )
     __template__ = True
+    # number of related configs processed by each
+    # update_template_related_config_status_chunk task
+    related_config_chunk_size = RELATED_CONFIG_CHUNK_SIZE
+    _RELATED_CONFIG_JOB_TIMEOUT = 60 * 60 * 24  # 24 hours
 
     class Meta:
         abstract = True
@@ -128,22 +137,79 @@ class AbstractTemplate(ShareableOrgMixinUniqueName, BaseConfig):
             )
 
     def _update_related_config_status(self):
-        # use atomic to ensure any code bound to
-        # be executed via transaction.on_commit
-        # is executed after the whole block
-        with transaction.atomic():
-            changing_status = list(
-                self.config_relations.exclude(status='modified').values_list(
-                    'pk', flat=True
-                )
+        """
+        splits the related configs in chunks which are processed
+        in parallel by ``update_template_related_config_status_chunk``,
+        the progress can be retrieved with ``get_related_config_progress``
+        """
+        pk_list = [
+            str(pk)
+            for pk in self.config_relations.order_by('pk').values_list('pk', flat=True)
+        ]
+        job_id = uuid4().hex
+        # a new job supersedes the chunks of the previous one which
+        # are still pending, because it processes all the related configs
+        cache_key = self._get_related_config_job_cache_key()
+        cache.set_many(
+            {
+                cache_key: {'id': job_id, 'total': len(pk_list)},
+                f'{cache_key}_done': 0,
+            },
+            timeout=self._RELATED_CONFIG_JOB_TIMEOUT,
+        )
+        size = self.related_config_chunk_size
+        for start in range(0, len(pk_list), size):
+            end = start + size
+            update_template_related_config_status_chunk.delay(
+                self.pk, pk_list[start:end], job_id
             )
-            for config in self.config_relations.select_related('device').iterator():
-                # config modified signal sent regardless
-                config._send_config_modified_signal(action='related_template_changed')
-                # config status changed signal sent only if status changed
-                if config.pk in changing_status:
-                    config._send_config_status_changed_signal()
-            self.config_relations.exclude(status='modified').update(status='modified')
+
+    def _update_related_config_status_chunk(self, pk_list):
+        """
+        flags the specified related configs as modified;
+        the status update and the signal receivers which need to
+        query the database or the cache (checksum invalidation,
+        scheduling of the configuration push) are executed once
+        per chunk (see ``config_modified_bulk``)
+        """
+        Config = self.config_relations.model
+        configs = list(
+            self.config_relations.filter(pk__in=pk_list)
+            .select_related('device')
+            .prefetch_related('templates')
+        )
+        Config.bulk_set_status_modified(configs, action='related_template_changed')
+
+    def _get_related_config_job_cache_key(self):
+        return f'template_related_config_job_{self.pk}'
+
+    def _is_related_config_job_current(self, job_id):
+        job = cache.get(self._get_related_config_job_cache_key())
+        # if the job information has been evicted from
+        # the cache the chunk is processed anyway
+        return job is None or job['id'] == job_id
+
+    def _update_related_config_progress(self, job_id, count):
+        if not self._is_related_config_job_current(job_id):
+            return
+        try:
+            cache.incr(f'{self._get_related_config_job_cache_key()}_done', count)
+        except ValueError:
+            # job information evicted from the cache
+            pass
+
+    def get_related_config_progress(self):
+        """
+        returns the progress of the last update of the status of
+        the related configs, eg: ``{'id': <job id>, 'total': 10, 'done': 5}``;
+        returns ``None`` if the information is not available
+        """
+        cache_key = self._get_related_config_job_cache_key()
+        job = cache.get(cache_key)
+        if not job:
+            return None
+        done = cache.get(f'{cache_key}_done', 0)
+        return {'id': job['id'], 'total': job['total'], 'done': min(done, job['total'])}
 
     def clean(self, *args, **kwargs):
         """
@@ -1,18 +1,21 @@
 import collections
+import os
 import subprocess
+from concurrent.futures import ThreadPoolExecutor
 
 import shortuuid
+from django.core.cache import cache
 from django.core.exceptions import ObjectDoesNotExist, ValidationError
 from django.db import models, transaction
 from django.utils.text import slugify
 from django.utils.translation import ugettext_lazy as _
-from swapper import get_model_name
+from swapper import get_model_name, load_model
 
-from openwisp_utils.base import KeyField
+from openwisp_utils.base import KeyField, TimeStampedEditableModel
 
 from ...base import ShareableOrgMixinUniqueName
 from .. import settings as app_settings
-from ..tasks import create_vpn_dh
+from ..tasks import create_vpn_dh, refill_dh_pool
 from .base import BaseConfig
 
 
@@ -61,6 +64,9 @@ class AbstractVpn(ShareableOrgMixinUniqueName, BaseConfig):
         'BbOcwKkB+eBE/B9jqmbG5YYhDo9fQGmNEwIBAg==\n'
         '-----END DH PARAMETERS-----\n'
     )
+    # length of the generated DH parameters
+    dh_length = 2048
+    _CHECKSUM_CACHE_TIMEOUT = 60 * 60 * 24  # 1 day
 
     __vpn__ = True
 
@@ -89,12 +95,26 @@ class AbstractVpn(ShareableOrgMixinUniqueName, BaseConfig):
         if not self.cert:
             self.cert = self._auto_create_cert()
         if not self.dh:
-            self.dh = self._placeholder_dh
+            self.dh = self._get_pooled_dh() or self._placeholder_dh
         is_adding = self._state.adding
         super().save(*args, **kwargs)
         if is_adding and self.dh == self._placeholder_dh:
             transaction.on_commit(lambda: create_vpn_dh.delay(self.id))
 
+    def _get_pooled_dh(self):
+        """
+        Takes a set of pre-generated DH parameters from the pool,
+        returns ``None`` if the pool is disabled or empty;
+        the pool is refilled in the background in both cases
+        (it's empty, eg, right after the installation)
+        """
+        if not app_settings.DH_POOL_SIZE:
+            return None
+        DhParameters = load_model('config', 'DhParameters')
+        dh = DhParameters.consume(self.dh_length)
+        transaction.on_commit(refill_dh_pool.delay)
+        return dh
+
     @classmethod
     def dhparam(cls, length):
         """
@@ -148,6 +168,32 @@ class AbstractVpn(ShareableOrgMixinUniqueName, BaseConfig):
     def get_system_context(self):
         return self.get_context()
 
+    def has_private_keys(self, context):
+        # key of the certificate of the VPN server
+        return 'key' in context
+
+    def get_cached_checksum(self):
+        """
+        returns the checksum of the configuration, which is cached
+        until the VPN server, its certificate or its CA are modified
+        (see ``_get_checksum_cache_key``)
+        """
+        cache_key = self._get_checksum_cache_key()
+        checksum = cache.get(cache_key)
+        if checksum is None:
+            checksum = self.checksum
+            cache.set(cache_key, checksum, self._CHECKSUM_CACHE_TIMEOUT)
+        return checksum
+
+    def _get_checksum_cache_key(self):
+        # the modification dates are part of the key,
+        # hence no invalidation is needed
+        dates = [self.modified, self.ca.modified]
+        if self.cert:
+            dates.append(self.cert.modified)
+        version = '-'.join(str(date.timestamp()) for date in dates)
+        return f'vpn_checksum_{self.pk.hex}_{version}'
+
     def _get_auto_context_keys(self):
         """
         returns a dictionary which indicates the names of
@@ -258,7 +304,8 @@ class AbstractVpnClient(models.Model):
         automatically deletes certificates when ``auto_cert`` is ``True``
         """
         instance = kwargs['instance']
-        if instance.auto_cert:
+        # the certificate may not have been generated yet
+        if instance.auto_cert and instance.cert_id:
             instance.cert.delete()
 
     def _auto_create_cert_extra(self, cert):
@@ -272,6 +319,15 @@ class AbstractVpnClient(models.Model):
         """
         Automatically creates and assigns a client x509 certificate
         """
+        cert = self._get_auto_cert(name, common_name)
+        cert.save()
+        self.cert = cert
+        return cert
+
+    def _get_auto_cert(self, name, common_name):
+        """
+        Returns a new (unsaved) client x509 certificate
+        """
         server_extensions = [
             {'name': 'nsCertType', 'value': 'client', 'critical': False}
         ]
@@ -292,6 +348,93 @@ class AbstractVpnClient(models.Model):
         )
         cert = self._auto_create_cert_extra(cert)
         cert.full_clean()
-        cert.save()
-        self.cert = cert
         return cert
+
+    @classmethod
+    def bulk_create_certs(cls, clients):
+        """
+        Creates the certificates of ``clients`` in bulk: the keys are
+        generated in parallel (OpenSSL releases the GIL while generating
+        keys) and the certificates are inserted with one query
+        """
+        if not clients:
+            return
+        cert_model = cls.cert.field.related_model
+        cas = {}
+        certs = []
+        for client in clients:
+            cert = client._get_auto_cert(
+                name=client.config.device.name, common_name=client._get_common_name()
+            )
+            cert.serial_number = cert._generate_serial_number()
+            # the keys of each CA are loaded only once
+            cert.ca = cas.setdefault(cert.ca_id, cert.ca)
+            certs.append(cert)
+        for ca in cas.values():
+            ca.load_keys()
+        workers = min(len(certs), os.cpu_count() or 1)
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            list(executor.map(lambda cert: cert._generate(), certs))
+        with transaction.atomic():
+            cert_model.objects.bulk_create(certs)
+            # primary keys are not returned by bulk_create on every database
+            cert_pks = dict(
+                cert_model.objects.filter(
+                    serial_number__in=[str(cert.serial_number) for cert in certs]
+                ).values_list('serial_number', 'pk')
+            )
+            for client, cert in zip(clients, certs):
+                client.cert_id = cert_pks[str(cert.serial_number)]
+            cls.objects.bulk_update(clients, ['cert'])
+
+
+class AbstractDhParameters(TimeStampedEditableModel):
+    """
+    Pool of pre-generated DH parameters, used to avoid
+    waiting for the generation when VPN servers are created
+    (each set of parameters is handed out to one VPN server only)
+    """
+
+    length = models.PositiveIntegerField(db_index=True)
+    dh = models.TextField()
+
+    class Meta:
+        verbose_name = _('DH parameters')
+        verbose_name_plural = _('DH parameters')
+        ordering = ('created',)
+        abstract = True
+
+    def __str__(self):
+        return f'{self.length} bit DH parameters'
+
+    @classmethod
+    def consume(cls, length):
+        """
+        Removes the oldest set of parameters of the specified length
+        from the pool and returns it, ``None`` if the pool is empty
+        """
+        queryset = cls.objects.filter(length=length).only('pk', 'dh')
+        while True:
+            instance = queryset.first()
+            if instance is None:
+                return None
+            # if the deletion fails, another process has taken this set
+            if cls.objects.filter(pk=instance.pk).delete()[0]:
+                return instance.dh
+
+    @classmethod
+    def refill(cls, length, size):
+        """
+        Generates the sets of parameters missing to reach ``size``
+        (each set is generated in parallel by a different openssl
+        process), returns the number of sets generated
+        """
+        missing = size - cls.objects.filter(length=length).count()
+        if missing < 1:
+            return 0
+        Vpn = load_model('config', 'Vpn')
+        workers = min(missing, os.cpu_count() or 1)
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            dh_list = list(executor.map(Vpn.dhparam, [length] * missing))
+        cls.objects.bulk_create([cls(length=length, dh=dh) for dh in dh_list])
+        return missing
@@ -1,13 +1,15 @@
 import json
 import logging
 import uuid
-from ipaddress import ip_address
+from functools import lru_cache
 
 from cache_memoize import cache_memoize
+from channels.db import database_sync_to_async
 from django.core.cache import cache
 from django.core.exceptions import FieldDoesNotExist, ValidationError
 from django.db import transaction
 from django.db.models import Q
+from django.http import Http404
 from django.utils.decorators import method_decorator
 from django.views.decorators.csrf import csrf_exempt
 from django.views.generic.base import View
@@ -18,17 +20,22 @@ from .. import settings as app_settings
 from ..signals import checksum_requested, config_download_requested, device_registered
 from ..utils import (
     ControllerResponse,
+    defer_last_ip_update,
     forbid_unallowed,
+    get_not_modified_response,
     get_object_or_404,
+    get_retry_response,
     invalid_response,
     send_device_config,
     send_vpn_config,
+    set_polling_interval_header,
     update_last_ip,
 )
 
 Device = load_model('config', 'Device')
 Config = load_model('config', 'Config')
 OrganizationConfigSettings = load_model('config', 'OrganizationConfigSettings')
+Template = load_model('config', 'Template')
 Vpn = load_model('config', 'Vpn')
 
 logger = logging.getLogger(__name__)
@@ -72,40 +79,26 @@ class CsrfExtemptMixin(object):
 class UpdateLastIpMixin(object):
     def update_last_ip(self, device, request):
         result = update_last_ip(device, request)
-        if result:
-            self._remove_duplicated_management_ip(device)
-            self._remove_duplicated_last_ip(device)
+        # with IP_WRITE_BEHIND duplicates are cleared
+        # when the buffered IP addresses are flushed
+        if result and not app_settings.IP_WRITE_BEHIND:
+            self._remove_duplicated_ips(device)
         return result
 
-    def _remove_duplicated_management_ip(self, device):
+    def _remove_duplicated_ips(self, device):
         # avoid that any other device in the
         # same org stays with the same management_ip
         # This can happen when management interfaces are using DHCP
         # and they get a new address which was previously used by another
         # device that may now be offline, without this fix, we will end up
         # with two devices having the same management_ip, which will
-        # cause OpenWISP to be confused
-        if not device.management_ip:
-            return
-        queryset = self.model.objects.filter(
-            organization_id=device.organization_id, management_ip=device.management_ip
-        ).exclude(pk=device.pk)
-        for dupe in queryset.only('pk', 'key', 'management_ip'):
-            dupe.management_ip = ''
-            dupe.save(update_fields=['management_ip'])
-
-    def _remove_duplicated_last_ip(self, device):
-        # in the case of last_ip, we take a different approach,
-        # because it may be a public IP. If it's a public IP we will
-        # allow it to be duplicated
-        if not device.last_ip or not ip_address(device.last_ip).is_private:
-            return
-        queryset = Device.objects.filter(
-            organization_id=device.organization_id, last_ip=device.last_ip
-        ).exclude(pk=device.pk)
-        for dupe in queryset.only('pk', 'key', 'last_ip', 'management_ip'):
-            dupe.last_ip = ''
-            dupe.save(update_fields=['last_ip'])
+        # cause OpenWISP to be confused (the same is done for last_ip,
+        # but only if it's a private IP, see Device.clear_duplicated_ips)
+        updated = self.model.clear_duplicated_ips([device])
+        # the duplicates are updated without calling save(), hence
+        # the cache of the devices must be invalidated explicitly
+        if updated:
+            DeviceChecksumView.invalidate_get_device_cache_bulk(updated)
 
 
 def get_device_args_rewrite(view):
@@ -127,7 +120,16 @@ class DeviceChecksumView(UpdateLastIpMixin, GetDeviceView):
     returns device's configuration checksum
     """
 
+    # must be incremented when the format of the tuple stored
+    # by update_fast_path_cache changes, so that entries stored
+    # by previous versions are ignored
+    _FAST_PATH_CACHE_VERSION = 2
+
     def get(self, request, pk):
+        if app_settings.CHECKSUM_FAST_PATH:
+            response = self.get_fast_path_response(request)
+            if response:
+                return response
         device = self.get_device()
         bad_request = forbid_unallowed(request, 'GET', 'key', device.key)
         if bad_request:
@@ -139,10 +141,63 @@ class DeviceChecksumView(UpdateLastIpMixin, GetDeviceView):
         checksum_requested.send(
             sender=device.__class__, instance=device, request=request
         )
-        return ControllerResponse(
-            device.config.get_cached_checksum(), content_type='text/plain'
+        checksum = device.config.get_cached_checksum()
+        if checksum is None:
+            return set_polling_interval_header(
+                get_retry_response(), device.organization_id
+            )
+        if app_settings.CHECKSUM_FAST_PATH:
+            self.update_fast_path_cache(device, checksum)
+        response = ControllerResponse(checksum, content_type='text/plain')
+        return set_polling_interval_header(response, device.organization_id)
+
+    def get_fast_path_response(self, request):
+        """
+        returns the checksum by using only the compact tuple stored
+        in the cache by ``update_fast_path_cache``; returns ``None``
+        (hence the regular code path is executed) if the tuple is not
+        cached, if the key is not correct or if the IP addresses changed
+        """
+        entry = cache.get(self._get_fast_path_cache_key())
+        if entry is None:
+            return None
+        (
+            key,
+            last_ip,
+            management_ip,
+            checksum,
+            organization_id,
+            organization_is_active,
+        ) = entry
+        if not organization_is_active:
+            raise Http404()
+        if (
+            request.GET.get('key') != key
+            or request.META.get('REMOTE_ADDR') != last_ip
+            or request.GET.get('management_ip') != management_ip
+        ):
+            return None
+        response = ControllerResponse(checksum, content_type='text/plain')
+        return set_polling_interval_header(response, organization_id)
+
+    def update_fast_path_cache(self, device, checksum):
+        cache.set(
+            self._get_fast_path_cache_key(),
+            (
+                device.key,
+                device.last_ip,
+                device.management_ip,
+                checksum,
+                device.organization_id,
+                device.organization.is_active,
+            ),
+            Config._CHECKSUM_CACHE_TIMEOUT,
         )
 
+    def _get_fast_path_cache_key(self):
+        version = self._FAST_PATH_CACHE_VERSION
+        return f'device_checksum_fast_path_v{version}_{get_device_args_rewrite(self)}'
+
     @cache_memoize(
         timeout=Config._CHECKSUM_CACHE_TIMEOUT, args_rewrite=get_device_args_rewrite
     )
@@ -159,10 +214,8 @@ class DeviceChecksumView(UpdateLastIpMixin, GetDeviceView):
         """
         Called from signal receiver which performs cache invalidation
         """
-        view = cls()
         pk = str(instance.pk.hex)
-        view.kwargs = {'pk': pk}
-        view.get_device.invalidate(view)
+        cache.delete_many(cls._get_device_cache_keys([instance.pk]))
         logger.debug(f'invalidated view cache for device ID {pk}')
 
     @classmethod
@@ -170,7 +223,47 @@ class DeviceChecksumView(UpdateLastIpMixin, GetDeviceView):
         """
         Called from signal receiver which performs cache invalidation
         """
-        instance.get_cached_checksum.invalidate(instance)
+        # handled once per chunk by invalidate_checksum_cache_bulk
+        if kwargs.get('action') in [
+            'related_template_changed',
+            'related_certificate_changed',
+        ]:
+            return
+        # the cached device holds the outdated checksum of its config
+        keys = cls._get_device_cache_keys([device.pk])
+        keys.append(instance.get_cached_checksum.get_cache_key(instance))
+        cache.delete_many(keys)
+        logger.debug(f'invalidated view cache for device ID {device.pk.hex}')
+
+    @classmethod
+    def invalidate_checksum_cache_bulk(cls, instances, **kwargs):
+        """
+        Called from signal receiver (config_modified_bulk),
+        invalidates the cache of many configs with one operation
+        """
+        keys = cls._get_device_cache_keys([config.device_id for config in instances])
+        for config in instances:
+            keys.append(config.get_cached_checksum.get_cache_key(config))
+        cache.delete_many(keys)
+        logger.debug(f'invalidated checksum cache of {len(instances)} configs')
+
+    @classmethod
+    def invalidate_get_device_cache_bulk(cls, pk_list):
+        """
+        invalidates the view cache of many devices with one operation
+        """
+        cache.delete_many(cls._get_device_cache_keys(pk_list))
+        logger.debug(f'invalidated view cache of {len(pk_list)} devices')
+
+    @classmethod
+    def _get_device_cache_keys(cls, pk_list):
+        view = cls()
+        keys = []
+        for pk in pk_list:
+            view.kwargs = {'pk': str(pk.hex)}
+            keys.append(view.get_device.get_cache_key(view))
+            keys.append(view._get_fast_path_cache_key())
+        return keys
 
 
 class DeviceDownloadConfigView(GetDeviceView):
@@ -186,7 +279,21 @@ class DeviceDownloadConfigView(GetDeviceView):
         config_download_requested.send(
             sender=device.__class__, instance=device, request=request
         )
-        return send_device_config(device.config, request)
+        # the configuration is held back until it's ready
+        if device.config.get_cached_checksum() is None:
+            return set_polling_interval_header(
+                get_retry_response(), device.organization_id
+            )
+        # the device already has the latest configuration
+        not_modified = get_not_modified_response(
+            request, device.config.get_cached_checksum
+        )
+        if not_modified:
+            update_last_ip(device, request)
+            response = not_modified
+        else:
+            response = send_device_config(device.config, request)
+        return set_polling_interval_header(response, device.organization_id)
 
 
 class DeviceUpdateInfoView(CsrfExtemptMixin, GetDeviceView):
@@ -252,6 +359,55 @@ class DeviceReportStatusView(CsrfExtemptMixin, GetDeviceView):
         )
 
 
+_REGISTRATION_CACHE_TIMEOUT = 60 * 60 * 24
+_REGISTRATION_CACHE_VERSION_KEY = 'controller_registration_cache_version'
+
+
+def get_registration_cache_version():
+    """
+    returns the token which identifies the current version of the
+    registration cache, a random value is used in order to avoid
+    reusing stale entries of the in-process cache if the
+    token is evicted from the shared cache
+    """
+    version = cache.get(_REGISTRATION_CACHE_VERSION_KEY)
+    if version is None:
+        version = uuid.uuid4().hex
+        if not cache.add(_REGISTRATION_CACHE_VERSION_KEY, version, timeout=None):
+            version = cache.get(_REGISTRATION_CACHE_VERSION_KEY, version)
+    return version
+
+
+@lru_cache(maxsize=1024)
+@cache_memoize(timeout=_REGISTRATION_CACHE_TIMEOUT)
+def get_org_config_settings(version, shared_secret):
+    """
+    returns the settings of the active organization which
+    uses ``shared_secret``, the result is cached both in the shared
+    cache and in memory, the cached instance must not be modified;
+    raises ``DoesNotExist`` if not found: misses are not cached,
+    otherwise any client could fill the caches with random secrets
+    """
+    return OrganizationConfigSettings.objects.select_related('organization').get(
+        shared_secret=shared_secret, organization__is_active=True
+    )
+
+
+@lru_cache(maxsize=1024)
+@cache_memoize(timeout=_REGISTRATION_CACHE_TIMEOUT)
+def get_tagged_template_pks(version, organization_id, tags):
+    """
+    returns the primary keys of the templates of the organization
+    and of shared templates which have at least one of the tags,
+    the result is cached both in the shared cache and in memory
+    """
+    queryset = Template.objects.filter(
+        Q(organization_id=organization_id) | Q(organization=None),
+        tags__name__in=tags,
+    )
+    return tuple(queryset.values_list('pk', flat=True).distinct())
+
+
 class DeviceRegisterView(UpdateLastIpMixin, CsrfExtemptMixin, View):
     """
     registers new Config objects
@@ -306,12 +462,31 @@ class DeviceRegisterView(UpdateLastIpMixin, CsrfExtemptMixin, View):
         if not tags:
             return
         # retrieve tags and add them to current config
-        tags = tags.split()
-        queryset = self.get_template_queryset(config)
-        tagged_templates = queryset.filter(tags__name__in=tags).only('id').distinct()
+        tagged_templates = self.get_tagged_templates(config, tags.split())
         if tagged_templates:
             config.templates.add(*tagged_templates)
 
+    def get_tagged_templates(self, config, tags):
+        """
+        returns the primary keys of the templates returned by
+        ``get_template_queryset`` which have at least one of the
+        specified tags; the result is cached unless
+        ``get_template_queryset`` is redefined, because the
+        templates returned by a custom queryset may depend on ``config``
+        """
+        if type(self).get_template_queryset is not (
+            DeviceRegisterView.get_template_queryset
+        ):
+            queryset = self.get_template_queryset(config)
+            return tuple(
+                queryset.filter(tags__name__in=tags)
+                .values_list('pk', flat=True)
+                .distinct()
+            )
+        return get_tagged_template_pks(
+            self.cache_version, self.organization.pk, tuple(sorted(set(tags)))
+        )
+
     def invalid(self, request):
         """
         ensures request is well formed
@@ -335,11 +510,11 @@ class DeviceRegisterView(UpdateLastIpMixin, CsrfExtemptMixin, View):
             - secret matches an organization's shared_secret
             - the organization has registration_enabled set to True
         """
+        self.cache_version = get_registration_cache_version()
         try:
-            secret = request.POST.get('secret')
-            org_settings = self.org_config_settings_model.objects.select_related(
-                'organization'
-            ).get(shared_secret=secret, organization__is_active=True)
+            org_settings = get_org_config_settings(
+                self.cache_version, request.POST.get('secret')
+            )
         except self.org_config_settings_model.DoesNotExist:
             return invalid_response(request, 'error: unrecognized secret', status=403)
         if not org_settings.registration_enabled:
@@ -370,7 +545,16 @@ class DeviceRegisterView(UpdateLastIpMixin, CsrfExtemptMixin, View):
         # (key is not None only if CONSISTENT_REGISTRATION is enabled)
         new = False
         try:
-            device = self.model.objects.get(key=key)
+            device = self.model.objects.select_related('config').get(key=key)
+            # devices which register again without any change (eg: reboot
+            # storms after a power outage) do not need to be validated
+            if hasattr(device, 'config') and self.is_unchanged(
+                device, device.config, request
+            ):
+                device_registered.send(
+                    sender=device.__class__, instance=device, is_new=False
+                )
+                return self.get_success_response(device, new=False)
             # update hw info
             for attr in self.UPDATABLE_FIELDS:
                 if attr in request.POST:
@@ -412,7 +596,33 @@ class DeviceRegisterView(UpdateLastIpMixin, CsrfExtemptMixin, View):
         self.add_tagged_templates(config, request)
         # emit device registered signal
         device_registered.send(sender=device.__class__, instance=device, is_new=new)
-        # prepare response
+        return self.get_success_response(device, new)
+
+    def is_unchanged(self, device, config, request):
+        """
+        returns ``True`` if an existing device registers again
+        without changes which would need to be validated and saved
+        """
+        if (
+            device.organization_id != self.organization.pk
+            or device.last_ip != request.META.get('REMOTE_ADDR')
+        ):
+            return False
+        for attr in self.UPDATABLE_FIELDS:
+            if attr in request.POST and getattr(device, attr) != request.POST[attr]:
+                return False
+        tags = request.POST.get('tags')
+        if tags:
+            tagged_templates = self.get_tagged_templates(config, tags.split())
+            current_templates = config.templates.values_list('pk', flat=True)
+            if set(tagged_templates) - set(current_templates):
+                return False
+        return True
+
+    def get_success_response(self, device, new):
+        """
+        prepares the response sent when registration succeeds
+        """
         s = (
             'registration-result: success\n'
             'uuid: {id}\n'
@@ -426,6 +636,15 @@ class DeviceRegisterView(UpdateLastIpMixin, CsrfExtemptMixin, View):
             s.format(**attributes), content_type='text/plain', status=201
         )
 
+    @classmethod
+    def invalidate_registration_cache(cls, **kwargs):
+        """
+        Called from signal receiver which performs cache invalidation,
+        changing the version invalidates the entries of all the processes
+        """
+        cache.set(_REGISTRATION_CACHE_VERSION_KEY, uuid.uuid4().hex, timeout=None)
+        logger.debug('invalidated registration cache')
+
 
 class GetVpnView(SingleObjectMixin, View):
     """
@@ -436,9 +655,9 @@ class GetVpnView(SingleObjectMixin, View):
     model = Vpn
 
     def get_object(self, *args, **kwargs):
-        queryset = self.model.objects.select_related('organization').filter(
-            Q(organization__is_active=True) | Q(organization__isnull=True)
-        )
+        queryset = self.model.objects.select_related(
+            'organization', 'ca', 'cert'
+        ).filter(Q(organization__is_active=True) | Q(organization__isnull=True))
         return get_object_or_404(queryset, *args, **kwargs)
 
 
@@ -453,7 +672,7 @@ class VpnChecksumView(GetVpnView):
         if bad_request:
             return bad_request
         checksum_requested.send(sender=vpn.__class__, instance=vpn, request=request)
-        return ControllerResponse(vpn.checksum, content_type='text/plain')
+        return ControllerResponse(vpn.get_cached_checksum(), content_type='text/plain')
 
 
 class VpnDownloadConfigView(GetVpnView):
@@ -469,6 +688,10 @@ class VpnDownloadConfigView(GetVpnView):
         config_download_requested.send(
             sender=vpn.__class__, instance=vpn, request=request
         )
+        # the VPN server already has the latest configuration
+        not_modified = get_not_modified_response(request, vpn.get_cached_checksum)
+        if not_modified:
+            return not_modified
         return send_vpn_config(vpn, request)
 
 
@@ -479,3 +702,31 @@ device_report_status = DeviceReportStatusView.as_view()
 device_register = DeviceRegisterView.as_view()
 vpn_checksum = VpnChecksumView.as_view()
 vpn_download_config = VpnDownloadConfigView.as_view()
+
+
+class DeviceChecksumDeferredView(DeviceChecksumView):
+    """
+    variant of ``DeviceChecksumView`` which updates the IP
+    addresses of the device in the background
+    (used by ``device_checksum_async``)
+    """
+
+    def update_last_ip(self, device, request):
+        return defer_last_ip_update(device, request)
+
+
+device_checksum_deferred = DeviceChecksumDeferredView.as_view()
+
+
+async def device_checksum_async(request, pk):
+    """
+    asynchronous variant of ``device_checksum`` (requires ASGI);
+    Django does not provide asynchronous database and cache APIs yet,
+    hence the view is executed in a thread pool, which allows to process
+    many requests concurrently (synchronous views served by ASGI are
+    executed one at a time in the same thread), while the IP addresses
+    of the device are written in the background
+    """
+    return await database_sync_to_async(
+        device_checksum_deferred, thread_sensitive=False
+    )(request, pk=pk)
@@ -0,0 +1,354 @@
+import csv
+import json
+import logging
+
+from django.core.exceptions import ObjectDoesNotExist, ValidationError
+from django.db import transaction
+from django.db.models import Q
+from django.db.models.functions import Lower
+from swapper import load_model
+
+from openwisp_utils.base import KeyField
+
+from . import settings as app_settings
+from .signals import devices_imported
+from .tasks import create_vpn_client_certs
+from .utils import get_default_templates_queryset
+
+logger = logging.getLogger(__name__)
+
+Config = load_model('config', 'Config')
+Device = load_model('config', 'Device')
+Template = load_model('config', 'Template')
+VpnClient = load_model('config', 'VpnClient')
+
+
+def read_device_rows(stream, format):
+    """
+    reads device rows from a text stream one at a time, supported formats:
+        - ``csv``: the first line contains the column names
+        - ``json``: one JSON object per line (JSON lines)
+    yields tuples containing the row number and the row, which is
+    replaced by a ``ValidationError`` instance if it cannot be parsed
+    """
+    if format == 'csv':
+        for row_number, row in enumerate(csv.DictReader(stream), 1):
+            yield row_number, row
+        return
+    for row_number, line in enumerate(stream, 1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError as e:
+            yield row_number, ValidationError(f'invalid JSON: {e}')
+            continue
+        if not isinstance(row, dict):
+            row = ValidationError('each line must contain a JSON object')
+        yield row_number, row
+
+
+class DeviceImporter(object):
+    """
+    Creates devices and their configuration in bulk
+    (used to pre-provision devices before their deployment).
+
+    Rows are validated and created in batches: instead of running
+    one query per row, uniqueness is checked once per batch, devices,
+    configs, template relations and VPN clients are created with
+    ``bulk_create`` and the certificates of the VPN clients are
+    generated by celery workers in parallel.
+
+    Invalid rows are skipped and reported in the returned errors.
+
+    ``post_save`` and ``m2m_changed`` signals are not emitted,
+    ``devices_imported`` is emitted once per batch instead.
+    """
+
+    device_fields = [
+        'name',
+        'mac_address',
+        'hardware_id',
+        'key',
+        'model',
+        'os',
+        'system',
+        'notes',
+    ]
+    # number of configurations processed by each
+    # ``create_vpn_client_certs`` background task
+    cert_chunk_size = 100
+
+    def __init__(self, organization, batch_size=None):
+        self.organization = organization
+        self.batch_size = batch_size or app_settings.DEVICE_IMPORT_BATCH_SIZE
+        self.created = 0
+        self.errors = []
+        # values which must be unique in the whole import
+        self._names = set()
+        self._mac_addresses = set()
+        self._hardware_ids = set()
+        self._keys = set()
+        # combinations of config and templates already validated
+        self._validated = set()
+        self._templates = None
+        self._default_templates = {}
+        try:
+            self._shared_secret = organization.config_settings.shared_secret
+        except ObjectDoesNotExist:
+            self._shared_secret = None
+
+    def run(self, rows):
+        """
+        ``rows`` must be an iterable of tuples containing
+        the row number and the row, eg: ``read_device_rows``
+        returns a dictionary which summarizes the result
+        """
+        batch = []
+        for row_number, row in rows:
+            batch.append((row_number, row))
+            if len(batch) >= self.batch_size:
+                self._import_batch(batch)
+                batch = []
+        if batch:
+            self._import_batch(batch)
+        self.errors.sort(key=lambda error: error['row'])
+        return {'created': self.created, 'errors': self.errors}
+
+    def _add_error(self, row_number, error):
+        if isinstance(error, ValidationError):
+            error = getattr(error, 'message_dict', None) or {'__all__': error.messages}
+        self.errors.append({'row': row_number, 'errors': error})
+
+    def _import_batch(self, batch):
+        items = []
+        for row_number, row in batch:
+            try:
+                if isinstance(row, ValidationError):
+                    raise row
+                items.append((row_number, *self._build(row)))
+            except ValidationError as e:
+                self._add_error(row_number, e)
+        items = self._exclude_duplicates(items)
+        if not items:
+            return
+        devices = [device for _, device, _, _ in items]
+        configs = [config for _, _, config, _ in items]
+        template_relations = []
+        vpn_clients = []
+        through = Config.templates.through
+        sort_field = through._sort_field_name
+        for _, _, config, templates in items:
+            for sort_value, template in enumerate(templates):
+                template_relations.append(
+                    through(
+                        config_id=config.pk,
+                        template_id=template.pk,
+                        **{sort_field: sort_value},
+                    )
+                )
+                if template.type == 'vpn':
+                    # held back until the certificate is generated
+                    if template.auto_cert:
+                        config.vpn_certs_pending = True
+                    vpn_clients.append(
+                        VpnClient(
+                            config=config,
+                            vpn=template.vpn,
+                            auto_cert=template.auto_cert,
+                        )
+                    )
+        with transaction.atomic():
+            Device.objects.bulk_create(devices)
+            Config.objects.bulk_create(configs)
+            through.objects.bulk_create(template_relations)
+            VpnClient.objects.bulk_create(vpn_clients)
+            devices_imported.send(
+                sender=Device, instances=devices, organization=self.organization
+            )
+            pk_list = list(
+                {str(client.config.pk) for client in vpn_clients if client.auto_cert}
+            )
+            if pk_list:
+                transaction.on_commit(lambda: self._create_vpn_client_certs(pk_list))
+        self.created += len(devices)
+        logger.info(f'imported {len(devices)} devices in {self.organization}')
+
+    def _create_vpn_client_certs(self, pk_list):
+        size = self.cert_chunk_size
+        for start in range(0, len(pk_list), size):
+            end = start + size
+            create_vpn_client_certs.delay(pk_list[start:end])
+
+    def _build(self, row):
+        """
+        returns a tuple containing the device, its configuration and the
+        templates of the configuration, does not query the database
+        (except when a combination of configuration and templates
+        has to be validated for the first time)
+        """
+        device = Device(organization=self.organization)
+        for field in self.device_fields:
+            value = row.get(field)
+            if value not in [None, '']:
+                setattr(
+                    device, field, value.strip() if isinstance(value, str) else value
+                )
+        if not device.key:
+            device.key = (
+                device.generate_key(self._shared_secret)
+                if self._shared_secret
+                else KeyField.default_callable()
+            )
+        # the organization is not validated in order to avoid
+        # a query for each row, uniqueness is checked per batch
+        device.clean_fields(exclude=['organization'])
+        config = Config(
+            device=device, backend=row.get('backend') or app_settings.DEFAULT_BACKEND
+        )
+        for field in ['config', 'context']:
+            value = row.get(field) or {}
+            if isinstance(value, str):
+                try:
+                    value = json.loads(value)
+                except ValueError as e:
+                    raise ValidationError({field: f'invalid JSON: {e}'})
+            setattr(config, field, value)
+        config.clean_fields(exclude=['device'])
+        templates = self._get_templates(config.backend, row.get('templates'))
+        self._validate_config(config, templates)
+        return device, config, templates
+
+    def _get_templates(self, backend, names):
+        """
+        returns the templates specified in the row (names separated by
+        spaces or a list) preceded by the default templates of the backend
+        """
+        if self._templates is None:
+            queryset = (
+                Template.objects.filter(
+                    Q(organization=self.organization) | Q(organization=None)
+                )
+                .select_related('vpn')
+                .order_by('-organization')
+            )
+            self._templates = {}
+            # templates of the organization prevail
+            # over shared templates with the same name
+            for template in queryset:
+                self._templates.setdefault(template.name, template)
+        if backend not in self._default_templates:
+            self._default_templates[backend] = list(
+                get_default_templates_queryset(
+                    organization_id=self.organization.pk,
+                    backend=backend,
+                    model=Template,
+                ).select_related('vpn')
+            )
+        templates = list(self._default_templates[backend])
+        if isinstance(names, str):
+            names = names.split()
+        for name in names or []:
+            template = self._templates.get(name)
+            if not template:
+                raise ValidationError({'templates': f'template "{name}" not found'})
+            if template.backend != backend:
+                raise ValidationError(
+                    {'templates': f'template "{name}" uses a different backend'}
+                )
+            if template not in templates:
+                templates.append(template)
+        return templates
+
+    def _validate_config(self, config, templates):
+        """
+        each combination of configuration and templates is validated only once
+        (variables specific to each device are not expected to change the
+        outcome of the validation)
+        """
+        key = json.dumps(
+            [
+                config.backend,
+                config.config,
+                config.context,
+                [str(template.pk) for template in templates],
+            ],
+            sort_keys=True,
+        )
+        if key in self._validated:
+            return
+        config.clean()
+        if templates:
+            backend = config.get_backend_instance(template_instances=templates)
+            try:
+                Config.clean_netjsonconfig_backend(backend)
+            except ValidationError as e:
+                message = 'There is a conflict with the specified templates. {0}'
+                raise ValidationError(message.format(e.message))
+        self._validated.add(key)
+
+    def _exclude_duplicates(self, items):
+        """
+        excludes rows which would violate uniqueness constraints,
+        the database is queried only once for each unique field
+        """
+        check_names = app_settings.DEVICE_NAME_UNIQUE
+        devices = Device.objects.filter(organization=self.organization)
+        existing_names = set()
+        if check_names:
+            existing_names = set(
+                devices.annotate(lower_name=Lower('name'))
+                .filter(lower_name__in=[d.name.lower() for _, d, _, _ in items])
+                .values_list('lower_name', flat=True)
+            )
+        existing_mac_addresses = set(
+            devices.filter(
+                mac_address__in=[d.mac_address for _, d, _, _ in items]
+            ).values_list('mac_address', flat=True)
+        )
+        existing_hardware_ids = set(
+            devices.filter(
+                hardware_id__in=[d.hardware_id for _, d, _, _ in items if d.hardware_id]
+            ).values_list('hardware_id', flat=True)
+        )
+        existing_keys = set(
+            Device.objects.filter(key__in=[d.key for _, d, _, _ in items]).values_list(
+                'key', flat=True
+            )
+        )
+        valid = []
+        for item in items:
+            row_number, device = item[0], item[1]
+            name = device.name.lower()
+            errors = {}
+            if check_names and (name in existing_names or name in self._names):
+                errors[
+                    'name'
+                ] = 'Device with this Name and Organization already exists.'
+            if (
+                device.mac_address in existing_mac_addresses
+                or device.mac_address in self._mac_addresses
+            ):
+                errors[
+                    'mac_address'
+                ] = 'Device with this Mac address and Organization already exists.'
+            if device.hardware_id and (
+                device.hardware_id in existing_hardware_ids
+                or device.hardware_id in self._hardware_ids
+            ):
+                errors[
+                    'hardware_id'
+                ] = 'Device with this Hardware id and Organization already exists.'
+            if device.key in existing_keys or device.key in self._keys:
+                errors['key'] = 'Device with this Key already exists.'
+            if errors:
+                self._add_error(row_number, errors)
+                continue
+            self._names.add(name)
+            self._mac_addresses.add(device.mac_address)
+            if device.hardware_id:
+                self._hardware_ids.add(device.hardware_id)
+            self._keys.add(device.key)
+            valid.append(item)
+        return valid
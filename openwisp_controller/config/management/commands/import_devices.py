@@ -0,0 +1,57 @@
+import json
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+from swapper import load_model
+
+from ...importer import DeviceImporter, read_device_rows
+
+Organization = load_model('openwisp_users', 'Organization')
+
+
+class Command(BaseCommand):
+    help = (
+        'Creates devices and their configuration in bulk '
+        'from a CSV or JSON lines file (use "-" to read from stdin)'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('file', help='path of the file to import')
+        parser.add_argument(
+            '--organization',
+            required=True,
+            help='slug of the organization of the devices',
+        )
+        parser.add_argument(
+            '--format',
+            choices=['csv', 'json'],
+            help='format of the file, inferred from its extension if omitted',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=None,
+            help='number of devices validated and created at once',
+        )
+
+    def handle(self, *args, **options):
+        try:
+            organization = Organization.objects.get(slug=options['organization'])
+        except Organization.DoesNotExist:
+            raise CommandError(
+                f'organization "{options["organization"]}" does not exist'
+            )
+        path = options['file']
+        format = options['format'] or ('csv' if path.endswith('.csv') else 'json')
+        importer = DeviceImporter(organization, batch_size=options['batch_size'])
+        if path == '-':
+            result = importer.run(read_device_rows(sys.stdin, format))
+        else:
+            with open(path, newline='') as f:
+                result = importer.run(read_device_rows(f, format))
+        for error in result['errors']:
+            self.stderr.write(f'row {error["row"]}: {json.dumps(error["errors"])}')
+        self.stdout.write(
+            f'{result["created"]} devices created, '
+            f'{len(result["errors"])} rows skipped'
+        )
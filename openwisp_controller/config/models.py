@@ -6,7 +6,7 @@ from .base.device_group import AbstractDeviceGroup
 from .base.multitenancy import AbstractOrganizationConfigSettings
 from .base.tag import AbstractTaggedTemplate, AbstractTemplateTag
 from .base.template import AbstractTemplate
-from .base.vpn import AbstractVpn, AbstractVpnClient
+from .base.vpn import AbstractDhParameters, AbstractVpn, AbstractVpnClient
 
 
 class Device(AbstractDevice):
@@ -89,6 +89,16 @@ class VpnClient(AbstractVpnClient):
         swappable = swapper.swappable_setting('config', 'VpnClient')
 
 
+class DhParameters(AbstractDhParameters):
+    """
+    Pool of pre-generated DH parameters
+    """
+
+    class Meta(AbstractDhParameters.Meta):
+        abstract = False
+        swappable = swapper.swappable_setting('config', 'DhParameters')
+
+
 class OrganizationConfigSettings(AbstractOrganizationConfigSettings):
     """
     Configuration management settings
@@ -48,6 +48,15 @@ DEFAULT_AUTO_CERT = get_settings_value('DEFAULT_AUTO_CERT', True)
 CERT_PATH = get_settings_value('CERT_PATH', '/etc/x509')
 COMMON_NAME_FORMAT = get_settings_value('COMMON_NAME_FORMAT', '{mac_address}-{name}')
 MANAGEMENT_IP_DEVICE_LIST = get_settings_value('MANAGEMENT_IP_DEVICE_LIST', True)
+IP_WRITE_BEHIND = get_settings_value('IP_WRITE_BEHIND', False)
+ASYNC_CHECKSUM_VIEW = get_settings_value('ASYNC_CHECKSUM_VIEW', False)
+CHECKSUM_FAST_PATH = get_settings_value('CHECKSUM_FAST_PATH', False)
+POLLING_INTERVAL = get_settings_value('POLLING_INTERVAL', None)
+POLLING_INTERVAL_JITTER = get_settings_value('POLLING_INTERVAL_JITTER', 0.25)
+assert (
+    0 <= POLLING_INTERVAL_JITTER < 1
+), 'OPENWISP_CONTROLLER_POLLING_INTERVAL_JITTER must be between 0 and 1'
+POLLING_MAX_RATE = get_settings_value('POLLING_MAX_RATE', None)
 CONFIG_BACKEND_FIELD_SHOWN = get_settings_value('CONFIG_BACKEND_FIELD_SHOWN', True)
 
 HARDWARE_ID_ENABLED = get_settings_value('HARDWARE_ID_ENABLED', False)
@@ -65,6 +74,16 @@ DEVICE_VERBOSE_NAME = get_settings_value(
     'DEVICE_VERBOSE_NAME', (_('Device'), _('Devices'))
 )
 DEVICE_NAME_UNIQUE = get_settings_value('DEVICE_NAME_UNIQUE', True)
+RELATED_CONFIG_CHUNK_SIZE = get_settings_value('RELATED_CONFIG_CHUNK_SIZE', 1000)
+DEVICE_IMPORT_BATCH_SIZE = get_settings_value('DEVICE_IMPORT_BATCH_SIZE', 500)
+DH_POOL_SIZE = get_settings_value('DH_POOL_SIZE', 0)
+ASYNC_VPN_CLIENT_CERTS = get_settings_value('ASYNC_VPN_CLIENT_CERTS', False)
+VPN_CLIENT_CERT_RENEWAL_WINDOW = get_settings_value(
+    'VPN_CLIENT_CERT_RENEWAL_WINDOW', 30
+)
+VPN_CLIENT_CERT_RENEWAL_BATCH_SIZE = get_settings_value(
+    'VPN_CLIENT_CERT_RENEWAL_BATCH_SIZE', 500
+)
 DEVICE_GROUP_SCHEMA = get_settings_value(
     'DEVICE_GROUP_SCHEMA', {'type': 'object', 'properties': {}}
 )
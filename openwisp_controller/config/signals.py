@@ -7,9 +7,12 @@ config_status_changed = Signal(providing_args=['instance'])
 config_modified = Signal(
     providing_args=['instance', 'device', 'config', 'previous_status', 'action']
 )
+config_modified_bulk = Signal(providing_args=['instances', 'action'])
 device_registered = Signal(providing_args=['instance', 'is_new'])
+devices_imported = Signal(providing_args=['instances', 'organization'])
 management_ip_changed = Signal(
     providing_args=['instance', 'management_ip', 'old_management_ip']
 )
+management_ip_cleared_bulk = Signal(providing_args=['instances', 'old_management_ips'])
 device_name_changed = Signal(providing_args=['instance'])
 device_group_changed = Signal(providing_args=['instance', 'group', 'old_group'])
@@ -1,12 +1,20 @@
 import logging
+from datetime import timedelta
 
 from celery import shared_task
 from celery.exceptions import SoftTimeLimitExceeded
+from django.core.cache import cache
 from django.core.exceptions import ObjectDoesNotExist
+from django.utils import timezone
 from swapper import load_model
 
 logger = logging.getLogger(__name__)
 
+_DH_POOL_LOCK_KEY = 'config_dh_pool_refill'
+# number of configurations processed by each
+# ``create_vpn_client_certs`` task scheduled again
+_VPN_CLIENT_CERTS_CHUNK_SIZE = 100
+
 
 @shared_task(soft_time_limit=1200)
 def update_template_related_config_status(template_pk):
@@ -14,6 +22,8 @@ def update_template_related_config_status(template_pk):
     Flags config objects related to the specified
     template PK as modified and triggers config
     modified and config status changed signals
+    (the related configs are processed in chunks by
+    ``update_template_related_config_status_chunk``)
     """
     Template = load_model('config', 'Template')
     try:
@@ -33,6 +43,164 @@ def update_template_related_config_status(template_pk):
         )
 
 
+@shared_task(soft_time_limit=1200)
+def update_template_related_config_status_chunk(template_pk, pk_list, job_id):
+    """
+    Flags a chunk of the config objects related to the
+    specified template PK as modified; if the soft time
+    limit is hit the chunk is split in two halves which
+    are processed by two new tasks
+    """
+    Template = load_model('config', 'Template')
+    try:
+        template = Template.objects.get(pk=template_pk)
+    except ObjectDoesNotExist as e:
+        logger.warning(
+            f'update_template_related_config_status_chunk("{template_pk}") failed: {e}'
+        )
+        return
+    if not template._is_related_config_job_current(job_id):
+        logger.info(
+            f'skipping chunk of superseded job {job_id} of template {template} '
+            f'(ID: {template_pk})'
+        )
+        return
+    try:
+        template._update_related_config_status_chunk(pk_list)
+    except SoftTimeLimitExceeded:
+        if len(pk_list) < 2:
+            logger.error(
+                'soft time limit hit while executing '
+                f'_update_related_config_status_chunk for {template} '
+                f'(ID: {template_pk}), config IDs: {pk_list}'
+            )
+            return
+        logger.warning(
+            'soft time limit hit while executing '
+            f'_update_related_config_status_chunk for {template} '
+            f'(ID: {template_pk}), splitting chunk of {len(pk_list)} configs'
+        )
+        half = len(pk_list) // 2
+        for chunk in (pk_list[:half], pk_list[half:]):
+            update_template_related_config_status_chunk.delay(
+                template_pk, chunk, job_id
+            )
+        return
+    template._update_related_config_progress(job_id, len(pk_list))
+
+
+@shared_task(soft_time_limit=1200)
+def update_config_checksum(config_pk):
+    """
+    Recalculates and stores the checksum
+    of the specified config object
+    """
+    from .controller.views import DeviceChecksumView
+
+    Config = load_model('config', 'Config')
+    try:
+        config = Config.objects.select_related('device').get(pk=config_pk)
+    except ObjectDoesNotExist as e:
+        logger.warning(f'update_config_checksum("{config_pk}") failed: {e}')
+        return
+    config.update_checksum_db()
+    # the device cached by the checksum view holds the outdated checksum
+    DeviceChecksumView.invalidate_get_device_cache(instance=config.device)
+
+
+@shared_task(soft_time_limit=1200)
+def update_config_checksums(pk_list):
+    """
+    Recalculates and stores the checksums of the specified
+    config objects (bulk version of ``update_config_checksum``);
+    if the soft time limit is hit, the checksums which have not
+    been calculated yet are calculated when requested
+    """
+    from .controller.views import DeviceChecksumView
+
+    Config = load_model('config', 'Config')
+    configs = list(
+        Config.objects.filter(pk__in=pk_list)
+        .select_related('device')
+        .prefetch_related('templates')
+    )
+    updated = []
+    now = timezone.now()
+    try:
+        for config in configs:
+            # stored once the certificates are generated
+            if config.vpn_certs_pending:
+                continue
+            config.checksum_db = config.checksum
+            config.checksum_updated = now
+            updated.append(config)
+    except SoftTimeLimitExceeded:
+        logger.warning(
+            'soft time limit hit while executing update_config_checksums, '
+            f'{len(configs) - len(updated)} checksums left to calculate'
+        )
+    Config.objects.bulk_update(updated, ['checksum_db', 'checksum_updated'])
+    DeviceChecksumView.invalidate_checksum_cache_bulk(updated)
+
+
+@shared_task
+def update_device_ips(device_pk, last_ip, management_ip):
+    """
+    Saves the IP addresses of the device reported
+    to the asynchronous controller views
+    """
+    from .controller.views import DeviceChecksumView
+
+    Device = load_model('config', 'Device')
+    try:
+        device = Device.objects.get(pk=device_pk)
+    except ObjectDoesNotExist as e:
+        logger.warning(f'update_device_ips("{device_pk}") failed: {e}')
+        return
+    device.last_ip = last_ip
+    device.management_ip = management_ip
+    device.save(update_fields=['last_ip', 'management_ip'])
+    cleared = Device.clear_duplicated_ips([device])
+    DeviceChecksumView.invalidate_get_device_cache_bulk(cleared)
+
+
+@shared_task
+def flush_device_ip_buffer():
+    """
+    Writes to the database the IP addresses of devices
+    buffered by the controller views (used when
+    ``OPENWISP_CONTROLLER_IP_WRITE_BEHIND`` is enabled)
+    """
+    from .controller.views import DeviceChecksumView
+    from .utils import pop_buffered_device_ips
+
+    Device = load_model('config', 'Device')
+    device_ips = pop_buffered_device_ips()
+    if not device_ips:
+        return
+    changed = []
+    for device in Device.objects.filter(pk__in=device_ips.keys()).only(
+        'pk', 'organization', 'key', 'last_ip', 'management_ip'
+    ):
+        ips = device_ips[str(device.pk)]
+        if (
+            device.last_ip == ips['last_ip']
+            and device.management_ip == ips['management_ip']
+        ):
+            continue
+        device.last_ip = ips['last_ip']
+        device.management_ip = ips['management_ip']
+        changed.append(device)
+    Device.objects.bulk_update(changed, ['last_ip', 'management_ip'])
+    for device in changed:
+        device._check_management_ip_changed()
+    # the view cache of the buffered devices is already up to date,
+    # the cache of the devices which had duplicated IPs is not
+    cleared = Device.clear_duplicated_ips(changed)
+    DeviceChecksumView.invalidate_get_device_cache_bulk(cleared)
+    logger.info(f'flushed IP addresses of {len(changed)} devices')
+
+
 @shared_task(soft_time_limit=1200)
 def create_vpn_dh(vpn_pk):
     """
@@ -41,7 +209,7 @@ def create_vpn_dh(vpn_pk):
     Vpn = load_model('config', 'Vpn')
     vpn = Vpn.objects.get(pk=vpn_pk)
     try:
-        vpn.dh = Vpn.dhparam(2048)
+        vpn.dh = Vpn.dhparam(Vpn.dh_length)
     except SoftTimeLimitExceeded:
         logger.error(
             'soft time limit hit while generating DH '
@@ -52,6 +220,132 @@ def create_vpn_dh(vpn_pk):
         vpn.save()
 
 
+@shared_task(soft_time_limit=1200)
+def refill_dh_pool():
+    """
+    Generates the DH parameters missing from the pool
+    (``OPENWISP_CONTROLLER_DH_POOL_SIZE`` sets are kept ready)
+    """
+    from . import settings as app_settings
+
+    if not app_settings.DH_POOL_SIZE:
+        return
+    # the same sets of parameters must not be generated twice
+    if not cache.add(_DH_POOL_LOCK_KEY, True, timeout=1200):
+        return
+    DhParameters = load_model('config', 'DhParameters')
+    Vpn = load_model('config', 'Vpn')
+    try:
+        generated = DhParameters.refill(Vpn.dh_length, app_settings.DH_POOL_SIZE)
+    except SoftTimeLimitExceeded:
+        logger.error('soft time limit hit while refilling the DH parameters pool')
+    else:
+        if generated:
+            logger.info(f'added {generated} sets of DH parameters to the pool')
+    finally:
+        cache.delete(_DH_POOL_LOCK_KEY)
+
+
+@shared_task(soft_time_limit=1200)
+def create_vpn_client_certs(config_pk_list):
+    """
+    Generates the certificates of the VPN clients which have been
+    created without certificate (see ``DeviceImporter`` and
+    ``OPENWISP_CONTROLLER_ASYNC_VPN_CLIENT_CERTS``)
+    """
+    Config = load_model('config', 'Config')
+    VpnClient = load_model('config', 'VpnClient')
+    clients = VpnClient.objects.select_related(
+        'vpn__ca', 'config__device__organization'
+    ).filter(config_id__in=config_pk_list, auto_cert=True, cert=None)
+    try:
+        VpnClient.bulk_create_certs(list(clients))
+    except SoftTimeLimitExceeded:
+        logger.error(
+            'soft time limit hit while generating the certificates '
+            f'of the VPN clients of configs: {config_pk_list}'
+        )
+    except Exception:
+        logger.exception(
+            'failed to generate the certificates of the '
+            f'VPN clients of configs: {config_pk_list}'
+        )
+    # configurations whose certificates are still missing stay held
+    # back, they're retried by ``retry_pending_vpn_client_certs``
+    pending = set(
+        VpnClient.objects.filter(
+            config_id__in=config_pk_list, auto_cert=True, cert=None
+        ).values_list('config_id', flat=True)
+    )
+    # the configurations held back until the certificates were
+    # available can now be downloaded (or pushed) by the devices
+    configs = list(
+        Config.objects.filter(pk__in=config_pk_list)
+        .exclude(pk__in=pending)
+        .select_related('device')
+        .prefetch_related('templates')
+    )
+    if not configs:
+        return
+    for config in configs:
+        config.vpn_certs_pending = False
+    Config.objects.filter(pk__in=[config.pk for config in configs]).update(
+        vpn_certs_pending=False
+    )
+    Config.bulk_set_status_modified(configs, action='related_certificate_changed')
+
+
+@shared_task(soft_time_limit=1200)
+def retry_pending_vpn_client_certs():
+    """
+    Schedules again the generation of the VPN client certificates
+    which are still missing (eg: because ``create_vpn_client_certs``
+    failed or the worker executing it died), must be executed periodically
+    """
+    Config = load_model('config', 'Config')
+    # recently flagged configurations may still be processed
+    # by the task which has been scheduled for them
+    limit = timezone.now() - timedelta(seconds=create_vpn_client_certs.soft_time_limit)
+    pk_list = [
+        str(pk)
+        for pk in Config.objects.filter(
+            vpn_certs_pending=True, modified__lt=limit
+        ).values_list('pk', flat=True)
+    ]
+    size = _VPN_CLIENT_CERTS_CHUNK_SIZE
+    for start in range(0, len(pk_list), size):
+        end = start + size
+        create_vpn_client_certs.delay(pk_list[start:end])
+
+
+@shared_task(soft_time_limit=1200)
+def renew_expiring_vpn_client_certs():
+    """
+    Renews the certificates of the VPN clients (``auto_cert``) which expire
+    within ``OPENWISP_CONTROLLER_VPN_CLIENT_CERT_RENEWAL_WINDOW`` days;
+    at most ``OPENWISP_CONTROLLER_VPN_CLIENT_CERT_RENEWAL_BATCH_SIZE``
+    certificates are renewed at each execution, so that the changes of
+    the configurations (and their download) are spread over time
+    """
+    from . import settings as app_settings
+
+    if not app_settings.VPN_CLIENT_CERT_RENEWAL_WINDOW:
+        return
+    Cert = load_model('django_x509', 'Cert')
+    pk_list = list(
+        Cert.get_expiring(app_settings.VPN_CLIENT_CERT_RENEWAL_WINDOW)
+        .filter(vpnclient__auto_cert=True)
+        .values_list('pk', flat=True)[: app_settings.VPN_CLIENT_CERT_RENEWAL_BATCH_SIZE]
+    )
+    if not pk_list:
+        return
+    job = Cert.start_bulk_job('renew', pk_list)
+    logger.info(
+        f'renewal of {len(pk_list)} expiring VPN client '
+        f'certificates started (job: {job["id"]})'
+    )
+
+
 @shared_task
 def invalidate_devicegroup_cache_change(instance_id, model_name):
     from .api.views import DeviceGroupCommonName
@@ -1,5 +1,6 @@
 from django.contrib.auth.models import Permission
 from django.core.exceptions import ValidationError
+from django.core.files.uploadedfile import SimpleUploadedFile
 from django.test import TestCase
 from django.test.testcases import TransactionTestCase
 from django.urls import reverse
@@ -144,6 +145,67 @@ class TestConfigApi(
         self.assertEqual(Device.objects.count(), 1)
         self.assertEqual(response.data['group'], device_group.pk)
 
+    def test_device_import_api(self):
+        org = self._get_org()
+        default = self._create_template(name='default', default=True)
+        t1 = self._create_template(name='t1', organization=org)
+        path = reverse('config_api:device_import')
+        content = (
+            'name,mac_address,model,templates\n'
+            'import-1,00:11:22:33:44:01,TP-Link,t1\n'
+            'import-2,00:11:22:33:44:02,TP-Link,\n'
+            'IMPORT-2,00:11:22:33:44:03,TP-Link,\n'
+            'import-4,00:11:22:33:44:04,TP-Link,missing\n'
+            'import-5,wrong,TP-Link,\n'
+        )
+        file = SimpleUploadedFile('devices.csv', content.encode())
+        r = self.client.post(path, {'organization': org.pk, 'file': file})
+        self.assertEqual(r.status_code, 201)
+        self.assertEqual(r.data['created'], 2)
+        self.assertEqual([error['row'] for error in r.data['errors']], [3, 4, 5])
+        self.assertIn('name', r.data['errors'][0]['errors'])
+        self.assertIn('templates', r.data['errors'][1]['errors'])
+        self.assertIn('mac_address', r.data['errors'][2]['errors'])
+        d1 = Device.objects.get(name='import-1')
+        self.assertEqual(d1.organization, org)
+        self.assertEqual(d1.model, 'TP-Link')
+        self.assertEqual(len(d1.key), 32)
+        self.assertEqual(d1.config.status, 'modified')
+        self.assertEqual(list(d1.config.templates.all()), [default, t1])
+        d2 = Device.objects.get(name='import-2')
+        self.assertEqual(list(d2.config.templates.all()), [default])
+
+        with self.subTest('mac address already imported'):
+            file = SimpleUploadedFile('devices.csv', content.encode())
+            r = self.client.post(path, {'organization': org.pk, 'file': file})
+            self.assertEqual(r.status_code, 400)
+            self.assertEqual(r.data['created'], 0)
+            self.assertEqual(len(r.data['errors']), 5)
+            self.assertEqual(Device.objects.count(), 2)
+
+        with self.subTest('all rows invalid'):
+            file = SimpleUploadedFile(
+                'devices.csv',
+                (
+                    'name,mac_address,model,templates\n'
+                    'import-6,wrong,TP-Link,\n'
+                    'import-7,00:11:22:33:44:07,TP-Link,missing\n'
+                ).encode(),
+            )
+            r = self.client.post(path, {'organization': org.pk, 'file': file})
+            self.assertEqual(r.status_code, 400)
+            self.assertEqual(r.data['created'], 0)
+            self.assertEqual([error['row'] for error in r.data['errors']], [1, 2])
+            self.assertEqual(Device.objects.count(), 2)
+
+        with self.subTest('organization not managed by the user'):
+            org2 = self._create_org(name='org2')
+            self.client.force_login(self._create_operator(organizations=[org2]))
+            file = SimpleUploadedFile('devices.csv', content.encode())
+            r = self.client.post(path, {'organization': org.pk, 'file': file})
+            self.assertEqual(r.status_code, 400)
+            self.assertIn('organization', r.data)
+
     def test_device_list_api(self):
         self._create_device()
         path = reverse('config_api:device_list')
@@ -712,6 +774,30 @@ class TestConfigApiTransaction(
         super().setUp()
         self._login()
 
+    def test_device_import_vpn_client_certs(self):
+        org = self._get_org()
+        vpn = self._create_vpn(organization=org)
+        self._create_template(
+            name='vpn-template', type='vpn', vpn=vpn, organization=org
+        )
+        content = (
+            '{"name": "import-1", "mac_address": "00:11:22:33:44:01", '
+            '"templates": ["vpn-template"]}\n'
+        )
+        file = SimpleUploadedFile('devices.json', content.encode())
+        r = self.client.post(
+            reverse('config_api:device_import'), {'organization': org.pk, 'file': file}
+        )
+        self.assertEqual(r.status_code, 201)
+        self.assertEqual(r.data['created'], 1)
+        client = VpnClient.objects.select_related('cert').get(
+            config__device__name='import-1'
+        )
+        self.assertTrue(client.auto_cert)
+        self.assertIsNotNone(client.cert)
+        self.assertEqual(client.cert.organization, org)
+        self.assertEqual(client.cert.ca, vpn.ca)
+
     def _get_devicegroup_org_cert(self):
         org = self._get_org()
         device_group = self._create_device_group(organization=org)
@@ -136,7 +136,12 @@ class TestConfig(
             with patch('django.core.cache.cache.set') as mocked_set:
                 checksum = c.get_cached_checksum()
                 self.assertEqual(len(checksum), 32)
-                mocked_set.assert_called_once()
+                # the generated archive is cached too
+                mocked_set.assert_any_call(
+                    c.get_cached_checksum.get_cache_key(c),
+                    checksum,
+                    Config._CHECKSUM_CACHE_TIMEOUT,
+                )
 
         with self.subTest('check cache get'):
             with patch(
@@ -145,9 +150,18 @@ class TestConfig(
                 self.assertEqual(len(c.get_cached_checksum()), 32)
                 mocked_get.assert_called_once()
 
-        with self.subTest('ensure fresh checksum is calculated when cache is clear'):
+        with self.subTest('ensure stored checksum is used when cache is clear'):
+            c.update_checksum_db()
+            with patch.object(config_model_logger, 'debug') as mocked_debug:
+                c.get_cached_checksum.invalidate(c)
+                with self.assertNumQueries(0):
+                    self.assertEqual(c.get_cached_checksum(), checksum)
+                mocked_debug.assert_not_called()
+
+        with self.subTest('ensure fresh checksum is calculated when DB is clear'):
             with patch.object(config_model_logger, 'debug') as mocked_debug:
                 c.get_cached_checksum.invalidate(c)
+                c._clear_checksum_db()
                 self.assertEqual(len(c.get_cached_checksum()), 32)
                 mocked_debug.assert_called_once()
 
@@ -179,6 +193,83 @@ class TestConfig(
                 self.assertEqual(c.get_cached_checksum(), c.checksum)
                 mocked_debug.assert_called_once()
 
+    def test_render_cache(self):
+        c = self._create_config(organization=self._get_org())
+        archive = c.generate().getvalue()
+        cache_key = c.get_render_cache_key()
+
+        with self.subTest('archive is retrieved from cache'):
+            with patch.object(c.backend_class, 'generate') as mocked_generate:
+                self.assertEqual(c.generate().getvalue(), archive)
+                mocked_generate.assert_not_called()
+
+        with self.subTest('same configuration results in same cache key'):
+            c2 = Config.objects.get(pk=c.pk)
+            self.assertEqual(c2.get_render_cache_key(), cache_key)
+
+        with self.subTest('cache key changes when configuration changes'):
+            c.config['general']['timezone'] = 'Europe/Rome'
+            del c.backend_instance
+            self.assertNotEqual(c.get_render_cache_key(), cache_key)
+            self.assertNotEqual(c.generate().getvalue(), archive)
+
+        with self.subTest('configuration containing private keys is not cached'):
+            vpn_template = self._create_template(
+                name='vpn-test', type='vpn', vpn=self._create_vpn(), auto_cert=True
+            )
+            c.templates.add(vpn_template)
+            del c.backend_instance
+            self.assertIsNone(c.get_render_cache_key())
+            with patch('django.core.cache.cache.set') as mocked_set:
+                c.generate()
+                mocked_set.assert_not_called()
+
+    def test_checksum_db(self):
+        c = self._create_config(organization=self._get_org(), status='applied')
+        self.assertIsNone(c.checksum_db)
+        self.assertIsNone(c.checksum_updated)
+
+        with self.subTest('checksum is stored by update_checksum_db'):
+            checksum = c.update_checksum_db()
+            self.assertEqual(checksum, c.checksum)
+            c.refresh_from_db()
+            self.assertEqual(c.checksum_db, checksum)
+            self.assertIsNotNone(c.checksum_updated)
+
+        with self.subTest('checksum is not stored when requested'):
+            c._clear_checksum_db()
+            c.get_cached_checksum.invalidate(c)
+            self.assertEqual(c.get_cached_checksum(), checksum)
+            c.refresh_from_db()
+            self.assertIsNone(c.checksum_db)
+
+        with self.subTest('checksum is cleared when status changes to modified'):
+            c.update_checksum_db()
+            c.set_status_modified()
+            c.refresh_from_db()
+            self.assertIsNone(c.checksum_db)
+
+        with self.subTest('checksum is cleared when config changes'):
+            c.update_checksum_db()
+            c.config = {'general': {'description': 'test'}}
+            c.full_clean()
+            c.save()
+            c.refresh_from_db()
+            self.assertIsNone(c.checksum_db)
+
+        with self.subTest('checksum is cleared when templates change'):
+            c.update_checksum_db()
+            c.templates.add(self._create_template())
+            c.refresh_from_db()
+            self.assertIsNone(c.checksum_db)
+
+        with self.subTest('checksum is not stored while VPN certificates are pending'):
+            c.vpn_certs_pending = True
+            self.assertIsNone(c.update_checksum_db())
+            self.assertIsNone(c.get_cached_checksum())
+            c.refresh_from_db()
+            self.assertIsNone(c.checksum_db)
+
     def test_backend_import_error(self):
         """
         see issue #5
@@ -707,6 +798,29 @@ class TestTransactionConfig(
     TestVpnX509Mixin,
     TransactionTestCase,
 ):
+    def test_checksum_db_updated_on_config_modified(self):
+        config = self._create_config(organization=self._get_org())
+        config.config = {'general': {'description': 'test'}}
+        config.full_clean()
+        config.save()
+        config = Config.objects.get(pk=config.pk)
+        self.assertIsNotNone(config.checksum_db)
+        self.assertEqual(config.checksum_db, config.checksum)
+
+    def test_checksum_db_updated_on_related_template_change(self):
+        template = self._create_template()
+        config = self._create_config(organization=self._get_org())
+        config.templates.add(template)
+        config = Config.objects.get(pk=config.pk)
+        old_checksum = config.update_checksum_db()
+        template.config['interfaces'][0]['name'] = 'eth1'
+        template.full_clean()
+        template.save()
+        config = Config.objects.get(pk=config.pk)
+        self.assertIsNotNone(config.checksum_db)
+        self.assertNotEqual(config.checksum_db, old_checksum)
+        self.assertEqual(config.checksum_db, config.checksum)
+
     def test_certificate_renew_invalidates_checksum_cache(self):
         config = self._create_config(organization=self._get_org())
         vpn_template = self._create_template(
@@ -714,15 +828,24 @@ class TestTransactionConfig(
         )
         config.templates.add(vpn_template)
         config.refresh_from_db()
-        with patch('django.core.cache.cache.delete') as mocked_delete:
+        with patch('django.core.cache.cache.delete') as mocked_delete, patch(
+            'django.core.cache.cache.delete_many'
+        ) as mocked_delete_many:
             # Comparing checksum values after deleting backend instance
             # makes the test bogus. Hence assertion for cache.delete is required
             old_checksum = config.checksum
             vpnclient_cert = config.vpnclient_set.first().cert
             vpnclient_cert.renew()
-            # An additional call from cache invalidation of
-            # DeviceGroupCommonName View
-            self.assertEqual(mocked_delete.call_count, 3)
+            # the checksum cache and the device cached by DeviceChecksumView
+            # are invalidated together, the latter is invalidated again
+            # once the stored checksum is recalculated
+            self.assertEqual(mocked_delete_many.call_count, 2)
+            keys = []
+            for args, _ in mocked_delete_many.call_args_list:
+                keys.extend(args[0])
+            self.assertIn(config.get_cached_checksum.get_cache_key(config), keys)
+            # calls from cache invalidation of DeviceGroupCommonName View
+            self.assertEqual(mocked_delete.call_count, 2)
             del config.backend_instance
             self.assertNotEqual(config.get_cached_checksum(), old_checksum)
             config.refresh_from_db()
@@ -1,16 +1,20 @@
+import time
 from hashlib import md5
 from unittest.mock import patch
 
+from asgiref.sync import async_to_sync
 from django.core.cache import cache
 from django.core.exceptions import ValidationError
-from django.test import TestCase
+from django.test import RequestFactory, TestCase, TransactionTestCase
 from django.urls import reverse
 from swapper import load_model
 
 from openwisp_users.tests.utils import TestOrganizationMixin
 from openwisp_utils.tests import capture_any_output, catch_signal
 
+from .. import settings as app_settings
 from ..base.config import logger as config_model_logger
+from ..controller import views as controller_views
 from ..controller.views import DeviceChecksumView
 from ..controller.views import logger as controller_views_logger
 from ..signals import (
@@ -19,6 +23,16 @@ from ..signals import (
     config_modified,
     config_status_changed,
     device_registered,
+    management_ip_changed,
+    management_ip_cleared_bulk,
+)
+from ..tasks import flush_device_ip_buffer
+from ..utils import (
+    _POLL_RATE_WINDOW,
+    _get_poll_rate_cache_key,
+    get_controller_urls,
+    get_poll_rate,
+    pop_buffered_device_ips,
 )
 from .utils import CreateConfigTemplateMixin, TestVpnX509Mixin
 
@@ -77,6 +91,134 @@ class TestController(
         self.assertIsNotNone(d.last_ip)
         self.assertIsNone(d.management_ip)
 
+    @patch.object(app_settings, 'CHECKSUM_FAST_PATH', True)
+    def test_device_checksum_fast_path(self):
+        d = self._create_device_config()
+        url = reverse('controller:device_checksum', args=[d.pk])
+        params = {'key': d.key, 'management_ip': '10.0.0.2'}
+        # populates the cache
+        self.client.get(url, params)
+        checksum = d.config.get_cached_checksum()
+
+        with self.subTest('checksum returned from cached tuple'):
+            with catch_signal(checksum_requested) as handler:
+                with self.assertNumQueries(0):
+                    response = self.client.get(url, params)
+                handler.assert_not_called()
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.content.decode(), checksum)
+            self._check_header(response)
+
+        with self.subTest('wrong key'):
+            response = self.client.get(url, {'key': 'wrong'})
+            self.assertEqual(response.status_code, 403)
+
+        with self.subTest('IP addresses changed'):
+            with catch_signal(checksum_requested) as handler:
+                response = self.client.get(
+                    url, {'key': d.key, 'management_ip': '10.0.0.3'}
+                )
+                handler.assert_called_once()
+            d.refresh_from_db()
+            self.assertEqual(d.management_ip, '10.0.0.3')
+
+        with self.subTest('cached tuple invalidated when config changes'):
+            d.config.config['general']['timezone'] = 'Europe/Rome'
+            d.config.full_clean()
+            d.config.save()
+            response = self.client.get(url, {'key': d.key, 'management_ip': '10.0.0.3'})
+            self.assertNotEqual(response.content.decode(), checksum)
+
+    @patch.object(app_settings, 'POLLING_INTERVAL', 100)
+    @patch.object(app_settings, 'POLLING_INTERVAL_JITTER', 0.2)
+    def test_polling_interval_header(self):
+        header = 'X-Openwisp-Controller-Polling-Interval'
+        d = self._create_device_config()
+        checksum_url = reverse('controller:device_checksum', args=[d.pk])
+        download_url = reverse('controller:device_download_config', args=[d.pk])
+
+        with self.subTest('global interval with jitter'):
+            for url in [checksum_url, download_url]:
+                response = self.client.get(url, {'key': d.key})
+                self.assertEqual(response.status_code, 200)
+                self.assertGreaterEqual(int(response[header]), 80)
+                self.assertLessEqual(int(response[header]), 120)
+
+        with self.subTest('poll rate is not tracked without POLLING_MAX_RATE'):
+            window = int(time.time() // _POLL_RATE_WINDOW)
+            self.assertIsNone(cache.get(_get_poll_rate_cache_key(window)))
+
+        with self.subTest('poll rate is tracked'):
+            with patch.object(app_settings, 'POLLING_MAX_RATE', 1000):
+                for url in [checksum_url, download_url]:
+                    self.client.get(url, {'key': d.key})
+            window = int(time.time() // _POLL_RATE_WINDOW)
+            self.assertEqual(cache.get(_get_poll_rate_cache_key(window)), 2)
+
+        with self.subTest('organization interval'):
+            d.organization.config_settings.polling_interval = 1000
+            d.organization.config_settings.save()
+            response = self.client.get(checksum_url, {'key': d.key})
+            self.assertGreaterEqual(int(response[header]), 800)
+            self.assertLessEqual(int(response[header]), 1200)
+
+        with self.subTest('interval increased when poll rate is too high'):
+            window = int(time.time() // _POLL_RATE_WINDOW) - 1
+            cache.set(_get_poll_rate_cache_key(window), 20 * _POLL_RATE_WINDOW)
+            self.assertEqual(get_poll_rate(), 20)
+            with patch.object(app_settings, 'POLLING_MAX_RATE', 10):
+                response = self.client.get(checksum_url, {'key': d.key})
+            self.assertGreaterEqual(int(response[header]), 1600)
+            self.assertLessEqual(int(response[header]), 2400)
+
+        with patch.object(app_settings, 'POLLING_INTERVAL', None):
+            with self.subTest('disabled'):
+                response = self.client.get(checksum_url, {'key': d.key})
+                self.assertNotIn(header, response)
+
+    @patch.object(app_settings, 'IP_WRITE_BEHIND', True)
+    def test_ip_write_behind(self):
+        d = self._create_device_config()
+        dupe = self._create_device(
+            name='dupe',
+            mac_address='00:11:22:33:44:66',
+            last_ip='127.0.0.1',
+            management_ip='10.0.0.2',
+        )
+        url = reverse('controller:device_checksum', args=[d.pk])
+        # the device is retrieved and the checksum is calculated,
+        # nothing is written to the database
+        with self.assertNumQueries(3):
+            response = self.client.get(url, {'key': d.key, 'management_ip': '10.0.0.2'})
+        self.assertEqual(response.status_code, 200)
+
+        with self.subTest('IP addresses are not written to the database'):
+            d.refresh_from_db()
+            self.assertIsNone(d.last_ip)
+            self.assertIsNone(d.management_ip)
+
+        with self.subTest('view cache is up to date'):
+            view = DeviceChecksumView()
+            view.kwargs = {'pk': str(d.pk)}
+            self.assertEqual(view.get_device().last_ip, '127.0.0.1')
+            self.assertEqual(view.get_device().management_ip, '10.0.0.2')
+
+        with self.subTest('IP addresses are written when the buffer is flushed'):
+            with catch_signal(management_ip_changed) as handler, catch_signal(
+                management_ip_cleared_bulk
+            ) as bulk_handler:
+                flush_device_ip_buffer.delay()
+                # emitted for the device and for the dupe
+                self.assertEqual(handler.call_count, 2)
+                bulk_handler.assert_called_once()
+            d.refresh_from_db()
+            self.assertEqual(d.last_ip, '127.0.0.1')
+            self.assertEqual(d.management_ip, '10.0.0.2')
+            dupe.refresh_from_db()
+            self.assertIsNone(dupe.last_ip)
+            self.assertIsNone(dupe.management_ip)
+            self.assertEqual(pop_buffered_device_ips(), {})
+
     def test_device_get_object_cached(self):
         d = self._create_device_config()
         view = DeviceChecksumView()
@@ -273,6 +415,30 @@ class TestController(
         )
         self.assertEqual(response.status_code, 404)
 
+    def test_device_download_config_not_modified(self):
+        d = self._create_device_config()
+        url = reverse('controller:device_download_config', args=[d.pk])
+        response = self.client.get(url, {'key': d.key})
+        checksum = d.config.get_cached_checksum()
+        self.assertEqual(response['ETag'], f'"{checksum}"')
+
+        with self.subTest('304 returned if ETag matches'):
+            with patch.object(Config, 'generate') as mocked_generate:
+                response = self.client.get(
+                    url, {'key': d.key}, HTTP_IF_NONE_MATCH=f'"{checksum}"'
+                )
+                mocked_generate.assert_not_called()
+            self.assertEqual(response.status_code, 304)
+            self.assertEqual(response['ETag'], f'"{checksum}"')
+            self._check_header(response)
+
+        with self.subTest('archive returned if ETag does not match'):
+            response = self.client.get(
+                url, {'key': d.key}, HTTP_IF_NONE_MATCH='"wrong"'
+            )
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response['ETag'], f'"{checksum}"')
+
     def test_vpn_checksum_requested_signal_is_emitted(self):
         v = self._create_vpn()
         url = reverse('controller:vpn_checksum', args=[v.pk])
@@ -356,6 +522,36 @@ class TestController(
         )
         self._check_header(response)
 
+    def test_vpn_download_config_not_modified(self):
+        v = self._create_vpn()
+        url = reverse('controller:vpn_download_config', args=[v.pk])
+        response = self.client.get(
+            url, {'key': v.key}, HTTP_IF_NONE_MATCH=f'"{v.checksum}"'
+        )
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], f'"{v.checksum}"')
+        self.assertEqual(response.content, b'')
+        self._check_header(response)
+
+        checksum = v.checksum
+
+        with self.subTest('cached checksum is compared with the ETag'):
+            with patch.object(Vpn, 'generate') as mocked_generate:
+                response = self.client.get(
+                    url, {'key': v.key}, HTTP_IF_NONE_MATCH=f'"{checksum}"'
+                )
+                mocked_generate.assert_not_called()
+            self.assertEqual(response.status_code, 304)
+
+        with self.subTest('cached checksum changes when the VPN is modified'):
+            v.config = {'openvpn': [dict(self._vpn_config['openvpn'][0], dev='tap1')]}
+            v.full_clean()
+            v.save()
+            response = self.client.get(
+                url, {'key': v.key}, HTTP_IF_NONE_MATCH=f'"{checksum}"'
+            )
+            self.assertEqual(response.status_code, 200)
+
     def test_vpn_download_config_bad_uuid(self):
         v = self._create_vpn()
         pk = '{}-wrong'.format(v.pk)
@@ -585,6 +781,54 @@ class TestController(
         self.assertEqual(d.system, params['system'])
         self.assertEqual(d.model, params['model'])
 
+    def test_device_registration_unchanged(self):
+        d = self._create_device_config()
+        d.key = TEST_CONSISTENT_KEY
+        d.save()
+        params = {
+            'secret': TEST_ORG_SHARED_SECRET,
+            'name': TEST_MACADDR,
+            'mac_address': TEST_MACADDR,
+            'key': TEST_CONSISTENT_KEY,
+            'backend': 'netjsonconfig.OpenWrt',
+            'os': 'OpenWrt 18.06-SNAPSHOT r7312-e60be11330',
+        }
+        response = self.client.post(self.register_url, params)
+        self.assertEqual(response.status_code, 201)
+        d.refresh_from_db()
+        modified = d.modified
+
+        with self.subTest('unchanged device is not validated nor saved'):
+            with patch.object(Device, 'full_clean') as device_full_clean, patch.object(
+                Config, 'full_clean'
+            ) as config_full_clean, catch_signal(device_registered) as handler:
+                response = self.client.post(self.register_url, params)
+            self.assertEqual(response.status_code, 201)
+            self.assertContains(response, f'uuid: {d.pk.hex}', status_code=201)
+            self.assertContains(response, 'is-new: 0', status_code=201)
+            device_full_clean.assert_not_called()
+            config_full_clean.assert_not_called()
+            handler.assert_called_once()
+            d.refresh_from_db()
+            self.assertEqual(d.modified, modified)
+
+        with self.subTest('changed device is validated and saved'):
+            params['os'] = 'OpenWrt 19.07'
+            with patch.object(Config, 'full_clean') as config_full_clean:
+                response = self.client.post(self.register_url, params)
+            self.assertEqual(response.status_code, 201)
+            config_full_clean.assert_called_once()
+            d.refresh_from_db()
+            self.assertEqual(d.os, params['os'])
+
+        with self.subTest('missing tagged templates are added'):
+            t = self._create_template(organization=d.organization)
+            t.tags.add('mesh')
+            params['tags'] = 'mesh'
+            response = self.client.post(self.register_url, params)
+            self.assertEqual(response.status_code, 201)
+            self.assertTrue(d.config.templates.filter(pk=t.pk).exists())
+
     def test_device_registration_update_hw_info_no_config(self):
         d = self._create_device()
         d.key = TEST_CONSISTENT_KEY
@@ -930,6 +1174,88 @@ class TestController(
         self.assertEqual(d.config.templates.filter(pk=t_shared.pk).count(), 1)
         self.assertEqual(d.config.templates.filter(pk=t2.pk).count(), 0)
 
+    def test_register_cache(self):
+        org = self._create_org()
+        t1 = self._create_template(name='t1', organization=org)
+        t1.tags.add('mesh')
+        version = controller_views.get_registration_cache_version()
+        get_org_config_settings = controller_views.get_org_config_settings
+        get_tagged_template_pks = controller_views.get_tagged_template_pks
+
+        with self.subTest('organization settings are cached'):
+            with self.assertNumQueries(1):
+                org_settings = get_org_config_settings(version, TEST_ORG_SHARED_SECRET)
+            self.assertEqual(org_settings.organization, org)
+            with self.assertNumQueries(0):
+                get_org_config_settings(version, TEST_ORG_SHARED_SECRET)
+            # the shared cache is used when the in-process cache is empty
+            get_org_config_settings.cache_clear()
+            with self.assertNumQueries(0):
+                org_settings = get_org_config_settings(version, TEST_ORG_SHARED_SECRET)
+            self.assertEqual(org_settings.organization, org)
+
+        with self.subTest('misses are not cached'):
+            with self.assertRaises(OrganizationConfigSettings.DoesNotExist):
+                get_org_config_settings(version, 'WRONG')
+            with patch('django.core.cache.cache.set') as mocked_set:
+                with self.assertRaises(OrganizationConfigSettings.DoesNotExist):
+                    get_org_config_settings(version, 'WRONG')
+                mocked_set.assert_not_called()
+
+        with self.subTest('tagged templates are cached'):
+            with self.assertNumQueries(1):
+                pks = get_tagged_template_pks(version, org.pk, ('mesh',))
+            self.assertEqual(pks, (t1.pk,))
+            with self.assertNumQueries(0):
+                get_tagged_template_pks(version, org.pk, ('mesh',))
+
+        with self.subTest('cache is invalidated when tags change'):
+            t2 = self._create_template(name='t2', organization=org)
+            t2.tags.add('mesh')
+            version = controller_views.get_registration_cache_version()
+            pks = get_tagged_template_pks(version, org.pk, ('mesh',))
+            self.assertEqual(set(pks), {t1.pk, t2.pk})
+            t2.tags.remove('mesh')
+            self.assertNotEqual(
+                controller_views.get_registration_cache_version(), version
+            )
+
+        with self.subTest('cache is invalidated when settings change'):
+            org.config_settings.registration_enabled = False
+            org.config_settings.save()
+            self.assertNotEqual(
+                controller_views.get_registration_cache_version(), version
+            )
+            response = self.client.post(
+                self.register_url,
+                {
+                    'secret': TEST_ORG_SHARED_SECRET,
+                    'name': TEST_MACADDR_NAME,
+                    'mac_address': TEST_MACADDR,
+                    'backend': 'netjsonconfig.OpenWrt',
+                },
+            )
+            self.assertContains(response, 'registration disabled', status_code=403)
+
+    def test_register_custom_template_queryset(self):
+        org = self._create_org()
+        t1 = self._create_template(name='t1', organization=org)
+        t1.tags.add('mesh')
+        config = Config()
+
+        class CustomRegisterView(controller_views.DeviceRegisterView):
+            def get_template_queryset(self, config):
+                return super().get_template_queryset(config).exclude(pk=t1.pk)
+
+        view = controller_views.DeviceRegisterView()
+        view.organization = org
+        view.cache_version = controller_views.get_registration_cache_version()
+        self.assertEqual(view.get_tagged_templates(config, ['mesh']), (t1.pk,))
+        view = CustomRegisterView()
+        view.organization = org
+        view.cache_version = controller_views.get_registration_cache_version()
+        self.assertEqual(view.get_tagged_templates(config, ['mesh']), ())
+
     @capture_any_output()
     def test_register_400(self):
         self._get_org()
@@ -1146,6 +1472,51 @@ class TestController(
             cached_device1 = view.get_device()
             self.assertIsNone(cached_device1.management_ip)
 
+    def test_ip_fields_duplicates_cleared_in_bulk(self):
+        org = self._get_org()
+        dupes = [
+            self._create_device(
+                organization=org,
+                name=f'testdup{i}',
+                mac_address=f'00:11:22:33:66:{i:02}',
+                last_ip='127.0.0.1',
+                management_ip='192.168.1.99',
+            )
+            for i in range(3)
+        ]
+        c = self._create_config(organization=org)
+        with catch_signal(management_ip_changed) as handler, catch_signal(
+            management_ip_cleared_bulk
+        ) as bulk_handler:
+            # the number of queries does not depend on the number of dupes
+            with self.assertNumQueries(8):
+                self.client.get(
+                    reverse('controller:device_checksum', args=[c.device.pk]),
+                    {'key': c.device.key, 'management_ip': '192.168.1.99'},
+                )
+            # emitted for the device and for each dupe (has receivers)
+            self.assertEqual(handler.call_count, 4)
+            dupe_calls = [
+                call[1]
+                for call in handler.call_args_list
+                if call[1]['instance'] != c.device
+            ]
+            self.assertEqual(len(dupe_calls), 3)
+            for kwargs in dupe_calls:
+                self.assertIsNone(kwargs['management_ip'])
+                self.assertEqual(kwargs['old_management_ip'], '192.168.1.99')
+            # emitted once for all the dupes
+            bulk_handler.assert_called_once()
+            kwargs = bulk_handler.call_args[1]
+            self.assertEqual(
+                {dupe.pk for dupe in kwargs['instances']}, {dupe.pk for dupe in dupes}
+            )
+            self.assertEqual(kwargs['old_management_ips'], ['192.168.1.99'] * 3)
+        for dupe in dupes:
+            dupe.refresh_from_db()
+            self.assertIsNone(dupe.last_ip)
+            self.assertIsNone(dupe.management_ip)
+
     # simulate public IP by mocking the
     # method which tells us if the ip is private or not
     @patch('ipaddress.IPv4Address.is_private', False)
@@ -1197,3 +1568,54 @@ class TestController(
             handler.assert_called_once_with(
                 sender=Device, signal=device_registered, instance=device, is_new=True
             )
+
+
+class TestControllerAsync(
+    CreateConfigTemplateMixin,
+    TestOrganizationMixin,
+    TestVpnX509Mixin,
+    TransactionTestCase,
+):
+    """
+    tests for the async variants of the controller views
+    """
+
+    def setUp(self):
+        self.factory = RequestFactory()
+
+    def test_device_checksum_async(self):
+        c = self._create_config(organization=self._get_org())
+        device = c.device
+        url = reverse('controller:device_checksum', args=[device.pk])
+        view = async_to_sync(controller_views.device_checksum_async)
+
+        with self.subTest('checksum returned'):
+            request = self.factory.get(
+                url, {'key': device.key, 'management_ip': '10.0.0.2'}
+            )
+            response = view(request, pk=str(device.pk))
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.content.decode(), c.get_cached_checksum())
+            device.refresh_from_db()
+            self.assertEqual(device.last_ip, '127.0.0.1')
+            self.assertEqual(device.management_ip, '10.0.0.2')
+
+        with self.subTest('wrong key'):
+            request = self.factory.get(url, {'key': 'wrong'})
+            response = view(request, pk=str(device.pk))
+            self.assertEqual(response.status_code, 403)
+
+    @patch.object(app_settings, 'ASYNC_CHECKSUM_VIEW', True)
+    def test_async_checksum_url(self):
+        callbacks = {
+            pattern.name: pattern.callback
+            for pattern in get_controller_urls(controller_views)
+        }
+        self.assertIs(
+            callbacks['device_checksum'], controller_views.device_checksum_async
+        )
+        self.assertIs(callbacks['vpn_checksum'], controller_views.vpn_checksum)
+        self.assertIs(
+            callbacks['device_download_config'],
+            controller_views.device_download_config,
+        )
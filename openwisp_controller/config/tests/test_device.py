@@ -1,7 +1,11 @@
+import json
+import tempfile
 from hashlib import md5
+from io import StringIO
 from unittest import mock
 
 from django.core.exceptions import ValidationError
+from django.core.management import CommandError, call_command
 from django.test import TestCase
 from swapper import load_model
 
@@ -9,7 +13,12 @@ from openwisp_users.tests.utils import TestOrganizationMixin
 from openwisp_utils.tests import AssertNumQueriesSubTestMixin, catch_signal
 
 from .. import settings as app_settings
-from ..signals import device_group_changed, device_name_changed, management_ip_changed
+from ..signals import (
+    device_group_changed,
+    device_name_changed,
+    devices_imported,
+    management_ip_changed,
+)
 from ..validators import device_name_validator, mac_address_validator
 from .utils import CreateConfigTemplateMixin, CreateDeviceGroupMixin
 
@@ -18,6 +27,7 @@ TEST_ORG_SHARED_SECRET = 'functional_testing_secret'
 Config = load_model('config', 'Config')
 Device = load_model('config', 'Device')
 DeviceGroup = load_model('config', 'DeviceGroup')
+OrganizationConfigSettings = load_model('config', 'OrganizationConfigSettings')
 _original_context = app_settings.CONTEXT.copy()
 
 
@@ -408,3 +418,38 @@ class TestDevice(
             # on name change
             with self.assertNumQueries(3):
                 device._check_changed_fields()
+
+    def test_import_devices_command(self):
+        org = self._get_org()
+        OrganizationConfigSettings.objects.create(
+            organization=org, shared_secret=TEST_ORG_SHARED_SECRET
+        )
+        rows = [
+            {'name': 'import-1', 'mac_address': '00:11:22:33:44:01'},
+            {'name': 'import-2', 'mac_address': '00:11:22:33:44:02', 'os': 'OpenWrt'},
+            {'name': 'import-3', 'mac_address': '00:11:22:33:44:01'},
+        ]
+        stdout, stderr = StringIO(), StringIO()
+        with tempfile.NamedTemporaryFile('w', suffix='.json') as f:
+            f.write('\n'.join(json.dumps(row) for row in rows))
+            f.flush()
+            with catch_signal(devices_imported) as handler:
+                call_command(
+                    'import_devices',
+                    f.name,
+                    organization=org.slug,
+                    batch_size=2,
+                    stdout=stdout,
+                    stderr=stderr,
+                )
+            # emitted once per batch
+            self.assertEqual(handler.call_count, 1)
+            with self.assertRaises(CommandError):
+                call_command('import_devices', f.name, organization='wrong')
+        self.assertIn('2 devices created, 1 rows skipped', stdout.getvalue())
+        self.assertIn('row 3', stderr.getvalue())
+        self.assertEqual(Device.objects.count(), 2)
+        self.assertEqual(Config.objects.count(), 2)
+        device = Device.objects.get(name='import-2')
+        self.assertEqual(device.os, 'OpenWrt')
+        self.assertEqual(device.key, device.generate_key(TEST_ORG_SHARED_SECRET))
@@ -13,9 +13,12 @@ from openwisp_users.tests.utils import TestOrganizationMixin
 from openwisp_utils.tests import catch_signal
 
 from .. import settings as app_settings
-from ..signals import config_modified, config_status_changed
+from ..signals import config_modified, config_modified_bulk, config_status_changed
 from ..tasks import logger as task_logger
-from ..tasks import update_template_related_config_status
+from ..tasks import (
+    update_template_related_config_status,
+    update_template_related_config_status_chunk,
+)
 from .utils import CreateConfigTemplateMixin, TestVpnX509Mixin
 
 Config = load_model('config', 'Config')
@@ -541,7 +544,9 @@ class TestTemplateTransaction(
             with catch_signal(config_status_changed) as handler:
                 t.config['interfaces'][0]['name'] = 'eth2'
                 t.full_clean()
-                with self.assertNumQueries(8):
+                # includes the queries of update_config_checksums (executed
+                # eagerly), which stores the checksums with bulk_update
+                with self.assertNumQueries(15):
                     t.save()
                 c.refresh_from_db()
                 handler.assert_not_called()
@@ -711,3 +716,68 @@ class TestTemplateTransaction(
             template.save()
             mocked_error.assert_called_once()
         mocked_update_related_config_status.assert_called_once()
+
+    def _create_related_configs(self, template, count):
+        configs = []
+        for i in range(count):
+            device = self._create_device(
+                name=f'test-chunk-{i}', mac_address=f'00:11:22:33:44:{i:02}'
+            )
+            config = self._create_config(device=device)
+            config.templates.add(template)
+            config.set_status_applied()
+            configs.append(config)
+        return configs
+
+    @mock.patch.object(Template, 'related_config_chunk_size', 2)
+    def test_related_config_status_chunks(self):
+        template = self._create_template()
+        configs = self._create_related_configs(template, 3)
+        self.assertIsNone(template.get_related_config_progress())
+        template.config['interfaces'][0]['name'] = 'eth1'
+        template.full_clean()
+        with catch_signal(config_modified_bulk) as handler:
+            template.save()
+        self.assertEqual(handler.call_count, 2)
+        for config in configs:
+            config = Config.objects.get(pk=config.pk)
+            self.assertEqual(config.status, 'modified')
+            self.assertEqual(config.checksum_db, config.checksum)
+        progress = template.get_related_config_progress()
+        self.assertEqual(progress['total'], 3)
+        self.assertEqual(progress['done'], 3)
+
+    def test_related_config_status_superseded_job(self):
+        template = self._create_template()
+        config = self._create_related_configs(template, 1)[0]
+        template._update_related_config_status()
+        job_id = template.get_related_config_progress()['id']
+        config.set_status_applied()
+        with mock.patch.object(task_logger, 'info') as mocked_info:
+            update_template_related_config_status_chunk.delay(
+                template.pk, [str(config.pk)], uuid.uuid4().hex
+            )
+            mocked_info.assert_called_once()
+        config.refresh_from_db()
+        self.assertEqual(config.status, 'applied')
+        self.assertEqual(template.get_related_config_progress()['id'], job_id)
+
+    def test_related_config_status_chunk_timeout(self):
+        template = self._create_template()
+        configs = self._create_related_configs(template, 2)
+        original = Template._update_related_config_status_chunk
+
+        def timeout_large_chunks(self, pk_list):
+            if len(pk_list) > 1:
+                raise SoftTimeLimitExceeded()
+            return original(self, pk_list)
+
+        with mock.patch.object(
+            Template, '_update_related_config_status_chunk', timeout_large_chunks
+        ), mock.patch.object(task_logger, 'warning') as mocked_warning:
+            template._update_related_config_status()
+            mocked_warning.assert_called_once()
+        for config in configs:
+            config.refresh_from_db()
+            self.assertEqual(config.status, 'modified')
+        self.assertEqual(template.get_related_config_progress()['done'], 2)
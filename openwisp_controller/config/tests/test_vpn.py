@@ -1,19 +1,31 @@
+from datetime import timedelta
 from unittest import mock
 
 from celery.exceptions import SoftTimeLimitExceeded
 from django.core.exceptions import ValidationError
 from django.test import TestCase, TransactionTestCase
+from django.urls import reverse
+from django.utils import timezone
 from swapper import load_model
 
 from openwisp_users.tests.utils import TestOrganizationMixin
+from openwisp_utils.tests import catch_signal
 
 from ...vpn_backends import OpenVpn
 from .. import settings as app_settings
-from ..tasks import create_vpn_dh
+from ..signals import config_modified
+from ..tasks import (
+    create_vpn_client_certs,
+    create_vpn_dh,
+    refill_dh_pool,
+    renew_expiring_vpn_client_certs,
+    retry_pending_vpn_client_certs,
+)
 from .utils import CreateConfigTemplateMixin, TestVpnX509Mixin
 
 Config = load_model('config', 'Config')
 Device = load_model('config', 'Device')
+DhParameters = load_model('config', 'DhParameters')
 Template = load_model('config', 'Template')
 Vpn = load_model('config', 'Vpn')
 VpnClient = load_model('config', 'VpnClient')
@@ -420,3 +432,200 @@ class TestVpnTransaction(
         vpn.refresh_from_db()
         self.assertNotEqual(vpn.dh, Vpn._placeholder_dh)
         dhparam.assert_called_once()
+
+    @mock.patch.object(app_settings, 'ASYNC_VPN_CLIENT_CERTS', True)
+    def test_vpn_client_certs_async(self):
+        vpn = self._create_vpn()
+        template = self._create_template(type='vpn', vpn=vpn, auto_cert=True)
+        configs = [
+            self._create_config(device=self._create_device(name=name, mac_address=mac))
+            for name, mac in [('d1', '00:11:22:33:44:51'), ('d2', '00:11:22:33:44:52')]
+        ]
+        with mock.patch.object(create_vpn_client_certs, 'delay') as mocked_delay:
+            for config in configs:
+                config.templates.add(template)
+                client = config.vpnclient_set.get()
+                self.assertIsNone(client.cert)
+        self.assertEqual(mocked_delay.call_count, 2)
+        device = configs[0].device
+
+        with self.subTest('configuration is held back until the certificate exists'):
+            self.assertTrue(configs[0].vpn_certs_pending)
+            for name in ['device_checksum', 'device_download_config']:
+                url = reverse(f'controller:{name}', args=[device.pk])
+                response = self.client.get(url, {'key': device.key})
+                self.assertEqual(response.status_code, 503)
+                self.assertEqual(response['Retry-After'], '60')
+
+        # generates the certificates of both configs in one batch
+        with catch_signal(config_modified) as handler:
+            create_vpn_client_certs.delay([str(config.pk) for config in configs])
+        self.assertEqual(handler.call_count, 2)
+        self.assertEqual(handler.call_args[1]['action'], 'related_certificate_changed')
+        for config in configs:
+            config.refresh_from_db()
+            self.assertEqual(config.status, 'modified')
+            self.assertFalse(config.vpn_certs_pending)
+        url = reverse('controller:device_checksum', args=[device.pk])
+        response = self.client.get(url, {'key': device.key})
+        self.assertEqual(response.status_code, 200)
+        # the in-memory checksum was calculated before the certificate existed
+        checksum = Config.objects.get(pk=configs[0].pk).checksum
+        self.assertEqual(response.content.decode(), checksum)
+        clients = VpnClient.objects.select_related('cert').filter(vpn=vpn)
+        self.assertEqual(len(clients), 2)
+        for client in clients:
+            self.assertIsNotNone(client.cert)
+            self.assertEqual(client.cert.ca_id, vpn.ca_id)
+            self.assertIn('BEGIN CERTIFICATE', client.cert.certificate)
+            self.assertIn(client.config.device.name, client.cert.common_name)
+        self.assertEqual(len({client.cert.serial_number for client in clients}), 2)
+
+        with self.subTest('certificate is deleted with the VPN client'):
+            cert_pk = clients[0].cert_id
+            clients[0].config.delete()
+            self.assertFalse(Cert.objects.filter(pk=cert_pk).exists())
+
+        with self.subTest('VPN client without certificate can be deleted'):
+            config = self._create_config(
+                device=self._create_device(name='d3', mac_address='00:11:22:33:44:53')
+            )
+            with mock.patch.object(create_vpn_client_certs, 'delay'):
+                config.templates.add(template)
+            config.delete()
+            self.assertFalse(VpnClient.objects.filter(config=config).exists())
+
+    @mock.patch.object(app_settings, 'ASYNC_VPN_CLIENT_CERTS', True)
+    def test_vpn_client_certs_async_failure(self):
+        vpn = self._create_vpn()
+        template = self._create_template(type='vpn', vpn=vpn, auto_cert=True)
+        config = self._create_config(organization=self._get_org())
+        with mock.patch.object(create_vpn_client_certs, 'delay'):
+            config.templates.add(template)
+        pk_list = [str(config.pk)]
+
+        with self.subTest('configuration stays held back if the generation fails'):
+            with mock.patch.object(
+                VpnClient, 'bulk_create_certs', side_effect=ValueError('failure')
+            ), mock.patch('logging.Logger.exception') as mocked_logger, catch_signal(
+                config_modified
+            ) as handler:
+                create_vpn_client_certs.delay(pk_list)
+            mocked_logger.assert_called_once()
+            handler.assert_not_called()
+            config.refresh_from_db()
+            self.assertTrue(config.vpn_certs_pending)
+            self.assertIsNone(config.vpnclient_set.get().cert)
+
+        with self.subTest('recently flagged configurations are not retried'):
+            with mock.patch.object(create_vpn_client_certs, 'delay') as mocked_delay:
+                retry_pending_vpn_client_certs.delay()
+            mocked_delay.assert_not_called()
+
+        with self.subTest('pending certificates are generated again'):
+            past = timezone.now() - timedelta(hours=1)
+            Config.objects.filter(pk=config.pk).update(modified=past)
+            with mock.patch.object(create_vpn_client_certs, 'delay') as mocked_delay:
+                retry_pending_vpn_client_certs.delay()
+            mocked_delay.assert_called_once_with(pk_list)
+            with catch_signal(config_modified) as handler:
+                create_vpn_client_certs.delay(pk_list)
+            handler.assert_called_once()
+            config.refresh_from_db()
+            self.assertFalse(config.vpn_certs_pending)
+            self.assertIsNotNone(config.vpnclient_set.get().cert)
+
+    def test_vpn_client_certs_bulk_renew(self):
+        vpn = self._create_vpn()
+        template = self._create_template(type='vpn', vpn=vpn, auto_cert=True)
+        config = self._create_config(organization=self._get_org())
+        config.templates.add(template)
+        config.set_status_applied()
+        cert = config.vpnclient_set.get().cert
+        old_serial_number = cert.serial_number
+        Cert.start_bulk_job('renew', [cert.pk])
+        cert.refresh_from_db()
+        self.assertNotEqual(cert.serial_number, old_serial_number)
+        config.refresh_from_db()
+        self.assertEqual(config.status, 'modified')
+        self.assertIsNotNone(config.checksum_db)
+
+    @mock.patch.object(app_settings, 'VPN_CLIENT_CERT_RENEWAL_BATCH_SIZE', 1)
+    def test_renew_expiring_vpn_client_certs(self):
+        vpn = self._create_vpn()
+        template = self._create_template(type='vpn', vpn=vpn, auto_cert=True)
+        configs = []
+        for name, mac, days in [
+            ('d1', '00:11:22:33:44:51', 5),
+            ('d2', '00:11:22:33:44:52', 10),
+            ('d3', '00:11:22:33:44:53', 365),
+        ]:
+            config = self._create_config(
+                device=self._create_device(name=name, mac_address=mac)
+            )
+            config.templates.add(template)
+            config.set_status_applied()
+            Cert.objects.filter(vpnclient__config=config).update(
+                validity_end=timezone.now() + timedelta(days=days)
+            )
+            configs.append(config)
+        serial_numbers = list(
+            Cert.objects.filter(vpnclient__config__in=configs)
+            .order_by('validity_end')
+            .values_list('serial_number', flat=True)
+        )
+
+        def assert_renewed(renewed):
+            for config, serial_number, expected in zip(
+                configs, serial_numbers, renewed
+            ):
+                config.refresh_from_db()
+                cert = config.vpnclient_set.get().cert
+                self.assertEqual(cert.serial_number != serial_number, expected)
+                self.assertEqual(config.status == 'modified', expected)
+
+        # the certificate which expires first is renewed first
+        renew_expiring_vpn_client_certs.delay()
+        assert_renewed([True, False, False])
+        renew_expiring_vpn_client_certs.delay()
+        assert_renewed([True, True, False])
+        renew_expiring_vpn_client_certs.delay()
+        assert_renewed([True, True, False])
+
+    @mock.patch.object(app_settings, 'DH_POOL_SIZE', 2)
+    @mock.patch.object(Vpn, 'dhparam')
+    def test_dh_pool(self, dhparam):
+        dhparam.return_value = self._dh
+
+        with self.subTest('empty pool is filled'):
+            with mock.patch.object(create_vpn_dh, 'delay') as mocked_create_vpn_dh:
+                vpn = self._create_vpn(name='vpn0', dh='')
+            mocked_create_vpn_dh.assert_called_once_with(vpn.pk)
+            self.assertEqual(dhparam.call_count, 2)
+            self.assertEqual(DhParameters.objects.filter(length=2048).count(), 2)
+            vpn.delete()
+
+        DhParameters.objects.all().delete()
+        dhparam.reset_mock()
+        refill_dh_pool.delay()
+        self.assertEqual(dhparam.call_count, 2)
+        self.assertEqual(DhParameters.objects.filter(length=2048).count(), 2)
+
+        with self.subTest('VPN server takes DH parameters from the pool'):
+            with mock.patch.object(create_vpn_dh, 'delay') as mocked_create_vpn_dh:
+                vpn = self._create_vpn(dh='')
+            mocked_create_vpn_dh.assert_not_called()
+            vpn.refresh_from_db()
+            self.assertEqual(vpn.dh, self._dh)
+            # the missing set has been generated again
+            self.assertEqual(dhparam.call_count, 3)
+            self.assertEqual(DhParameters.objects.count(), 2)
+
+        with self.subTest('pool disabled'):
+            with mock.patch.object(app_settings, 'DH_POOL_SIZE', 0), mock.patch.object(
+                create_vpn_dh, 'delay'
+            ) as mocked_create_vpn_dh:
+                vpn = self._create_vpn(name='vpn2', dh='')
+            mocked_create_vpn_dh.assert_called_once_with(vpn.pk)
+            self.assertEqual(vpn.dh, Vpn._placeholder_dh)
+            self.assertEqual(DhParameters.objects.count(), 2)
@@ -1,10 +1,20 @@
 import logging
+import random
+import time
+from hashlib import md5
 
+from cache_memoize import cache_memoize
 from django.conf.urls import url
+from django.core.cache import cache
 from django.core.exceptions import ValidationError
 from django.db.models import Q
 from django.http import Http404, HttpResponse
 from django.shortcuts import get_object_or_404 as base_get_object_or_404
+from django.utils.cache import parse_etags, quote_etag
+from swapper import load_model
+
+from . import settings as app_settings
+from .tasks import update_device_ips
 
 logger = logging.getLogger(__name__)
 
@@ -37,6 +47,43 @@ def send_file(filename, contents):
     """
     response = ControllerResponse(contents, content_type='application/octet-stream')
     response['Content-Disposition'] = 'attachment; filename={0}'.format(filename)
+    # same value returned by the checksum views
+    response['ETag'] = quote_etag(md5(contents).hexdigest())
+    return response
+
+
+def get_not_modified_response(request, get_checksum):
+    """
+    returns a ``ControllerResponse`` with status code 304 if the
+    ``If-None-Match`` header of the request matches the checksum
+    returned by ``get_checksum`` (called only if the header is present)
+    """
+    if_none_match = request.META.get('HTTP_IF_NONE_MATCH')
+    if not if_none_match:
+        return None
+    # weak comparison is used for If-None-Match (RFC 7232)
+    etags = [
+        etag[2:] if etag.startswith('W/') else etag
+        for etag in parse_etags(if_none_match)
+    ]
+    etag = quote_etag(get_checksum())
+    if etag not in etags and '*' not in etags:
+        return None
+    response = ControllerResponse(status=304)
+    response['ETag'] = etag
+    return response
+
+
+def get_retry_response(retry_after=60):
+    """
+    returns a ``ControllerResponse`` with status code 503 which tells
+    the device to try again after ``retry_after`` seconds, used while
+    its configuration is not ready (see ``Config.vpn_certs_pending``)
+    """
+    response = ControllerResponse(
+        'error: configuration not ready\n', content_type='text/plain', status=503
+    )
+    response['Retry-After'] = str(retry_after)
     return response
 
 
@@ -61,10 +108,7 @@ def send_vpn_config(vpn, request):
     )
 
 
-def update_last_ip(device, request):
-    """
-    updates ``last_ip`` if necessary
-    """
+def _set_ip_fields(device, request):
     ip = request.META.get('REMOTE_ADDR')
     management_ip = request.GET.get('management_ip')
     update_fields = []
@@ -75,12 +119,182 @@ def update_last_ip(device, request):
     if device.management_ip != management_ip:
         device.management_ip = management_ip
         update_fields.append('management_ip')
-    if update_fields:
+    return update_fields
+
+
+def update_last_ip(device, request):
+    """
+    updates ``last_ip`` if necessary
+    """
+    update_fields = _set_ip_fields(device, request)
+    if update_fields and app_settings.IP_WRITE_BEHIND:
+        buffer_device_ips(device)
+    elif update_fields:
         device.save(update_fields=update_fields)
 
     return bool(update_fields)
 
 
+def defer_last_ip_update(device, request):
+    """
+    like ``update_last_ip`` but the database is always
+    updated in the background (used by ``device_checksum_async``)
+    """
+    update_fields = _set_ip_fields(device, request)
+    if update_fields and app_settings.IP_WRITE_BEHIND:
+        buffer_device_ips(device)
+    elif update_fields:
+        update_device_ips.delay(device.pk, device.last_ip, device.management_ip)
+
+    return bool(update_fields)
+
+
+_IP_BUFFER_COUNTER_KEY = 'device_ip_buffer_counter'
+_IP_BUFFER_FLUSHED_KEY = 'device_ip_buffer_flushed'
+_IP_BUFFER_RETRY_KEY = 'device_ip_buffer_retry'
+_IP_BUFFER_TIMEOUT = 60 * 60 * 24  # 24 hours
+
+
+def _get_ip_buffer_slot_key(index):
+    return f'device_ip_buffer_{index}'
+
+
+def buffer_device_ips(device):
+    """
+    stores the IP addresses of the device in the cache,
+    they're written to the database in bulk by the
+    ``flush_device_ip_buffer`` celery task
+    """
+    cache.add(_IP_BUFFER_COUNTER_KEY, 0, timeout=None)
+    index = cache.incr(_IP_BUFFER_COUNTER_KEY)
+    cache.set(
+        _get_ip_buffer_slot_key(index),
+        (str(device.pk), device.last_ip, device.management_ip),
+        _IP_BUFFER_TIMEOUT,
+    )
+
+
+def pop_buffered_device_ips():
+    """
+    removes the IP addresses from the buffer and returns the
+    most recent ones of each device, eg:
+    ``{'<device pk>': {'last_ip': '<ip>', 'management_ip': '<ip>'}}``
+    """
+    counter = cache.get(_IP_BUFFER_COUNTER_KEY, 0)
+    flushed = cache.get(_IP_BUFFER_FLUSHED_KEY, 0)
+    # the counter has been evicted from the cache
+    if counter < flushed:
+        flushed = 0
+    # slots which were still being written during the previous flush
+    retry = cache.get(_IP_BUFFER_RETRY_KEY, [])
+    indexes = retry + list(range(flushed + 1, counter + 1))
+    keys = [_get_ip_buffer_slot_key(index) for index in indexes]
+    slots = cache.get_many(keys)
+    cache.set_many(
+        {
+            _IP_BUFFER_FLUSHED_KEY: counter,
+            # missing slots are retried only once
+            _IP_BUFFER_RETRY_KEY: [
+                index
+                for index, key in zip(indexes, keys)
+                if key not in slots and index > flushed
+            ],
+        },
+        timeout=None,
+    )
+    cache.delete_many(list(slots.keys()))
+    device_ips = {}
+    # slots are ordered, hence the most recent addresses prevail
+    for key in keys:
+        if key not in slots:
+            continue
+        pk, last_ip, management_ip = slots[key]
+        device_ips[pk] = {'last_ip': last_ip, 'management_ip': management_ip}
+    return device_ips
+
+
+_POLL_RATE_WINDOW = 60  # seconds
+_POLLING_INTERVAL_CACHE_TIMEOUT = 60 * 60 * 24  # 24 hours
+
+
+def _get_poll_rate_cache_key(window):
+    return f'controller_poll_rate_{window}'
+
+
+def track_poll():
+    """
+    counts the polls received by the controller in the current time window
+    """
+    key = _get_poll_rate_cache_key(int(time.time() // _POLL_RATE_WINDOW))
+    try:
+        cache.incr(key)
+    # first poll of the time window
+    except ValueError:
+        cache.add(key, 1, timeout=_POLL_RATE_WINDOW * 2)
+
+
+def get_poll_rate():
+    """
+    returns the polls per second received in the last complete time window
+    """
+    window = int(time.time() // _POLL_RATE_WINDOW) - 1
+    return cache.get(_get_poll_rate_cache_key(window), 0) / _POLL_RATE_WINDOW
+
+
+@cache_memoize(timeout=_POLLING_INTERVAL_CACHE_TIMEOUT)
+def get_organization_polling_interval(organization_id):
+    """
+    returns the polling interval of the organization (may be ``None``)
+    """
+    OrganizationConfigSettings = load_model('config', 'OrganizationConfigSettings')
+    return (
+        OrganizationConfigSettings.objects.filter(organization_id=organization_id)
+        .values_list('polling_interval', flat=True)
+        .first()
+    )
+
+
+def invalidate_organization_polling_interval(instance, **kwargs):
+    """
+    Called from signal receiver which performs cache invalidation
+    """
+    get_organization_polling_interval.invalidate(instance.organization_id)
+
+
+def get_polling_interval(organization_id):
+    """
+    returns the polling interval suggested to devices, which is:
+        - increased proportionally if the current poll rate
+          exceeds ``POLLING_MAX_RATE``
+        - randomized by ``POLLING_INTERVAL_JITTER`` in order to
+          spread the load of devices which poll at the same time
+    """
+    interval = (
+        get_organization_polling_interval(organization_id)
+        or app_settings.POLLING_INTERVAL
+    )
+    if app_settings.POLLING_MAX_RATE:
+        rate = get_poll_rate()
+        if rate > app_settings.POLLING_MAX_RATE:
+            interval *= rate / app_settings.POLLING_MAX_RATE
+    jitter = interval * app_settings.POLLING_INTERVAL_JITTER
+    return max(round(interval + random.uniform(-jitter, jitter)), 1)
+
+
+def set_polling_interval_header(response, organization_id):
+    """
+    adds the polling interval hint to the response (if enabled),
+    the poll rate is tracked only if ``POLLING_MAX_RATE`` is set
+    """
+    if not app_settings.POLLING_INTERVAL:
+        return response
+    if app_settings.POLLING_MAX_RATE:
+        track_poll()
+    interval = get_polling_interval(organization_id)
+    response['X-Openwisp-Controller-Polling-Interval'] = str(interval)
+    return response
+
+
 def forbid_unallowed(request, param_group, param, allowed_values=None):
     """
     checks for malformed requests - eg: missing parameters (HTTP 400)
@@ -113,10 +327,17 @@ def get_controller_urls(views_module):
     """
     used by third party apps to reduce boilerplate
     """
+
+    device_checksum = views_module.device_checksum
+    # the async variant is used only if enabled and available
+    if app_settings.ASYNC_CHECKSUM_VIEW:
+        device_checksum = getattr(
+            views_module, 'device_checksum_async', device_checksum
+        )
     urls = [
         url(
             r'^controller/device/checksum/(?P<pk>[^/]+)/$',
-            views_module.device_checksum,
+            device_checksum,
             name='device_checksum',
         ),
         url(
@@ -152,7 +373,7 @@ def get_controller_urls(views_module):
         # legacy URLs
         url(
             r'^controller/checksum/(?P<pk>[^/]+)/$',
-            views_module.device_checksum,
+            device_checksum,
             name='checksum_legacy',
         ),
         url(
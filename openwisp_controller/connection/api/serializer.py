@@ -4,6 +4,7 @@ from swapper import load_model
 from openwisp_users.api.mixins import FilterSerializerByOrgManaged
 from openwisp_utils.api.serializers import ValidatedModelSerializer
 
+BatchCommand = load_model('connection', 'BatchCommand')
 Command = load_model('connection', 'Command')
 DeviceConnection = load_model('connection', 'DeviceConnection')
 Credentials = load_model('connection', 'Credentials')
@@ -33,6 +34,7 @@ class CommandSerializer(serializers.ModelSerializer):
         fields = '__all__'
         read_only_fields = [
             'device',
+            'batch',
             'output',
             'status',
             'created',
@@ -86,3 +88,29 @@ class DeviceConnectionSerializer(
         instance = self.instance or self.Meta.model(**data)
         instance.full_clean()
         return data
+
+
+class BatchCommandSerializer(FilterSerializerByOrgManaged, ValidatedModelSerializer):
+    input = serializers.JSONField(allow_null=True, required=False)
+    filters = serializers.JSONField(required=False)
+    progress = serializers.SerializerMethodField()
+
+    class Meta:
+        model = BatchCommand
+        fields = (
+            'id',
+            'organization',
+            'group',
+            'filters',
+            'type',
+            'input',
+            'concurrency',
+            'status',
+            'progress',
+            'created',
+            'modified',
+        )
+        read_only_fields = ('status', 'created', 'modified')
+
+    def get_progress(self, obj):
+        return obj.get_progress()
@@ -40,6 +40,21 @@ def get_api_urls(api_views):
             api_views.deviceconnection_details_view,
             name='deviceconnection_detail',
         ),
+        path(
+            'api/v1/controller/batch-command/',
+            api_views.batch_command_list_create_view,
+            name='batch_command_list',
+        ),
+        path(
+            'api/v1/controller/batch-command/<uuid:pk>/',
+            api_views.batch_command_detail_view,
+            name='batch_command_detail',
+        ),
+        path(
+            'api/v1/controller/batch-command/<uuid:pk>/results/',
+            api_views.batch_command_result_list_view,
+            name='batch_command_results',
+        ),
     ]
 
 
@@ -4,6 +4,7 @@ from rest_framework.authentication import SessionAuthentication
 from rest_framework.exceptions import NotFound
 from rest_framework.generics import (
     GenericAPIView,
+    ListAPIView,
     ListCreateAPIView,
     RetrieveAPIView,
     RetrieveUpdateDestroyAPIView,
@@ -13,15 +14,17 @@ from rest_framework.permissions import IsAuthenticated
 from swapper import load_model
 
 from openwisp_users.api.authentication import BearerAuthentication
-from openwisp_users.api.mixins import FilterByOrganizationManaged
+from openwisp_users.api.mixins import FilterByOrganizationManaged, FilterByParentManaged
 from openwisp_users.api.permissions import DjangoModelPermissions
 
 from .serializer import (
+    BatchCommandSerializer,
     CommandSerializer,
     CredentialSerializer,
     DeviceConnectionSerializer,
 )
 
+BatchCommand = load_model('connection', 'BatchCommand')
 Command = load_model('connection', 'Command')
 Device = load_model('config', 'Device')
 Credentials = load_model('connection', 'Credentials')
@@ -153,9 +156,49 @@ class DeviceConnectionDetailView(BaseDeviceConection, RetrieveUpdateDestroyAPIVi
         return obj
 
 
+class BatchCommandListCreateView(ProtectedAPIMixin, ListCreateAPIView):
+    queryset = BatchCommand.objects.select_related('organization').order_by('-created')
+    serializer_class = BatchCommandSerializer
+    pagination_class = ListViewPagination
+
+
+class BatchCommandDetailView(ProtectedAPIMixin, RetrieveAPIView):
+    queryset = BatchCommand.objects.select_related('organization')
+    serializer_class = BatchCommandSerializer
+
+
+class BatchCommandResultListView(FilterByParentManaged, ListAPIView):
+    """
+    returns the commands executed on each device, the most
+    recently updated are listed last, can be filtered by status
+    """
+
+    authentication_classes = [BearerAuthentication, SessionAuthentication]
+    permission_classes = [IsAuthenticated, DjangoModelPermissions]
+    serializer_class = CommandSerializer
+    pagination_class = ListViewPagination
+    queryset = Command.objects.none()
+
+    def get_parent_queryset(self):
+        return BatchCommand.objects.filter(pk=self.kwargs['pk'])
+
+    def get_queryset(self):
+        super().get_queryset()
+        qs = Command.objects.filter(batch_id=self.kwargs['pk']).select_related(
+            'device'
+        )
+        status = self.request.query_params.get('status')
+        if status:
+            qs = qs.filter(status=status)
+        return qs.order_by('modified')
+
+
 command_list_create_view = CommandListCreateView.as_view()
 command_details_view = CommandDetailsView.as_view()
 credential_list_create_view = CredentialListCreateView.as_view()
 credential_detail_view = CredentialDetailView.as_view()
 deviceconnection_list_create_view = DeviceConnenctionListCreateView.as_view()
 deviceconnection_details_view = DeviceConnectionDetailView.as_view()
+batch_command_list_create_view = BatchCommandListCreateView.as_view()
+batch_command_detail_view = BatchCommandDetailView.as_view()
+batch_command_result_list_view = BatchCommandResultListView.as_view()
@@ -1,7 +1,7 @@
 from asgiref.sync import async_to_sync
-from celery.task.control import inspect
 from channels import layers
 from django.apps import AppConfig
+from django.core.cache import cache
 from django.db import transaction
 from django.db.models.signals import post_save
 from django.utils.translation import ugettext_lazy as _
@@ -11,11 +11,10 @@ from swapper import get_model_name, load_model
 
 from openwisp_utils.admin_theme.menu import register_menu_subitem
 
-from ..config.signals import config_modified
+from ..config.signals import config_modified, config_modified_bulk, devices_imported
+from . import settings as app_settings
 from .signals import is_working_changed
 
-_TASK_NAME = 'openwisp_controller.connection.tasks.update_config'
-
 
 class ConnectionConfig(AppConfig):
     name = 'openwisp_controller.connection'
@@ -24,7 +23,8 @@ class ConnectionConfig(AppConfig):
 
     def ready(self):
         """
-        connects the ``config_modified`` signal
+        connects the ``config_modified`` and
+        ``config_modified_bulk`` signals
         to the ``update_config`` celery task
         which will be executed in the background
         """
@@ -39,12 +39,20 @@ class ConnectionConfig(AppConfig):
         config_modified.connect(
             self.config_modified_receiver, dispatch_uid='connection.update_config'
         )
+        config_modified_bulk.connect(
+            self.config_modified_bulk_receiver,
+            dispatch_uid='connection.update_config_bulk',
+        )
 
         post_save.connect(
             Credentials.auto_add_credentials_to_device,
             sender=Config,
             dispatch_uid='connection.auto_add_credentials',
         )
+        devices_imported.connect(
+            Credentials.auto_add_credentials_to_devices,
+            dispatch_uid='connection.auto_add_credentials_bulk',
+        )
         is_working_changed.connect(
             self.is_working_changed_receiver,
             sender=load_model('connection', 'DeviceConnection'),
@@ -59,6 +67,12 @@ class ConnectionConfig(AppConfig):
 
     @classmethod
     def config_modified_receiver(cls, **kwargs):
+        # handled once per chunk by config_modified_bulk_receiver
+        if kwargs.get('action') in [
+            'related_template_changed',
+            'related_certificate_changed',
+        ]:
+            return
         device = kwargs['device']
         conn_count = device.deviceconnection_set.count()
         # if device has no connection specified stop here
@@ -66,6 +80,21 @@ class ConnectionConfig(AppConfig):
             return
         transaction.on_commit(lambda: cls._launch_update_config(device.pk))
 
+    @classmethod
+    def config_modified_bulk_receiver(cls, instances, **kwargs):
+        DeviceConnection = load_model('connection', 'DeviceConnection')
+        # looks up with one query which devices have a connection specified
+        device_pks = set(
+            DeviceConnection.objects.filter(
+                device_id__in=[config.device_id for config in instances]
+            ).values_list('device_id', flat=True)
+        )
+        if not device_pks:
+            return
+        transaction.on_commit(
+            lambda: [cls._launch_update_config(pk) for pk in device_pks]
+        )
+
     @classmethod
     def command_save_receiver(cls, sender, created, instance, **kwargs):
         from .api.serializer import CommandSerializer
@@ -83,26 +112,27 @@ class ConnectionConfig(AppConfig):
     @classmethod
     def _launch_update_config(cls, device_pk):
         """
-        Calls the background task update_config only if
-        no other tasks are running for the same device
+        Schedules the background task update_config only if
+        no other task is already queued for the same device;
+        the task is delayed in order to wait for the saving
+        operations of the device to complete (there may be
+        multiple ones happening in a short time)
         """
-        if cls._is_update_in_progress(device_pk):
-            return
-        from .tasks import update_config
-
-        update_config.delay(device_pk)
+        from .tasks import (
+            UPDATE_CONFIG_LOCK_TIMEOUT,
+            UPDATE_CONFIG_PENDING_KEY,
+            update_config,
+        )
 
-    @classmethod
-    def _is_update_in_progress(cls, device_pk):
-        active = inspect().active()
-        if not active:
-            return False
-        # check if there's any other running task before adding it
-        for task_list in active.values():
-            for task in task_list:
-                if task['name'] == _TASK_NAME and str(device_pk) in task['args']:
-                    return True
-        return False
+        delay = app_settings.UPDATE_CONFIG_DELAY
+        # the queued task will push the latest changes too
+        if not cache.add(
+            UPDATE_CONFIG_PENDING_KEY.format(device_pk),
+            True,
+            timeout=UPDATE_CONFIG_LOCK_TIMEOUT + delay,
+        ):
+            return
+        update_config.apply_async((device_pk,), countdown=delay)
 
     @classmethod
     def is_working_changed_receiver(
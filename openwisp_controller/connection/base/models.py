@@ -1,9 +1,18 @@
 import collections
 import logging
+import time
+from datetime import timedelta
+from uuid import uuid4
 
 import jsonschema
+from asgiref.sync import async_to_sync
+from channels import layers
+from django.core.cache import cache
 from django.core.exceptions import ValidationError
+from django.core.validators import MaxValueValidator, MinValueValidator
 from django.db import models, transaction
+from django.db.models import Count, Value
+from django.db.models.functions import Concat
 from django.utils import timezone
 from django.utils.functional import cached_property
 from django.utils.module_loading import import_string
@@ -14,6 +23,7 @@ from jsonschema.exceptions import ValidationError as SchemaError
 from swapper import get_model_name, load_model
 
 from openwisp_controller.config.base.base import BaseModel
+from openwisp_users.mixins import OrgMixin
 from openwisp_utils.base import TimeStampedEditableModel
 
 from ...base import ShareableOrgMixinUniqueName
@@ -25,7 +35,12 @@ from ..commands import (
     get_command_schema,
 )
 from ..signals import is_working_changed
-from ..tasks import auto_add_credentials_to_devices, launch_command
+from ..tasks import (
+    auto_add_credentials_to_devices,
+    execute_batch_command,
+    launch_batch_command,
+    launch_command,
+)
 
 logger = logging.getLogger(__name__)
 
@@ -178,6 +193,26 @@ class AbstractCredentials(ConnectorMixin, ShareableOrgMixinUniqueName, BaseModel
             conn.full_clean()
             conn.save()
 
+    @classmethod
+    def auto_add_credentials_to_devices(cls, instances, organization, **kwargs):
+        """
+        Like ``auto_add_credentials_to_device`` but for devices which
+        are created in bulk, called from a ``devices_imported``
+        signal receiver, uses one query per credentials object
+        """
+        DeviceConnection = load_model('connection', 'DeviceConnection')
+        conditions = models.Q(organization=organization) | models.Q(organization=None)
+        device_connections = []
+        for cred in cls.objects.filter(conditions).filter(auto_add=True):
+            for device in instances:
+                conn = DeviceConnection(device=device, credentials=cred, enabled=True)
+                # skips the queries which check the existence of related objects
+                conn.full_clean(exclude=['device', 'credentials'])
+                device_connections.append(conn)
+        DeviceConnection.objects.bulk_create(
+            device_connections, batch_size=cls.chunk_size
+        )
+
 
 class AbstractDeviceConnection(ConnectorMixin, TimeStampedEditableModel):
     _connector_field = 'update_strategy'
@@ -328,7 +363,13 @@ class AbstractCommand(TimeStampedEditableModel):
         ('in-progress', _('in progress')),
         ('success', _('success')),
         ('failed', _('failed')),
+        # waiting to be executed by a batch command
+        ('scheduled', _('scheduled')),
     )
+    # seconds between each save of the partial
+    # output while the command is running
+    output_save_interval = 2
+
     device = models.ForeignKey(
         get_model_name('config', 'Device'), on_delete=models.CASCADE
     )
@@ -351,6 +392,13 @@ class AbstractCommand(TimeStampedEditableModel):
         dump_kwargs={'indent': 4},
     )
     output = models.TextField(blank=True)
+    batch = models.ForeignKey(
+        get_model_name('connection', 'BatchCommand'),
+        on_delete=models.SET_NULL,
+        related_name='commands',
+        null=True,
+        blank=True,
+    )
 
     class Meta:
         verbose_name = _('Command')
@@ -444,11 +492,15 @@ class AbstractCommand(TimeStampedEditableModel):
         # if couldn't connect to device, stop here
         if not self.connection.is_working:
             return None
+        self._unsaved_output = ''
+        self._output_saved_at = time.monotonic()
         # custom commands, perform each one separately and save output incrementally
         if self.is_custom:
             command = self.custom_command
             output, exit_code = self.connection.connector_instance.exec_command(
-                command, raise_unexpected_exit=False
+                command,
+                raise_unexpected_exit=False,
+                output_callback=self._stream_output,
             )
         # default commands
         elif self.is_default_command:
@@ -458,7 +510,9 @@ class AbstractCommand(TimeStampedEditableModel):
         else:
             command = self._callable(**self.input)
             output, exit_code = self.connection.connector_instance.exec_command(
-                command, raise_unexpected_exit=False
+                command,
+                raise_unexpected_exit=False,
+                output_callback=self._stream_output,
             )
         self._add_output(output)
         # if got non zero exit code, add extra info
@@ -470,6 +524,32 @@ class AbstractCommand(TimeStampedEditableModel):
         self.connection.disconnect()
         return exit_code
 
+    def _stream_output(self, output):
+        """
+        sends each chunk of output to the websocket clients while the
+        command is running and periodically appends the output received
+        in the meantime to the partial output saved in the database
+        """
+        self._unsaved_output += output
+        channel_layer = layers.get_channel_layer()
+        async_to_sync(channel_layer.group_send)(
+            f'config.device-{self.device_id}',
+            {
+                'type': 'send.update',
+                'model': 'CommandOutput',
+                'data': {'id': str(self.pk), 'output': output},
+            },
+        )
+        now = time.monotonic()
+        if now - self._output_saved_at < self.output_save_interval:
+            return
+        # does not emit post_save, the whole command is sent once completed
+        self._meta.model.objects.filter(pk=self.pk).update(
+            output=Concat('output', Value(self._unsaved_output))
+        )
+        self._unsaved_output = ''
+        self._output_saved_at = now
+
     def _execute_predefined_command(self):
         method = getattr(self.connection.connector_instance, self.type)
         return method(*self.arguments)
@@ -536,3 +616,289 @@ class AbstractCommand(TimeStampedEditableModel):
                 f'arguments property is not applicable in '
                 f'command instance of type "{self.type}"'
             )
+
+
+class AbstractBatchCommand(OrgMixin, TimeStampedEditableModel):
+    """
+    Executes a command on the devices of an organization
+    (or of a device group) which have an enabled connection.
+
+    One ``Command`` object is created for each device, the commands
+    are executed by ``execute_batch_command`` background tasks, at most
+    ``concurrency`` tasks are running at the same time for each batch.
+
+    Each task executes one command and schedules itself again (a "worker"
+    occupying one of the ``concurrency`` slots), workers which are lost
+    (eg: because a celery worker died) are restarted by ``recover``.
+    """
+
+    STATUS_CHOICES = (
+        ('in-progress', _('in progress')),
+        ('success', _('success')),
+        ('failed', _('failed')),
+    )
+    # controls the number of commands created with one query
+    chunk_size = 1000
+    # lookups which can be used in ``filters`` to select the devices
+    allowed_filters = (
+        'name__icontains',
+        'model__icontains',
+        'os__icontains',
+        'system__icontains',
+        'config__status',
+        'config__backend',
+        'config__templates',
+    )
+    # a worker which did not report for longer than this amount of
+    # seconds is considered lost: it exceeds the time limit of the
+    # ``execute_batch_command`` task and the rate limit delay
+    _WORKER_TIMEOUT = int(app_settings.SSH_COMMAND_TIMEOUT * 1.2) * 2 + 60
+
+    group = models.ForeignKey(
+        get_model_name('config', 'DeviceGroup'),
+        verbose_name=_('device group'),
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        help_text=_(
+            'leave blank to execute the command on '
+            'all the devices of the organization'
+        ),
+    )
+    status = models.CharField(
+        max_length=12, choices=STATUS_CHOICES, default=STATUS_CHOICES[0][0]
+    )
+    type = models.CharField(max_length=16, choices=COMMAND_CHOICES)
+    input = JSONField(
+        blank=True,
+        null=True,
+        load_kwargs={'object_pairs_hook': collections.OrderedDict},
+        dump_kwargs={'indent': 4},
+    )
+    filters = JSONField(
+        _('device filters'),
+        blank=True,
+        default=dict,
+        load_kwargs={'object_pairs_hook': collections.OrderedDict},
+        dump_kwargs={'indent': 4},
+        help_text=_(
+            'selects the devices with lookups on their attributes, '
+            'eg: {"model__icontains": "tl-wdr"}'
+        ),
+    )
+    concurrency = models.PositiveSmallIntegerField(
+        _('concurrency'),
+        default=10,
+        validators=[MinValueValidator(1), MaxValueValidator(100)],
+        help_text=_('maximum number of devices processed at the same time'),
+    )
+
+    class Meta:
+        verbose_name = _('Batch command')
+        verbose_name_plural = _('Batch commands')
+        abstract = True
+        ordering = ('created',)
+
+    def __str__(self):
+        command = self.input['command'] if self.type == 'custom' else None
+        return f'«{command or self.get_type_display()}» ({self.organization})'
+
+    def clean(self):
+        self._validate_org_relation('group', field_error='group')
+        self._validate_filters()
+        # the input is validated with the schema of the command type
+        self._get_command().clean()
+
+    def _validate_filters(self):
+        if not self.filters:
+            return
+        if not isinstance(self.filters, dict):
+            raise ValidationError({'filters': _('must be a JSON object')})
+        for lookup, value in self.filters.items():
+            if lookup not in self.allowed_filters:
+                raise ValidationError(
+                    {
+                        'filters': _('unsupported lookup "{lookup}"').format(
+                            lookup=lookup
+                        )
+                    }
+                )
+            if not isinstance(value, (str, int)):
+                raise ValidationError(
+                    {
+                        'filters': _('the value of "{lookup}" is not valid').format(
+                            lookup=lookup
+                        )
+                    }
+                )
+
+    def _get_command(self, **kwargs):
+        Command = load_model('connection', 'Command')
+        return Command(type=self.type, input=self.input, batch=self, **kwargs)
+
+    def save(self, *args, **kwargs):
+        """
+        Automatically schedules the execution
+        of batch commands upon creation.
+        """
+        adding = self._state.adding
+        if adding:
+            self.full_clean()
+        output = super().save(*args, **kwargs)
+        if adding:
+            transaction.on_commit(lambda: launch_batch_command.delay(self.pk))
+        return output
+
+    def get_devices(self):
+        Device = load_model('config', 'Device')
+        devices = Device.objects.filter(organization_id=self.organization_id)
+        if self.group_id:
+            devices = devices.filter(group_id=self.group_id)
+        if self.filters:
+            devices = devices.filter(**self.filters).distinct()
+        return devices
+
+    def launch(self):
+        """
+        creates the commands of the devices in bulk and starts
+        the background tasks which execute them, devices
+        without an enabled connection are skipped;
+        the commands are not created again if they exist already
+        (eg: if the task calling this method is retried)
+        """
+        if not self.commands.exists():
+            self._create_commands()
+        self.start_workers()
+
+    def _create_commands(self):
+        Command = load_model('connection', 'Command')
+        DeviceConnection = load_model('connection', 'DeviceConnection')
+        connections = DeviceConnection.objects.filter(
+            device__in=self.get_devices(), enabled=True
+        ).order_by('created')
+        device_connections = {}
+        for device_id, connection_id in connections.values_list('device_id', 'id'):
+            device_connections.setdefault(device_id, connection_id)
+        commands = [
+            self._get_command(
+                device_id=device_id, connection_id=connection_id, status='scheduled'
+            )
+            for device_id, connection_id in device_connections.items()
+        ]
+        # all or nothing, so that an interrupted launch can be repeated
+        with transaction.atomic():
+            Command.objects.bulk_create(commands, batch_size=self.chunk_size)
+
+    def start_workers(self):
+        """
+        starts the workers which execute the scheduled commands,
+        the slots occupied by running workers are skipped
+        """
+        scheduled = self.commands.filter(status='scheduled').count()
+        if not scheduled:
+            self.update_status()
+            return
+        for slot in range(min(self.concurrency, scheduled)):
+            token = uuid4().hex
+            if cache.add(self._get_worker_cache_key(slot), token, self._WORKER_TIMEOUT):
+                execute_batch_command.delay(self.pk, slot, token)
+
+    def keep_worker(self, slot, token):
+        """
+        called by a worker before each step, renews its slot;
+        returns ``False`` if the slot is occupied by another worker
+        (eg: a worker which was considered lost and has been replaced)
+        """
+        key = self._get_worker_cache_key(slot)
+        if cache.get(key) not in [None, token]:
+            return False
+        cache.set(key, token, self._WORKER_TIMEOUT)
+        return True
+
+    def stop_worker(self, slot, token):
+        """
+        releases the slot of a worker which has nothing left to do
+        """
+        key = self._get_worker_cache_key(slot)
+        if cache.get(key) == token:
+            cache.delete(key)
+
+    def recover(self):
+        """
+        fails the commands which have been in progress for longer than
+        the time limit of the tasks and restarts the workers which are
+        lost (eg: because the celery worker executing them died)
+        """
+        if not self.commands.exists():
+            self.launch()
+            return
+        limit = timezone.now() - timedelta(seconds=self._WORKER_TIMEOUT)
+        for command in self.commands.filter(status='in-progress', modified__lt=limit):
+            command.status = 'failed'
+            command._add_output(_('Background task interrupted.'))
+            command.save()
+        self.start_workers()
+
+    def _get_worker_cache_key(self, slot):
+        return f'connection_batch_command_worker_{self.pk}_{slot}'
+
+    def claim_command(self):
+        """
+        flags the next scheduled command as in progress and returns it,
+        the update is conditional so that each command is claimed by
+        one task only, returns ``None`` when there's nothing left to do
+        """
+        Command = load_model('connection', 'Command')
+        scheduled = self.commands.filter(status='scheduled')
+        while True:
+            pk = scheduled.values_list('pk', flat=True).first()
+            if pk is None:
+                return None
+            # modified is used to find commands whose task was lost
+            if Command.objects.filter(pk=pk, status='scheduled').update(
+                status='in-progress', modified=timezone.now()
+            ):
+                return Command.objects.select_related('device', 'connection').get(pk=pk)
+
+    def get_progress(self):
+        """
+        returns the number of commands in each status
+        """
+        Command = load_model('connection', 'Command')
+        progress = {status: 0 for status, label in Command.STATUS_CHOICES}
+        counts = self.commands.values('status').annotate(count=Count('pk'))
+        for item in counts.order_by():
+            progress[item['status']] = item['count']
+        progress['total'] = sum(progress.values())
+        return progress
+
+    def update_status(self):
+        """
+        sets the final status when all the commands have been executed
+        """
+        progress = self.get_progress()
+        if progress['scheduled'] or progress['in-progress']:
+            return
+        self.status = 'failed' if progress['failed'] else 'success'
+        self.save(update_fields=['status', 'modified'])
+
+    def get_rate_limit_delay(self):
+        """
+        counts the commands executed in the organization in the current
+        minute, returns the seconds to wait before executing another
+        command if ``BATCH_COMMAND_RATE_LIMIT`` has been reached
+        """
+        limit = app_settings.BATCH_COMMAND_RATE_LIMIT
+        if not limit:
+            return 0
+        window = int(time.time() // 60)
+        key = f'connection_batch_command_rate_{self.organization_id}_{window}'
+        cache.add(key, 0, timeout=120)
+        try:
+            count = cache.incr(key)
+        # the key has expired in the meantime
+        except ValueError:
+            count = 1
+        if count <= limit:
+            return 0
+        return 60 - time.time() % 60
@@ -0,0 +1,138 @@
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class SessionPool(object):
+    """
+    Keeps idle SSH sessions open in order to reuse them in the
+    following operations performed on the same device connection
+    (eg: executing a command right after pushing the configuration)
+    without repeating the TCP handshake, the key exchange and the
+    authentication.
+
+    Each worker process has its own pool: sessions are never shared
+    between processes and a session is handed out to one user at time.
+
+    Idle sessions are closed by a timer thread when they expire,
+    even if the pool is not used anymore.
+    """
+
+    def __init__(self, max_size, idle_timeout):
+        self.max_size = max_size
+        self.idle_timeout = idle_timeout
+        self._sessions = {}
+        self._lock = threading.Lock()
+        self._timer = None
+
+    def __len__(self):
+        return sum(len(sessions) for sessions in self._sessions.values())
+
+    def acquire(self, key):
+        """
+        returns a working idle session stored with ``key``,
+        ``None`` if no such session is available
+        """
+        with self._lock:
+            self._purge()
+            sessions = self._sessions.get(key, [])
+            while sessions:
+                client, _ = sessions.pop()
+                if self.is_healthy(client):
+                    logger.debug('reusing pooled SSH session')
+                    return client
+                client.close()
+        return None
+
+    def release(self, key, client):
+        """
+        stores ``client`` in the pool if it's still working,
+        the least recently used session is closed if the pool is full
+        """
+        if not self.max_size or not self.is_healthy(client):
+            client.close()
+            return
+        with self._lock:
+            self._purge()
+            if len(self) >= self.max_size:
+                self._close_least_recently_used()
+            self._sessions.setdefault(key, []).append((client, time.monotonic()))
+            self._schedule_purge()
+
+    def clear(self):
+        """
+        closes all the sessions
+        """
+        with self._lock:
+            for sessions in self._sessions.values():
+                for client, _ in sessions:
+                    client.close()
+            self._sessions = {}
+            if self._timer:
+                self._timer.cancel()
+                self._timer = None
+
+    @staticmethod
+    def is_healthy(client):
+        transport = client.get_transport()
+        if transport is None or not transport.is_active():
+            return False
+        try:
+            # detects connections dropped by the remote side
+            transport.send_ignore()
+        except Exception:
+            return False
+        return True
+
+    def _purge(self):
+        """
+        closes sessions which have been idle for too long
+        """
+        now = time.monotonic()
+        for key, sessions in list(self._sessions.items()):
+            for client, last_used in list(sessions):
+                if now - last_used >= self.idle_timeout:
+                    client.close()
+                    sessions.remove((client, last_used))
+            if not sessions:
+                del self._sessions[key]
+
+    def _schedule_purge(self):
+        """
+        starts a timer which purges the pool when the least recently
+        used session expires (must be called while holding the lock)
+        """
+        if self._timer or not self._sessions:
+            return
+        oldest = min(
+            last_used
+            for sessions in self._sessions.values()
+            for _, last_used in sessions
+        )
+        delay = max(oldest + self.idle_timeout - time.monotonic(), 0)
+        self._timer = threading.Timer(delay, self._purge_expired)
+        # does not prevent the process from exiting
+        self._timer.daemon = True
+        self._timer.start()
+
+    def _purge_expired(self):
+        with self._lock:
+            self._timer = None
+            self._purge()
+            self._schedule_purge()
+
+    def _close_least_recently_used(self):
+        key, session = min(
+            (
+                (key, session)
+                for key, sessions in self._sessions.items()
+                for session in sessions
+            ),
+            key=lambda item: item[1][1],
+        )
+        session[0].close()
+        self._sessions[key].remove(session)
+        if not self._sessions[key]:
+            del self._sessions[key]
@@ -1,8 +1,18 @@
+import codecs
+import hashlib
+import json
 import logging
+import os
+import select
 import socket
-from io import BytesIO, StringIO
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from io import StringIO
+from tempfile import SpooledTemporaryFile
 
 import paramiko
+from django.core.cache import cache
 from django.utils.functional import cached_property
 from django.utils.translation import gettext_lazy as _
 from jsonschema import validate
@@ -11,11 +21,34 @@ from scp import SCPClient
 
 from .. import settings as app_settings
 from .exceptions import CommandFailedException
+from .pool import SessionPool
 
 logger = logging.getLogger(__name__)
 
+_PREFERRED_ADDRESS_CACHE_TIMEOUT = 60 * 60 * 24 * 30
+
+session_pool = SessionPool(
+    max_size=app_settings.SSH_SESSION_POOL_MAX_SIZE,
+    idle_timeout=app_settings.SSH_SESSION_IDLE_TIMEOUT,
+)
+
 
 class Ssh(object):
+    # maximum size in bytes of the output chunks
+    # read while commands are running
+    chunk_size = 4096
+    # output is streamed line by line, partial lines
+    # longer than this number of characters are sent anyway
+    max_line_size = 4096
+    # maximum number of characters of standard output
+    # (and of standard error) retained while streaming,
+    # the beginning of longer outputs is discarded
+    max_output_size = 1024 * 1024
+    # size in bytes of the chunks sent with SFTP
+    upload_chunk_size = 32768
+    # uploaded data which is not seekable (eg: generators) is
+    # spooled to disk when bigger than this size in bytes
+    upload_spool_size = 1024 * 1024
     schema = {
         '$schema': 'http://json-schema.org/draft-04/schema#',
         'type': 'object',
@@ -57,8 +90,21 @@ class Ssh(object):
     def __init__(self, params, addresses):
         self._params = params
         self.addresses = addresses
-        self.shell = paramiko.SSHClient()
-        self.shell.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+        self.shell = self._get_client()
+
+    def _get_client(self):
+        client = paramiko.SSHClient()
+        client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+        return client
+
+    @cached_property
+    def _pool_key(self):
+        """
+        sessions are reused only with the same addresses
+        and parameters (eg: not after credentials change)
+        """
+        value = json.dumps([self.addresses, self._params], sort_keys=True)
+        return hashlib.sha256(value.encode()).hexdigest()
 
     @classmethod
     def validate(cls, params):
@@ -100,29 +146,102 @@ class Ssh(object):
             )
 
     def connect(self):
-        success = False
-        exception = None
+        if app_settings.SSH_SESSION_POOL:
+            client = session_pool.acquire(self._pool_key)
+            if client:
+                self.shell = client
+                return
         addresses = self.addresses
         if not addresses:
             raise ValueError('No valid IP addresses to initiate connections found')
-        for address in addresses:
+        if len(addresses) == 1:
+            self._connect(self.shell, addresses[0])
+            return
+        address, self.shell = self._connect_parallel(self._sort_addresses(addresses))
+        cache.set(
+            self._preferred_address_cache_key, address, _PREFERRED_ADDRESS_CACHE_TIMEOUT
+        )
+
+    def _connect(self, client, address):
+        client.connect(
+            address,
+            auth_timeout=app_settings.SSH_AUTH_TIMEOUT,
+            banner_timeout=app_settings.SSH_BANNER_TIMEOUT,
+            timeout=app_settings.SSH_CONNECTION_TIMEOUT,
+            **self.params
+        )
+
+    def _connect_parallel(self, addresses):
+        """
+        tries to connect to all the addresses concurrently, each attempt
+        is started ``SSH_CONNECTION_STAGGER`` seconds after the previous
+        one unless a connection has been established in the meantime,
+        returns the first address which works and its client,
+        the other connections are closed as soon as they succeed
+        """
+        # ensures the key is loaded only once
+        self.params
+        connected = threading.Event()
+        lock = threading.Lock()
+
+        def attempt(index, address):
+            if connected.wait(index * app_settings.SSH_CONNECTION_STAGGER):
+                return None
+            client = self._get_client()
             try:
-                self.shell.connect(
-                    address,
-                    auth_timeout=app_settings.SSH_AUTH_TIMEOUT,
-                    banner_timeout=app_settings.SSH_BANNER_TIMEOUT,
-                    timeout=app_settings.SSH_CONNECTION_TIMEOUT,
-                    **self.params
-                )
-            except Exception as e:
-                exception = e
-            else:
-                success = True
-                break
-        if not success:
-            raise exception
+                self._connect(client, address)
+            except Exception:
+                client.close()
+                raise
+            with lock:
+                if connected.is_set():
+                    client.close()
+                    return None
+                connected.set()
+            return client
+
+        executor = ThreadPoolExecutor(max_workers=len(addresses))
+        futures = {
+            executor.submit(attempt, index, address): address
+            for index, address in enumerate(addresses)
+        }
+        exceptions = {}
+        try:
+            for future in as_completed(futures):
+                address = futures[future]
+                try:
+                    client = future.result()
+                except Exception as e:
+                    exceptions[address] = e
+                    continue
+                if client:
+                    logger.debug(f'connected to {address}')
+                    return address, client
+        finally:
+            # the slower attempts are not awaited
+            executor.shutdown(wait=False)
+        raise exceptions[addresses[-1]]
+
+    def _sort_addresses(self, addresses):
+        """
+        moves the address which worked last time to the top
+        """
+        preferred = cache.get(self._preferred_address_cache_key)
+        if preferred not in addresses:
+            return addresses
+        return [preferred] + [address for address in addresses if address != preferred]
+
+    @cached_property
+    def _preferred_address_cache_key(self):
+        value = json.dumps(sorted(self.addresses))
+        return f'ssh_preferred_address_{hashlib.sha256(value.encode()).hexdigest()}'
 
     def disconnect(self):
+        if app_settings.SSH_SESSION_POOL:
+            # keeps the session open for the next operations
+            session_pool.release(self._pool_key, self.shell)
+            self.shell = self._get_client()
+            return
         self.shell.close()
 
     def exec_command(
@@ -131,6 +250,7 @@ class Ssh(object):
         timeout=app_settings.SSH_COMMAND_TIMEOUT,
         exit_codes=[0],
         raise_unexpected_exit=True,
+        output_callback=None,
     ):
         """
         Executes a command and performs the following operations
@@ -139,6 +259,8 @@ class Ssh(object):
         - logs standard error
         - aborts on exceptions
         - raises socket.timeout exceptions
+        if ``output_callback`` is passed, it's called with each
+        chunk of output as soon as it's received from the device
         """
         logger.info('Executing command: {0}'.format(command))
         # execute commmand
@@ -152,16 +274,20 @@ class Ssh(object):
         except Exception as e:
             logger.exception(e)
             raise e
-        # store command exit status
-        exit_status = stdout.channel.recv_exit_status()
+        if output_callback:
+            output, error = self._stream_output(stdout, timeout, output_callback)
+            exit_status = stdout.channel.recv_exit_status()
+        else:
+            # store command exit status
+            exit_status = stdout.channel.recv_exit_status()
+            # try to decode to UTF-8, ignoring unconvertible characters
+            # https://docs.python.org/3/howto/unicode.html#the-string-type
+            output = stdout.read().decode('utf-8', 'ignore')
+            error = stderr.read().decode('utf-8', 'ignore')
         # log standard output
-        # try to decode to UTF-8, ignoring unconvertible characters
-        # https://docs.python.org/3/howto/unicode.html#the-string-type
-        output = stdout.read().decode('utf-8', 'ignore')
         if output:
             logger.info(output)
         # log standard error
-        error = stderr.read().decode('utf-8', 'ignore')
         if error:
             logger.error(error)
             if not output.endswith('\n'):
@@ -177,14 +303,182 @@ class Ssh(object):
             raise CommandFailedException(message or log_message)
         return output, exit_status
 
+    def _stream_output(self, stdout, timeout, output_callback):
+        """
+        reads standard output and standard error in chunks
+        of at most ``chunk_size`` bytes while the command runs and
+        passes them to ``output_callback`` line by line, so that
+        the two streams are not mixed up within the same line;
+        returns the standard output and standard error (at most
+        ``max_output_size`` characters of each)
+        """
+        channel = stdout.channel
+        streams = {
+            'output': (channel.recv_ready, channel.recv),
+            'error': (channel.recv_stderr_ready, channel.recv_stderr),
+        }
+        # multi-byte characters may be split between chunks
+        decoders = {
+            name: codecs.getincrementaldecoder('utf-8')('ignore') for name in streams
+        }
+        partial_lines = {name: '' for name in streams}
+        retained = {name: [] for name in streams}
+        retained_size = {name: 0 for name in streams}
+        limit = self.max_output_size
+
+        def retain(name, text):
+            retained[name].append(text)
+            retained_size[name] += len(text)
+            # trimmed only once in a while to avoid copying at each chunk
+            if retained_size[name] > limit * 2:
+                text = ''.join(retained[name])[-limit:]
+                retained[name] = [text]
+                retained_size[name] = len(text)
+
+        def receive(name, data, final=False):
+            text = partial_lines[name] + decoders[name].decode(data, final)
+            index = text.rfind('\n') + 1
+            if final or len(text) - index >= self.max_line_size:
+                index = len(text)
+            partial_lines[name] = text[index:]
+            if index:
+                retain(name, text[:index])
+                output_callback(text[:index])
+
+        while True:
+            received = False
+            for name, (ready, recv) in streams.items():
+                if not ready():
+                    continue
+                received = True
+                receive(name, recv(self.chunk_size))
+            if received:
+                continue
+            if channel.exit_status_ready():
+                break
+            if not select.select([channel], [], [], timeout)[0]:
+                raise socket.timeout()
+        # output received after the last check may still be buffered,
+        # both streams are read until the end of file is reached
+        for name, (ready, recv) in streams.items():
+            while True:
+                data = recv(self.chunk_size)
+                if not data:
+                    break
+                receive(name, data)
+            receive(name, b'', final=True)
+        output, error = (''.join(retained[name])[-limit:] for name in streams)
+        return output, error
+
     def update_config(self):  # pragma: no cover
         raise NotImplementedError()
 
-    def upload(self, fl, remote_path):
-        scp = SCPClient(self.shell.get_transport())
-        if not hasattr(fl, 'getvalue'):
-            fl_memory = BytesIO(fl.read())
-            fl.seek(0)
-            fl = fl_memory
-        scp.putfo(fl, remote_path)
-        scp.close()
+    def upload(self, fl, remote_path, resume=False):
+        """
+        Uploads ``fl`` to ``remote_path`` in chunks, ``fl`` can be a
+        file-like object or an iterable of bytes (eg: a generator).
+
+        SCP is used by default; if ``resume`` is ``True``, SFTP is used
+        instead (the device must support it): the data is written to a
+        temporary file named after its checksum, which is renamed to
+        ``remote_path`` once complete, so that a partial file left on
+        the device by a previous interrupted transfer of the same data
+        is completed.
+
+        Returns the number of bytes sent and logs the throughput.
+        """
+        fl, size = self._get_upload_file(fl)
+        start = time.monotonic()
+        if resume:
+            sent = self._sftp_upload(fl, size, remote_path)
+        else:
+            scp = SCPClient(self.shell.get_transport())
+            try:
+                scp.putfo(fl, remote_path, size=size)
+            finally:
+                scp.close()
+            sent = size
+        duration = max(time.monotonic() - start, 0.001)
+        logger.info(
+            f'Uploaded {sent} bytes to {remote_path} in {duration:.2f} s '
+            f'({sent / duration / 1024:.1f} KiB/s)'
+        )
+        return sent
+
+    def _get_upload_file(self, fl):
+        """
+        returns a seekable file object positioned at the beginning of the
+        data to upload and the size of the data; iterables and streams
+        which are not seekable are spooled to a temporary file, which
+        is kept in memory only up to ``upload_spool_size`` bytes
+        """
+        if hasattr(fl, 'read') and hasattr(fl, 'seekable') and fl.seekable():
+            position = fl.tell()
+            size = fl.seek(0, os.SEEK_END) - position
+            fl.seek(position)
+            return fl, size
+        chunks = fl
+        if hasattr(fl, 'read'):
+            chunks = iter(lambda: fl.read(self.upload_chunk_size), b'')
+        spooled = SpooledTemporaryFile(max_size=self.upload_spool_size)
+        for chunk in chunks:
+            spooled.write(chunk)
+        size = spooled.tell()
+        spooled.seek(0)
+        return spooled, size
+
+    def _sftp_upload(self, fl, size, remote_path):
+        """
+        sends only the data missing from the partial copy of ``fl``,
+        returns the number of bytes sent
+        """
+        partial_path = f'{remote_path}.{self._get_upload_checksum(fl)[:16]}.part'
+        sftp = self.shell.open_sftp()
+        try:
+            try:
+                offset = sftp.stat(partial_path).st_size
+            except FileNotFoundError:
+                offset = 0
+            # the partial file is corrupted
+            if offset > size:
+                offset = 0
+            if offset:
+                logger.info(f'Resuming upload of {remote_path} from byte {offset}')
+                fl.seek(offset, os.SEEK_CUR)
+            with sftp.open(partial_path, 'ab' if offset else 'wb') as remote:
+                remote.set_pipelined(True)
+                for chunk in iter(lambda: fl.read(self.upload_chunk_size), b''):
+                    remote.write(chunk)
+            self._sftp_replace(sftp, partial_path, remote_path)
+        finally:
+            sftp.close()
+        return size - offset
+
+    def _sftp_replace(self, sftp, source, destination):
+        """
+        renames ``source`` to ``destination`` replacing it, servers which
+        do not support the posix-rename extension cannot overwrite an
+        existing file, hence it's removed first (not atomic)
+        """
+        try:
+            sftp.posix_rename(source, destination)
+            return
+        except OSError as e:
+            logger.info(f'posix_rename not supported ({e}), falling back to rename')
+        try:
+            sftp.remove(destination)
+        except FileNotFoundError:
+            pass
+        sftp.rename(source, destination)
+
+    def _get_upload_checksum(self, fl):
+        """
+        returns the sha256 hex digest of the data of ``fl``,
+        the position of ``fl`` is left unchanged
+        """
+        position = fl.tell()
+        checksum = hashlib.sha256()
+        for chunk in iter(lambda: fl.read(self.upload_chunk_size), b''):
+            checksum.update(chunk)
+        fl.seek(position)
+        return checksum.hexdigest()
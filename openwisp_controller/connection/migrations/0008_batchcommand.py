@@ -0,0 +1,150 @@
+import collections
+import uuid
+
+import django.core.validators
+import django.db.migrations.operations.special
+import django.db.models.deletion
+import django.utils.timezone
+import jsonfield.fields
+import model_utils.fields
+import swapper
+from django.db import migrations, models
+
+from ..commands import COMMAND_CHOICES
+from . import assign_batch_command_permissions_to_groups
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('connection', '0007_command'),
+        swapper.dependency('openwisp_users', 'Organization'),
+        swapper.dependency('config', 'DeviceGroup'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BatchCommand',
+            fields=[
+                (
+                    'id',
+                    models.UUIDField(
+                        default=uuid.uuid4,
+                        editable=False,
+                        primary_key=True,
+                        serialize=False,
+                    ),
+                ),
+                (
+                    'created',
+                    model_utils.fields.AutoCreatedField(
+                        default=django.utils.timezone.now,
+                        editable=False,
+                        verbose_name='created',
+                    ),
+                ),
+                (
+                    'modified',
+                    model_utils.fields.AutoLastModifiedField(
+                        default=django.utils.timezone.now,
+                        editable=False,
+                        verbose_name='modified',
+                    ),
+                ),
+                (
+                    'status',
+                    models.CharField(
+                        choices=[
+                            ('in-progress', 'in progress'),
+                            ('success', 'success'),
+                            ('failed', 'failed'),
+                        ],
+                        default='in-progress',
+                        max_length=12,
+                    ),
+                ),
+                ('type', models.CharField(choices=COMMAND_CHOICES, max_length=16)),
+                (
+                    'input',
+                    jsonfield.fields.JSONField(
+                        blank=True,
+                        dump_kwargs={'indent': 4},
+                        load_kwargs={'object_pairs_hook': collections.OrderedDict},
+                        null=True,
+                    ),
+                ),
+                (
+                    'concurrency',
+                    models.PositiveSmallIntegerField(
+                        default=10,
+                        help_text=(
+                            'maximum number of devices processed at the same time'
+                        ),
+                        validators=[
+                            django.core.validators.MinValueValidator(1),
+                            django.core.validators.MaxValueValidator(100),
+                        ],
+                        verbose_name='concurrency',
+                    ),
+                ),
+                (
+                    'group',
+                    models.ForeignKey(
+                        blank=True,
+                        help_text=(
+                            'leave blank to execute the command on '
+                            'all the devices of the organization'
+                        ),
+                        null=True,
+                        on_delete=django.db.models.deletion.SET_NULL,
+                        to=swapper.get_model_name('config', 'DeviceGroup'),
+                        verbose_name='device group',
+                    ),
+                ),
+                (
+                    'organization',
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        to=swapper.get_model_name('openwisp_users', 'Organization'),
+                        verbose_name='organization',
+                    ),
+                ),
+            ],
+            options={
+                'verbose_name': 'Batch command',
+                'verbose_name_plural': 'Batch commands',
+                'ordering': ('created',),
+                'abstract': False,
+                'swappable': swapper.swappable_setting('connection', 'BatchCommand'),
+            },
+        ),
+        migrations.AddField(
+            model_name='command',
+            name='batch',
+            field=models.ForeignKey(
+                blank=True,
+                null=True,
+                on_delete=django.db.models.deletion.SET_NULL,
+                related_name='commands',
+                to=swapper.get_model_name('connection', 'BatchCommand'),
+            ),
+        ),
+        migrations.AlterField(
+            model_name='command',
+            name='status',
+            field=models.CharField(
+                choices=[
+                    ('in-progress', 'in progress'),
+                    ('success', 'success'),
+                    ('failed', 'failed'),
+                    ('scheduled', 'scheduled'),
+                ],
+                default='in-progress',
+                max_length=12,
+            ),
+        ),
+        migrations.RunPython(
+            code=assign_batch_command_permissions_to_groups,
+            reverse_code=django.db.migrations.operations.special.RunPython.noop,
+        ),
+    ]
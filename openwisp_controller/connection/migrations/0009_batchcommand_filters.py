@@ -0,0 +1,29 @@
+import collections
+
+import jsonfield.fields
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('connection', '0008_batchcommand'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='batchcommand',
+            name='filters',
+            field=jsonfield.fields.JSONField(
+                blank=True,
+                default=dict,
+                dump_kwargs={'indent': 4},
+                help_text=(
+                    'selects the devices with lookups on their attributes, '
+                    'eg: {"model__icontains": "tl-wdr"}'
+                ),
+                load_kwargs={'object_pairs_hook': collections.OrderedDict},
+                verbose_name='device filters',
+            ),
+        ),
+    ]
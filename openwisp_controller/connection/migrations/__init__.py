@@ -35,7 +35,7 @@ def assign_permissions_to_groups(apps, schema_editor):
             )
 
 
-def assign_command_permissions_to_groups(apps, schema_editor):
+def assign_command_permissions_to_groups(apps, schema_editor, model_name='command'):
     create_default_permissions(apps, schema_editor)
     admin_operations = ['add', 'change', 'delete', 'view']
     operator_operations = ['add', 'view']
@@ -51,12 +51,16 @@ def assign_command_permissions_to_groups(apps, schema_editor):
 
     for operation in operator_operations:
         permission = Permission.objects.get(
-            codename='{}_{}'.format(operation, 'command')
+            codename='{}_{}'.format(operation, model_name)
         )
         admin.permissions.add(permission.pk)
         operator.permissions.add(permission.pk)
 
     for operation in admin_operations:
         admin.permissions.add(
-            Permission.objects.get(codename='{}_{}'.format(operation, 'command')).pk
+            Permission.objects.get(codename='{}_{}'.format(operation, model_name)).pk
         )
+
+
+def assign_batch_command_permissions_to_groups(apps, schema_editor):
+    assign_command_permissions_to_groups(apps, schema_editor, 'batchcommand')
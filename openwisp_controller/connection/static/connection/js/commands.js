@@ -471,6 +471,12 @@ function initCommandOverlay($) {
 function initCommandWebSockets($) {
     commandWebSocket.addEventListener('message', function (e) {
         let data = JSON.parse(e.data);
+        // Output of running commands is received in chunks
+        if (data.model === 'CommandOutput') {
+            $(`input[value="${data.data.id}"]`).parent().children('fieldset')
+                .find('.field-output .readonly').append(document.createTextNode(data.data.output));
+            return;
+        }
         // Done for keeping future use of these websocket
         if (data.model !== 'Command') {
             return;
@@ -1,10 +1,13 @@
 import logging
-import time
+from datetime import timedelta
+from uuid import uuid4
 
 import swapper
 from celery import shared_task
 from celery.exceptions import SoftTimeLimitExceeded
+from django.core.cache import cache
 from django.core.exceptions import ObjectDoesNotExist
+from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
 from swapper import load_model
 
@@ -12,17 +15,49 @@ from . import settings as app_settings
 
 logger = logging.getLogger(__name__)
 
+# set while an update_config task is queued for a device
+UPDATE_CONFIG_PENDING_KEY = 'connection_update_config_pending_{}'
+# set while an update_config task is running for a device
+UPDATE_CONFIG_LOCK_KEY = 'connection_update_config_lock_{}'
+# markers expire automatically if a task is lost or a worker dies
+UPDATE_CONFIG_LOCK_TIMEOUT = 300
+
 
 @shared_task
 def update_config(device_id):
     """
     Launches the ``update_config()`` operation
-    of a specific device in the background
+    of a specific device in the background,
+    the operation is postponed if another one
+    is running for the same device
     """
+    lock_key = UPDATE_CONFIG_LOCK_KEY.format(device_id)
+    pending_key = UPDATE_CONFIG_PENDING_KEY.format(device_id)
+    # identifies the lock held by this task
+    token = uuid4().hex
+    if not cache.add(lock_key, token, timeout=UPDATE_CONFIG_LOCK_TIMEOUT):
+        # keep the pending marker while waiting, so that changes
+        # performed in the meantime don't queue yet another task
+        cache.set(
+            pending_key,
+            True,
+            timeout=UPDATE_CONFIG_LOCK_TIMEOUT + app_settings.UPDATE_CONFIG_DELAY,
+        )
+        update_config.apply_async((device_id,), countdown=5)
+        return
+    # changes performed from now on require a new update
+    cache.delete(pending_key)
+    try:
+        _update_config(device_id)
+    finally:
+        # the lock may have expired and may have been acquired by
+        # another task in the meantime, which must not be unlocked
+        if cache.get(lock_key) == token:
+            cache.delete(lock_key)
+
+
+def _update_config(device_id):
     Device = swapper.load_model(*swapper.split(app_settings.UPDATE_CONFIG_MODEL))
-    # wait for the saving operations of this device to complete
-    # (there may be multiple ones happening at the same time)
-    time.sleep(2)
     try:
         device = Device.objects.select_related('config').get(pk=device_id)
         # abort operation if device shouldn't be updated
@@ -51,6 +86,10 @@ def launch_command(command_id):
     except Command.DoesNotExist as e:
         logger.warning(f'launch_command("{command_id}") failed: {e}')
         return
+    _execute_command(command)
+
+
+def _execute_command(command):
     try:
         command.execute()
     except SoftTimeLimitExceeded:
@@ -59,13 +98,75 @@ def launch_command(command_id):
         command.save()
     except Exception as e:
         logger.exception(
-            f'An exception was raised while executing command {command_id}'
+            f'An exception was raised while executing command {command.pk}'
         )
         command.status = 'failed'
         command._add_output(_(f'Internal system error: {e}'))
         command.save()
 
 
+@shared_task(soft_time_limit=600)
+def launch_batch_command(batch_id):
+    """
+    Creates the commands of a batch command and
+    starts the tasks which execute them
+    """
+    BatchCommand = load_model('connection', 'BatchCommand')
+    try:
+        batch = BatchCommand.objects.get(pk=batch_id)
+    except BatchCommand.DoesNotExist as e:
+        logger.warning(f'launch_batch_command("{batch_id}") failed: {e}')
+        return
+    batch.launch()
+
+
+@shared_task(soft_time_limit=app_settings.SSH_COMMAND_TIMEOUT * 1.2)
+def execute_batch_command(batch_id, slot=0, token=None):
+    """
+    Executes the next command of a batch command and schedules
+    itself again until all the commands have been executed
+    (``slot`` and ``token`` identify the worker, see
+    ``AbstractBatchCommand.keep_worker``)
+    """
+    BatchCommand = load_model('connection', 'BatchCommand')
+    try:
+        batch = BatchCommand.objects.get(pk=batch_id)
+    except BatchCommand.DoesNotExist as e:
+        logger.warning(f'execute_batch_command("{batch_id}") failed: {e}')
+        return
+    if batch.status != 'in-progress':
+        return
+    if not batch.keep_worker(slot, token):
+        logger.info(f'worker {slot} of batch command {batch_id} has been replaced')
+        return
+    delay = batch.get_rate_limit_delay()
+    if delay:
+        execute_batch_command.apply_async((batch_id, slot, token), countdown=delay)
+        return
+    command = batch.claim_command()
+    if not command:
+        batch.stop_worker(slot, token)
+        batch.update_status()
+        return
+    _execute_command(command)
+    execute_batch_command.delay(batch_id, slot, token)
+
+
+@shared_task(soft_time_limit=600)
+def recover_batch_commands():
+    """
+    Fails the commands of batch commands whose task has been lost
+    and restarts the lost workers, must be executed periodically
+    """
+    BatchCommand = load_model('connection', 'BatchCommand')
+    # recently created batch commands may still be launching
+    limit = timezone.now() - timedelta(seconds=BatchCommand._WORKER_TIMEOUT)
+    for batch in BatchCommand.objects.filter(
+        status='in-progress', created__lt=limit
+    ).iterator():
+        batch.recover()
+
+
 @shared_task(soft_time_limit=180)
 def auto_add_credentials_to_devices(credential_id, organization_id):
     Credentials = load_model('connection', 'Credentials')
@@ -50,6 +50,12 @@ class TestCommandsConsumer(BaseTestModels, CreateCommandMixin):
             await database_sync_to_async(command.save)()
             await database_sync_to_async(command.refresh_from_db)()
 
+        # output is sent while the command is running
+        response = await communicator.receive_json_from()
+        assert response == {
+            'model': 'CommandOutput',
+            'data': {'id': str(command.id), 'output': 'test'},
+        }
         response = await communicator.receive_json_from()
         expected_response = {
             'model': 'Command',
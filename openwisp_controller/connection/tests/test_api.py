@@ -1,6 +1,6 @@
 import json
 import uuid
-from unittest.mock import patch
+from unittest.mock import Mock, patch
 
 from django.contrib.auth.models import Permission
 from django.test import TestCase
@@ -15,6 +15,7 @@ from .. import settings as app_settings
 from ..api.views import ListViewPagination
 from .utils import CreateCommandMixin, CreateConnectionsMixin
 
+BatchCommand = load_model('connection', 'BatchCommand')
 Command = load_model('connection', 'Command')
 command_qs = Command.objects.order_by('-created')
 OrganizationUser = load_model('openwisp_users', 'OrganizationUser')
@@ -118,6 +119,74 @@ class TestCommandsAPI(TestCase, AuthenticationMixin, CreateCommandMixin):
             self.assertIn('device', command_obj)
             self.assertIn('connection', command_obj)
 
+    @patch('paramiko.SSHClient.connect')
+    def test_batch_command_api(self, *args):
+        org = self.device_conn.device.organization
+        url = self._get_path('batch_command_list')
+
+        with self.subTest('create batch command'):
+            payload = {
+                'organization': str(org.pk),
+                'type': 'custom',
+                'input': {'command': 'echo test'},
+                'concurrency': 5,
+            }
+            response = self.client.post(
+                url, data=payload, content_type='application/json'
+            )
+            self.assertEqual(response.status_code, 201)
+            self.assertEqual(response.data['status'], 'in-progress')
+            self.assertEqual(response.data['progress']['total'], 0)
+            batch = BatchCommand.objects.get(pk=response.data['id'])
+            self.assertEqual(batch.concurrency, 5)
+
+        with self.subTest('invalid input'):
+            payload = {'organization': str(org.pk), 'type': 'custom', 'input': {}}
+            response = self.client.post(
+                url, data=payload, content_type='application/json'
+            )
+            self.assertEqual(response.status_code, 400)
+            self.assertIn('input', response.data)
+
+        stdout = Mock()
+        stdout.channel.recv_ready.side_effect = [True, False]
+        stdout.channel.recv.side_effect = [b'test', b'']
+        stdout.channel.recv_stderr_ready.return_value = False
+        stdout.channel.recv_stderr.return_value = b''
+        stdout.channel.exit_status_ready.return_value = True
+        stdout.channel.recv_exit_status.return_value = 0
+        stderr = Mock()
+        with patch('paramiko.SSHClient.exec_command') as mocked_exec_command:
+            mocked_exec_command.return_value = (Mock(), stdout, stderr)
+            # must call this explicitly because lack of transactions in this test case
+            batch.launch()
+
+        with self.subTest('retrieve progress'):
+            path = self._get_path('batch_command_detail', batch.pk)
+            response = self.client.get(path)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.data['status'], 'success')
+            self.assertEqual(response.data['progress']['success'], 1)
+            self.assertEqual(response.data['progress']['total'], 1)
+
+        with self.subTest('list results'):
+            path = self._get_path('batch_command_results', batch.pk)
+            response = self.client.get(path)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.data['count'], 1)
+            result = response.data['results'][0]
+            self.assertEqual(result['device'], str(self.device_id))
+            self.assertEqual(result['status'], 'success')
+            self.assertEqual(result['output'], 'test\n')
+            path = self._get_path('batch_command_results', batch.pk, status='failed')
+            response = self.client.get(path)
+            self.assertEqual(response.data['count'], 0)
+
+        with self.subTest('results of non existing batch command'):
+            path = self._get_path('batch_command_results', uuid.uuid4())
+            response = self.client.get(path)
+            self.assertEqual(response.status_code, 404)
+
     def test_command_create_api(self):
         def test_command_attributes(self, payload):
             self.assertEqual(command_qs.count(), 1)
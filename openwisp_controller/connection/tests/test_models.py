@@ -1,8 +1,12 @@
 import socket
+import threading
+import time
+from datetime import timedelta
 from unittest import mock
 
 import paramiko
 from django.contrib.auth.models import ContentType
+from django.core.cache import cache
 from django.core.exceptions import ValidationError
 from django.test import TestCase, TransactionTestCase
 from django.utils import timezone
@@ -11,11 +15,18 @@ from swapper import load_model
 
 from openwisp_utils.tests import capture_any_output, catch_signal
 
+from ...config.importer import DeviceImporter
+from ...config.tests.utils import CreateDeviceGroupMixin
 from .. import settings as app_settings
-from ..apps import _TASK_NAME
 from ..commands import register_command, unregister_command
 from ..signals import is_working_changed
-from ..tasks import update_config
+from ..tasks import (
+    UPDATE_CONFIG_LOCK_KEY,
+    UPDATE_CONFIG_PENDING_KEY,
+    execute_batch_command,
+    recover_batch_commands,
+    update_config,
+)
 from .utils import CreateConnectionsMixin
 
 Config = load_model('config', 'Config')
@@ -25,6 +36,7 @@ DeviceConnection = load_model('connection', 'DeviceConnection')
 Group = load_model('openwisp_users', 'Group')
 Organization = load_model('openwisp_users', 'Organization')
 Command = load_model('connection', 'Command')
+BatchCommand = load_model('connection', 'BatchCommand')
 
 _connect_path = 'paramiko.SSHClient.connect'
 _exec_command_path = 'paramiko.SSHClient.exec_command'
@@ -43,10 +55,25 @@ class BaseTestModels(CreateConnectionsMixin):
         stdout_.read().decode.return_value = stdout
         stdout_.channel.recv_exit_status.return_value = exit_code
         stderr_.read().decode.return_value = stderr
+        # output read in chunks while commands are running
+        chunks = {
+            'stdout': [stdout.encode()] if stdout else [],
+            'stderr': [stderr.encode()] if stderr else [],
+        }
+        channel = stdout_.channel
+        channel.recv_ready.side_effect = lambda: bool(chunks['stdout'])
+        channel.recv.side_effect = lambda size: (
+            chunks['stdout'].pop(0) if chunks['stdout'] else b''
+        )
+        channel.recv_stderr_ready.side_effect = lambda: bool(chunks['stderr'])
+        channel.recv_stderr.side_effect = lambda size: (
+            chunks['stderr'].pop(0) if chunks['stderr'] else b''
+        )
+        channel.exit_status_ready.return_value = True
         return (stdin_, stdout_, stderr_)
 
 
-class TestModels(BaseTestModels, TestCase):
+class TestModels(BaseTestModels, CreateDeviceGroupMixin, TestCase):
     def test_connection_str(self):
         c = Credentials(name='Dev Key', connector=app_settings.CONNECTORS[0][0])
         self.assertIn(c.name, str(c))
@@ -179,6 +206,42 @@ HZAAAAgAhZz8ve4sK9Wbopq43Cu2kQDgX4NoA6W+FCmxCKf5AhYIzYQxIqyCazd7MrjCwS""",
         self.assertIsNotNone(dc.last_attempt)
         self.assertEqual(dc.failure_reason, 'Authentication failed.')
 
+    def test_ssh_connect_parallel(self):
+        ckey = self._create_credentials_with_key(port=self.ssh_server.port)
+        dc = self._create_device_connection(credentials=ckey)
+        dc.device.management_ip = '10.40.0.1'
+        dc.device.last_ip = '10.40.0.2'
+        dc.device.save()
+        unreachable = threading.Event()
+        self.addCleanup(unreachable.set)
+
+        def connect(address, **kwargs):
+            if address == '10.40.0.1':
+                unreachable.wait(5)
+                raise socket.timeout()
+
+        with mock.patch(_connect_path, side_effect=connect) as mocked_connect:
+            dc.connect()
+            self.assertEqual(mocked_connect.call_count, 2)
+        unreachable.set()
+        self.assertTrue(dc.is_working)
+
+        with self.subTest('the address which worked is tried first'):
+            connector = DeviceConnection.objects.get(pk=dc.pk).connector_instance
+            self.assertEqual(
+                connector._sort_addresses(connector.addresses),
+                ['10.40.0.2', '10.40.0.1'],
+            )
+
+        with self.subTest('all addresses fail'):
+            dc = DeviceConnection.objects.get(pk=dc.pk)
+            with mock.patch(_connect_path) as mocked_connect:
+                mocked_connect.side_effect = Exception('Authentication failed.')
+                dc.connect()
+                self.assertEqual(mocked_connect.call_count, 2)
+            self.assertFalse(dc.is_working)
+            self.assertEqual(dc.failure_reason, 'Authentication failed.')
+
     def test_credentials_schema(self):
         # unrecognized parameter
         try:
@@ -272,6 +335,24 @@ HZAAAAgAhZz8ve4sK9Wbopq43Cu2kQDgX4NoA6W+FCmxCKf5AhYIzYQxIqyCazd7MrjCwS""",
         self.assertEqual(d.deviceconnection_set.count(), 1)
         self.assertEqual(d.deviceconnection_set.first().credentials, c)
 
+    def test_auto_add_to_imported_devices(self):
+        org = Organization.objects.first()
+        c = self._create_credentials(auto_add=True, organization=None)
+        self._create_credentials(name='cred2', auto_add=False, organization=None)
+        rows = [
+            (1, {'name': 'import-1', 'mac_address': '00:11:22:33:44:01'}),
+            (2, {'name': 'import-2', 'mac_address': '00:11:22:33:44:02'}),
+        ]
+        result = DeviceImporter(org).run(rows)
+        self.assertEqual(result['created'], 2)
+        self.assertEqual(DeviceConnection.objects.count(), 2)
+        for conn in DeviceConnection.objects.select_related('device'):
+            self.assertEqual(conn.credentials, c)
+            self.assertEqual(
+                conn.update_strategy,
+                app_settings.CONFIG_UPDATE_MAPPING['netjsonconfig.OpenWrt'],
+            )
+
     def test_auto_add_device_missing_config(self):
         org = Organization.objects.first()
         self._create_device(organization=org)
@@ -346,14 +427,14 @@ HZAAAAgAhZz8ve4sK9Wbopq43Cu2kQDgX4NoA6W+FCmxCKf5AhYIzYQxIqyCazd7MrjCwS""",
         permissions = group.permissions.filter(
             content_type__app_label=f'{self.app_label}'
         )
-        self.assertEqual(permissions.count(), 6)
+        self.assertEqual(permissions.count(), 8)
 
     def test_administrator_group_permissions(self):
         group = Group.objects.get(name='Administrator')
         permissions = group.permissions.filter(
             content_type__app_label=f'{self.app_label}'
         )
-        self.assertEqual(permissions.count(), 12)
+        self.assertEqual(permissions.count(), 16)
 
     def test_device_connection_set_connector(self):
         dc = self._create_device_connection()
@@ -527,6 +608,74 @@ HZAAAAgAhZz8ve4sK9Wbopq43Cu2kQDgX4NoA6W+FCmxCKf5AhYIzYQxIqyCazd7MrjCwS""",
         info = 'Command "cat /tmp/doesntexist" returned non-zero exit code: 1'
         self.assertEqual(command.output, f'{stdout}\n{stderr}\n{info}\n')
 
+    @mock.patch.object(Command, 'output_save_interval', 0)
+    @mock.patch(_connect_path)
+    def test_execute_command_output_streamed(self, connect_mocked):
+        dc = self._create_device_connection()
+        command = Command(
+            device=dc.device,
+            connection=dc,
+            type='custom',
+            input={'command': 'echo test'},
+        )
+        command.full_clean()
+        command.save()
+        partial_output = []
+
+        def exec_command(*args, **kwargs):
+            stdin, stdout, stderr = self._exec_command_return_value(stdout='test')
+            # stores the output saved while the command is running
+            stdout.channel.recv_exit_status.side_effect = lambda: (
+                partial_output.append(Command.objects.get(pk=command.pk).output) or 0
+            )
+            return stdin, stdout, stderr
+
+        with mock.patch(_exec_command_path, side_effect=exec_command), mock.patch(
+            'channels.layers.InMemoryChannelLayer.group_send'
+        ) as mocked_group_send:
+            # must call this explicitly because lack of transactions in this test case
+            command.execute()
+        mocked_group_send.assert_any_call(
+            f'config.device-{dc.device_id}',
+            {
+                'type': 'send.update',
+                'model': 'CommandOutput',
+                'data': {'id': str(command.pk), 'output': 'test'},
+            },
+        )
+        self.assertEqual(partial_output, ['test'])
+        command.refresh_from_db()
+        self.assertEqual(command.status, 'success')
+        self.assertEqual(command.output, 'test\n')
+
+        with self.subTest('output received after the exit status is not lost'):
+
+            def exec_command(*args, **kwargs):
+                stdin, stdout, stderr = self._exec_command_return_value(
+                    stdout='line1\nline2', stderr='error'
+                )
+                # the output is not ready yet when checked by the loop
+                stdout.channel.recv_ready.side_effect = None
+                stdout.channel.recv_ready.return_value = False
+                stdout.channel.recv_stderr_ready.side_effect = None
+                stdout.channel.recv_stderr_ready.return_value = False
+                return stdin, stdout, stderr
+
+            command = Command(
+                device=dc.device,
+                connection=dc,
+                type='custom',
+                input={'command': 'echo test'},
+            )
+            command.full_clean()
+            command.save()
+            with mock.patch(_exec_command_path, side_effect=exec_command), mock.patch(
+                'channels.layers.InMemoryChannelLayer.group_send'
+            ):
+                command.execute()
+            command.refresh_from_db()
+            self.assertEqual(command.output, 'line1\nline2\nerror\n')
+
     def test_execute_command_failure_connection_failed(self):
         dc = self._create_device_connection()
         command = Command(
@@ -707,6 +856,215 @@ HZAAAAgAhZz8ve4sK9Wbopq43Cu2kQDgX4NoA6W+FCmxCKf5AhYIzYQxIqyCazd7MrjCwS""",
         with self.subTest('administrator permissions'):
             self.assertEqual(admin_permissions.count(), 4)
 
+    def test_batch_command_permissions(self):
+        ct = ContentType.objects.get_by_natural_key(
+            app_label=self.app_label, model='batchcommand'
+        )
+        operator_group = Group.objects.get(name='Operator')
+        admin_group = Group.objects.get(name='Administrator')
+        operator_permissions = operator_group.permissions.filter(content_type=ct)
+        admin_permissions = admin_group.permissions.filter(content_type=ct)
+
+        with self.subTest('operator permissions'):
+            self.assertEqual(
+                set(operator_permissions.values_list('codename', flat=True)),
+                {'add_batchcommand', 'view_batchcommand'},
+            )
+
+        with self.subTest('administrator permissions'):
+            self.assertEqual(admin_permissions.count(), 4)
+
+    def _create_batch_command_devices(self, count=3):
+        org = self._get_org()
+        credentials = self._create_credentials(organization=org)
+        devices = []
+        for i in range(count):
+            device = self._create_device(
+                name=f'batch{i}', mac_address=f'00:11:22:33:44:{i:02}'
+            )
+            self._create_config(device=device)
+            self._create_device_connection(device=device, credentials=credentials)
+            devices.append(device)
+        return devices
+
+    @mock.patch(_connect_path)
+    def test_batch_command(self, connect_mocked):
+        devices = self._create_batch_command_devices()
+        # devices without enabled connection are skipped
+        device = self._create_device(name='disabled')
+        self._create_config(device=device)
+        disabled = self._create_device_connection(
+            device=device, credentials=self._get_credentials(), enabled=False
+        )
+        batch = BatchCommand(
+            organization=self._get_org(),
+            type='custom',
+            input={'command': 'echo test'},
+            concurrency=2,
+        )
+        batch.full_clean()
+        batch.save()
+        with mock.patch(_exec_command_path) as mocked_exec_command, mock.patch.object(
+            execute_batch_command, 'delay', wraps=execute_batch_command.delay
+        ) as mocked_delay:
+            mocked_exec_command.side_effect = lambda *args, **kwargs: (
+                self._exec_command_return_value(stdout='test')
+            )
+            # must call this explicitly because lack of transactions in this test case
+            batch.launch()
+            self.assertEqual(mocked_exec_command.call_count, 3)
+            # two tasks are started by launch(), then
+            # each task schedules itself after each command
+            self.assertEqual(mocked_delay.call_count, 2 + 3)
+        batch.refresh_from_db()
+        self.assertEqual(batch.status, 'success')
+        self.assertEqual(
+            batch.get_progress(),
+            {'in-progress': 0, 'success': 3, 'failed': 0, 'scheduled': 0, 'total': 3},
+        )
+        self.assertEqual(
+            set(batch.commands.values_list('device_id', flat=True)),
+            {device.pk for device in devices},
+        )
+        self.assertFalse(Command.objects.filter(device=disabled.device).exists())
+        for command in batch.commands.all():
+            self.assertEqual(command.output, 'test\n')
+
+        with self.subTest('a command fails'):
+            batch = BatchCommand.objects.create(
+                organization=self._get_org(), type='custom', input={'command': 'false'}
+            )
+            with mock.patch(_exec_command_path) as mocked_exec_command:
+                mocked_exec_command.side_effect = [
+                    self._exec_command_return_value(exit_code=1),
+                    self._exec_command_return_value(),
+                    self._exec_command_return_value(),
+                ]
+                batch.launch()
+            batch.refresh_from_db()
+            self.assertEqual(batch.status, 'failed')
+            progress = batch.get_progress()
+            self.assertEqual(progress['failed'], 1)
+            self.assertEqual(progress['success'], 2)
+
+        with self.subTest('device group'):
+            group = self._create_device_group()
+            devices[0].group = group
+            devices[0].save()
+            batch = BatchCommand.objects.create(
+                organization=self._get_org(), group=group, type='reboot'
+            )
+            with mock.patch(_exec_command_path) as mocked_exec_command:
+                mocked_exec_command.return_value = self._exec_command_return_value()
+                batch.launch()
+                mocked_exec_command.assert_called_once()
+            self.assertEqual(batch.commands.get().device, devices[0])
+
+        with self.subTest('device filters'):
+            devices[1].model = 'Ubiquiti NanoStation M5'
+            devices[1].save()
+            batch = BatchCommand.objects.create(
+                organization=self._get_org(),
+                filters={'model__icontains': 'nanostation'},
+                type='reboot',
+            )
+            with mock.patch(_exec_command_path) as mocked_exec_command:
+                mocked_exec_command.return_value = self._exec_command_return_value()
+                batch.launch()
+                mocked_exec_command.assert_called_once()
+            self.assertEqual(batch.commands.get().device, devices[1])
+
+        with self.subTest('commands are not created again'):
+            batch.launch()
+            self.assertEqual(batch.commands.count(), 1)
+
+        with self.subTest('no devices'):
+            batch = BatchCommand.objects.create(
+                organization=self._create_org(name='empty'), type='reboot'
+            )
+            batch.launch()
+            batch.refresh_from_db()
+            self.assertEqual(batch.status, 'success')
+            self.assertEqual(batch.get_progress()['total'], 0)
+
+    def test_batch_command_validation(self):
+        org = self._get_org()
+        with self.subTest('invalid input'):
+            batch = BatchCommand(organization=org, type='custom', input={})
+            with self.assertRaises(ValidationError) as context_manager:
+                batch.full_clean()
+            self.assertIn('input', context_manager.exception.message_dict)
+
+        with self.subTest('group of another organization'):
+            group = self._create_device_group(
+                organization=self._create_org(name='org2')
+            )
+            batch = BatchCommand(organization=org, group=group, type='reboot')
+            with self.assertRaises(ValidationError) as context_manager:
+                batch.full_clean()
+            self.assertIn('group', context_manager.exception.message_dict)
+
+        with self.subTest('unsupported filter'):
+            batch = BatchCommand(
+                organization=org, filters={'key__startswith': 'a'}, type='reboot'
+            )
+            with self.assertRaises(ValidationError) as context_manager:
+                batch.full_clean()
+            self.assertIn('filters', context_manager.exception.message_dict)
+
+    @mock.patch.object(app_settings, 'BATCH_COMMAND_RATE_LIMIT', 2)
+    @mock.patch('openwisp_controller.connection.base.models.time')
+    @mock.patch(_connect_path)
+    def test_batch_command_rate_limit(self, connect_mocked, mocked_time):
+        mocked_time.time.return_value = 1620000030.0
+        # used to throttle the saving of the output of commands
+        mocked_time.monotonic.side_effect = time.monotonic
+        self._create_batch_command_devices()
+        batch = BatchCommand.objects.create(
+            organization=self._get_org(), type='reboot', concurrency=1
+        )
+        batch._create_commands()
+        # delay() uses apply_async(), hence the worker
+        # is executed explicitly instead of scheduling itself
+        with mock.patch(_exec_command_path) as mocked_exec_command, mock.patch.object(
+            execute_batch_command, 'apply_async'
+        ) as mocked_apply_async:
+            mocked_exec_command.return_value = self._exec_command_return_value()
+            for i in range(3):
+                execute_batch_command(batch.pk)
+            self.assertEqual(mocked_exec_command.call_count, 2)
+            # the third command is postponed to the next minute
+            self.assertEqual(mocked_apply_async.call_count, 3)
+            self.assertEqual(mocked_apply_async.call_args[0][0][0], batch.pk)
+            self.assertEqual(mocked_apply_async.call_args[1]['countdown'], 30)
+        self.assertEqual(batch.get_progress()['scheduled'], 1)
+
+    @mock.patch(_connect_path)
+    def test_batch_command_recover(self, connect_mocked):
+        self._create_batch_command_devices(count=2)
+        batch = BatchCommand.objects.create(
+            organization=self._get_org(), type='reboot', concurrency=1
+        )
+        batch._create_commands()
+        # the worker executing the first command died
+        command = batch.claim_command()
+        past = timezone.now() - timedelta(seconds=batch._WORKER_TIMEOUT + 1)
+        Command.objects.filter(pk=command.pk).update(modified=past)
+        with mock.patch(_exec_command_path) as mocked_exec_command:
+            mocked_exec_command.return_value = self._exec_command_return_value()
+            with self.subTest('recently created batch commands are skipped'):
+                recover_batch_commands.delay()
+                mocked_exec_command.assert_not_called()
+            BatchCommand.objects.filter(pk=batch.pk).update(created=past)
+            recover_batch_commands.delay()
+            mocked_exec_command.assert_called_once()
+        command.refresh_from_db()
+        self.assertEqual(command.status, 'failed')
+        self.assertIn('Background task interrupted', command.output)
+        batch.refresh_from_db()
+        self.assertEqual(batch.status, 'failed')
+        self.assertEqual(batch.get_progress()['success'], 1)
+
 
 class TestModelsTransaction(BaseTestModels, TransactionTestCase):
     def _prepare_conf_object(self, organization=None):
@@ -826,29 +1184,58 @@ class TestModelsTransaction(BaseTestModels, TransactionTestCase):
             # exit code 1 considers the update not successful
             self.assertEqual(conf.status, 'modified')
 
-    @mock.patch.object(update_config, 'delay')
+    @mock.patch.object(update_config, 'apply_async')
     def test_device_update_config_in_progress(self, mocked_update_config):
         conf = self._prepare_conf_object()
+        cache.set(UPDATE_CONFIG_PENDING_KEY.format(conf.device.pk), True)
+        conf.save()
+        mocked_update_config.assert_not_called()
 
-        with mock.patch('celery.app.control.Inspect.active') as mocked_active:
-            mocked_active.return_value = {
-                'task': [{'name': _TASK_NAME, 'args': [str(conf.device.pk)]}]
-            }
-            conf.save()
-            mocked_active.assert_called_once()
-            mocked_update_config.assert_not_called()
-
-    @mock.patch.object(update_config, 'delay')
+    @mock.patch.object(update_config, 'apply_async')
     def test_device_update_config_not_in_progress(self, mocked_update_config):
         conf = self._prepare_conf_object()
+        conf.save()
+        mocked_update_config.assert_called_once_with(
+            (conf.device.pk,), countdown=app_settings.UPDATE_CONFIG_DELAY
+        )
 
-        with mock.patch('celery.app.control.Inspect.active') as mocked_active:
-            mocked_active.return_value = {
-                'task': [{'name': _TASK_NAME, 'args': ['...']}]
-            }
+        with self.subTest('changes are collapsed in the queued task'):
+            conf.config = {'dns_servers': ['8.8.8.8']}
+            conf.full_clean()
             conf.save()
-            mocked_active.assert_called_once()
-            mocked_update_config.assert_called_once_with(conf.device.pk)
+            mocked_update_config.assert_called_once()
+
+    @mock.patch('openwisp_controller.connection.tasks._update_config')
+    def test_update_config_task_locked(self, mocked_update_config):
+        pk = self._create_device().pk
+        pending_key = UPDATE_CONFIG_PENDING_KEY.format(pk)
+        lock_key = UPDATE_CONFIG_LOCK_KEY.format(pk)
+        cache.set(lock_key, 'token')
+        with mock.patch.object(update_config, 'apply_async') as mocked_apply_async:
+            update_config(pk)
+        # postponed until the running task is finished
+        mocked_apply_async.assert_called_once_with((pk,), countdown=5)
+        mocked_update_config.assert_not_called()
+        # changes performed while waiting don't queue other tasks
+        self.assertTrue(cache.get(pending_key))
+        cache.delete(lock_key)
+
+        with self.subTest('markers are removed when the task is executed'):
+            update_config(pk)
+            mocked_update_config.assert_called_once_with(pk)
+            self.assertIsNone(cache.get(pending_key))
+            self.assertIsNone(cache.get(lock_key))
+
+        with self.subTest('locks acquired by other tasks are not removed'):
+
+            def _update_config(device_id):
+                # the lock expired and another task acquired it
+                cache.set(lock_key, 'token')
+
+            mocked_update_config.side_effect = _update_config
+            update_config(pk)
+            self.assertEqual(cache.get(lock_key), 'token')
+            cache.delete(lock_key)
 
     @mock.patch(_connect_path)
     def test_schedule_command_called(self, connect_mocked):
@@ -1,11 +1,18 @@
+import hashlib
 import os
+import shutil
+import tempfile
+import time
+from io import BytesIO
 from unittest import mock
 
 from django.conf import settings
 from django.test import TestCase
 from swapper import load_model
 
+from .. import settings as app_settings
 from ..connectors.ssh import logger as ssh_logger
+from ..connectors.ssh import session_pool
 from .utils import CreateConnectionsMixin, SshServer
 
 Config = load_model('config', 'Config')
@@ -40,6 +47,43 @@ class TestSsh(CreateConnectionsMixin, TestCase):
             [mock.call('Executing command: echo test'), mock.call('test\n')]
         )
 
+    @mock.patch.object(ssh_logger, 'info')
+    @mock.patch.object(ssh_logger, 'debug')
+    def test_connection_command_output_streamed(self, mocked_debug, mocked_info):
+        ckey = self._create_credentials_with_key(port=self.ssh_server.port)
+        dc = self._create_device_connection(credentials=ckey)
+        dc.connector_instance.connect()
+        chunks = []
+        with mock.patch.object(dc.connector_instance, 'chunk_size', 4):
+            output, exit_code = dc.connector_instance.exec_command(
+                'echo streamed; echo failure >&2',
+                output_callback=chunks.append,
+                raise_unexpected_exit=False,
+            )
+        self.assertEqual(exit_code, 0)
+        self.assertEqual(output, 'streamed\nfailure\n')
+        # lines of different streams are not mixed up
+        self.assertEqual(sorted(chunks), ['failure\n', 'streamed\n'])
+
+        with self.subTest('long lines are sent in parts'):
+            chunks = []
+            with mock.patch.object(
+                dc.connector_instance, 'chunk_size', 4
+            ), mock.patch.object(dc.connector_instance, 'max_line_size', 8):
+                output, exit_code = dc.connector_instance.exec_command(
+                    'printf 0123456789abcdef', output_callback=chunks.append
+                )
+            self.assertEqual(output, '0123456789abcdef')
+            self.assertGreater(len(chunks), 1)
+            self.assertEqual(''.join(chunks), '0123456789abcdef')
+
+        with self.subTest('retained output is limited'):
+            with mock.patch.object(dc.connector_instance, 'max_output_size', 6):
+                output, exit_code = dc.connector_instance.exec_command(
+                    'seq 1 100', output_callback=lambda output: None
+                )
+            self.assertEqual(output, '9\n100\n')
+
     @mock.patch.object(ssh_logger, 'info')
     @mock.patch.object(ssh_logger, 'debug')
     def test_connection_failed_command(self, mocked_debug, mocked_info):
@@ -80,5 +124,121 @@ class TestSsh(CreateConnectionsMixin, TestCase):
         dc.connector_instance.connect()
         # needs a binary file to test all lines
         fl = open(os.path.join(settings.BASE_DIR, '../media/floorplan.jpg'), 'rb')
-        dc.connector_instance.upload(fl, '/tmp/test')
-        putfo_mocked.assert_called_once()
+        size = os.fstat(fl.fileno()).st_size
+        self.addCleanup(fl.close)
+        sent = dc.connector_instance.upload(fl, '/tmp/test')
+        self.assertEqual(sent, size)
+        # the file is not copied in memory
+        putfo_mocked.assert_called_once_with(fl, '/tmp/test', size=size)
+
+        with self.subTest('upload generator'):
+            putfo_mocked.reset_mock()
+            chunks = (b'chunk' for i in range(3))
+            sent = dc.connector_instance.upload(chunks, '/tmp/test')
+            self.assertEqual(sent, 15)
+            args, kwargs = putfo_mocked.call_args
+            self.assertEqual(args[0].read(), b'chunkchunkchunk')
+            self.assertEqual(kwargs['size'], 15)
+
+    def test_connection_upload_resume(self):
+        ckey = self._create_credentials_with_key(port=self.ssh_server.port)
+        dc = self._create_device_connection(credentials=ckey)
+        dc.connector_instance.connect()
+        remote_path = os.path.join(self._get_tmp_dir(), 'upload')
+        data = os.urandom(100000)
+        checksum = hashlib.sha256(data).hexdigest()
+        partial_path = f'{remote_path}.{checksum[:16]}.part'
+        # file left by an interrupted transfer
+        with open(partial_path, 'wb') as f:
+            f.write(data[:30000])
+        sent = dc.connector_instance.upload(BytesIO(data), remote_path, resume=True)
+        self.assertEqual(sent, 70000)
+        with open(remote_path, 'rb') as f:
+            self.assertEqual(f.read(), data)
+        self.assertFalse(os.path.exists(partial_path))
+
+        with self.subTest('existing file with different data'):
+            with open(remote_path, 'wb') as f:
+                f.write(os.urandom(30000))
+            sent = dc.connector_instance.upload(BytesIO(data), remote_path, resume=True)
+            self.assertEqual(sent, 100000)
+            with open(remote_path, 'rb') as f:
+                self.assertEqual(f.read(), data)
+
+    def _get_tmp_dir(self):
+        tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp_dir)
+        return tmp_dir
+
+    @mock.patch.object(app_settings, 'SSH_SESSION_POOL', True)
+    @mock.patch.object(ssh_logger, 'info')
+    def test_connection_session_pool(self, mocked_info):
+        self.addCleanup(session_pool.clear)
+        ckey = self._create_credentials_with_key(port=self.ssh_server.port)
+        dc = self._create_device_connection(credentials=ckey)
+        connector = dc.connector_instance
+        connector.connect()
+        client = connector.shell
+        connector.disconnect()
+        self.assertEqual(len(session_pool), 1)
+        self.assertIsNot(connector.shell, client)
+
+        with self.subTest('session is reused'):
+            dc = DeviceConnection.objects.get(pk=dc.pk)
+            with mock.patch('paramiko.SSHClient.connect') as mocked_connect:
+                dc.connect()
+                mocked_connect.assert_not_called()
+            self.assertTrue(dc.is_working)
+            self.assertIs(dc.connector_instance.shell, client)
+            self.assertEqual(len(session_pool), 0)
+            output, exit_code = dc.connector_instance.exec_command('echo test')
+            self.assertEqual(output, 'test\n')
+            dc.disconnect()
+            self.assertEqual(len(session_pool), 1)
+
+        with self.subTest('session is not reused with different params'):
+            connector = dc.connector_class(
+                params=dict(dc.get_params(), port=2222), addresses=dc.get_addresses()
+            )
+            self.assertNotEqual(connector._pool_key, dc.connector_instance._pool_key)
+            self.assertIsNone(session_pool.acquire(connector._pool_key))
+            self.assertEqual(len(session_pool), 1)
+
+        with self.subTest('closed sessions are not reused'):
+            session_pool.clear()
+            client.close()
+            session_pool.release('key', client)
+            self.assertEqual(len(session_pool), 0)
+
+        with self.subTest('idle sessions are closed'):
+            dc.connect()
+            client = dc.connector_instance.shell
+            dc.disconnect()
+            with mock.patch.object(session_pool, 'idle_timeout', -1):
+                self.assertIsNone(session_pool.acquire('key'))
+            self.assertEqual(len(session_pool), 0)
+            self.assertFalse(session_pool.is_healthy(client))
+
+        with self.subTest('idle sessions are closed by the timer'):
+            session_pool.clear()
+            with mock.patch.object(session_pool, 'idle_timeout', 0.1):
+                dc.connect()
+                client = dc.connector_instance.shell
+                dc.disconnect()
+                self.assertEqual(len(session_pool), 1)
+                time.sleep(0.5)
+            self.assertEqual(len(session_pool), 0)
+            self.assertFalse(session_pool.is_healthy(client))
+
+        with self.subTest('least recently used session is closed'):
+            connector = DeviceConnection.objects.get(pk=dc.pk).connector_instance
+            dc.connect()
+            connector.connect()
+            first, second = dc.connector_instance.shell, connector.shell
+            self.assertIsNot(first, second)
+            with mock.patch.object(session_pool, 'max_size', 1):
+                dc.disconnect()
+                connector.disconnect()
+            self.assertEqual(len(session_pool), 1)
+            self.assertFalse(session_pool.is_healthy(first))
+            self.assertIs(session_pool.acquire(connector._pool_key), second)
@@ -20,24 +20,20 @@ class TestTasks(CreateConnectionsMixin, TestCase):
     )
 
     @mock.patch('logging.Logger.warning')
-    @mock.patch('time.sleep')
-    def test_update_config_missing_config(self, mocked_sleep, mocked_warning):
+    def test_update_config_missing_config(self, mocked_warning):
         pk = self._create_device().pk
         tasks.update_config.delay(pk)
         mocked_warning.assert_called_with(
             f'update_config("{pk}") failed: Device has no config.'
         )
-        mocked_sleep.assert_called_once()
 
     @mock.patch('logging.Logger.warning')
-    @mock.patch('time.sleep')
-    def test_update_config_missing_device(self, mocked_sleep, mocked_warning):
+    def test_update_config_missing_device(self, mocked_warning):
         pk = uuid.uuid4()
         tasks.update_config.delay(pk)
         mocked_warning.assert_called_with(
             f'update_config("{pk}") failed: Device matching query does not exist.'
         )
-        mocked_sleep.assert_called_once()
 
     @mock.patch('logging.Logger.warning')
     def test_launch_command_missing(self, mocked_warning):
@@ -1,4 +1,8 @@
 from django.contrib import admin
+from django.http import HttpResponse
+from django.shortcuts import get_object_or_404
+from django.utils.translation import ugettext_lazy as _
+from django_x509 import settings as x509_settings
 from django_x509.base.admin import AbstractCaAdmin, AbstractCertAdmin
 from reversion.admin import VersionAdmin
 from swapper import load_model
@@ -7,6 +11,7 @@ from openwisp_users.multitenancy import MultitenantOrgFilter
 
 from ..admin import MultitenantAdminMixin
 from .base import PkiReversionTemplatesMixin
+from .utils import send_crl
 
 Ca = load_model('django_x509', 'Ca')
 Cert = load_model('django_x509', 'Cert')
@@ -18,6 +23,12 @@ class CaAdmin(
 ):
     history_latest_first = True
 
+    def crl_view(self, request, pk):
+        if x509_settings.CRL_PROTECTED and not request.user.is_authenticated:
+            return HttpResponse(_('Forbidden'), status=403, content_type='text/plain')
+        instance = get_object_or_404(self.model, pk=pk)
+        return send_crl(request, instance)
+
 
 CaAdmin.fields.insert(2, 'organization')
 CaAdmin.list_filter.insert(0, ('organization', MultitenantOrgFilter))
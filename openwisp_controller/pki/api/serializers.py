@@ -189,3 +189,20 @@ class CertDetailSerializer(BaseSerializer):
 class CertRevokeRenewSerializer(CertDetailSerializer):
     class Meta(CertDetailSerializer.Meta):
         read_only_fields = CertDetailSerializer.Meta.fields
+
+
+class CertBulkRenewRevokeSerializer(serializers.Serializer):
+    certs = serializers.PrimaryKeyRelatedField(
+        many=True,
+        allow_empty=False,
+        queryset=Cert.objects.none(),
+        help_text=_('IDs of the certificates'),
+    )
+
+    def get_fields(self):
+        fields = super().get_fields()
+        view = self.context.get('view')
+        if view:
+            # only certificates of the organizations managed by the user
+            fields['certs'].child_relation.queryset = view.get_queryset()
+        return fields
@@ -20,7 +20,27 @@ def get_pki_api_urls(api_views):
                 api_views.crl_download,
                 name='crl_download',
             ),
+            path(
+                'controller/ca/<str:pk>/delta-crl',
+                api_views.delta_crl_download,
+                name='delta_crl_download',
+            ),
             path('controller/cert/', api_views.cert_list, name='cert_list'),
+            path(
+                'controller/cert/bulk-renew/',
+                api_views.cert_bulk_renew,
+                name='cert_bulk_renew',
+            ),
+            path(
+                'controller/cert/bulk-revoke/',
+                api_views.cert_bulk_revoke,
+                name='cert_bulk_revoke',
+            ),
+            path(
+                'controller/cert/bulk-job/<str:job_id>/',
+                api_views.cert_bulk_job,
+                name='cert_bulk_job',
+            ),
             path(
                 'controller/cert/<str:pk>/', api_views.cert_detail, name='cert_detail'
             ),
@@ -1,7 +1,8 @@
-from django.http import HttpResponse
 from django.shortcuts import get_object_or_404
-from rest_framework import pagination, serializers
+from django_filters import rest_framework as filters
+from rest_framework import pagination, serializers, status
 from rest_framework.authentication import SessionAuthentication
+from rest_framework.exceptions import NotFound
 from rest_framework.generics import (
     GenericAPIView,
     ListCreateAPIView,
@@ -15,10 +16,12 @@ from swapper import load_model
 from openwisp_users.api.authentication import BearerAuthentication
 from openwisp_users.api.mixins import FilterByOrganizationManaged
 
+from ..utils import send_crl
 from .serializers import (
     CaDetailSerializer,
     CaListSerializer,
     CaRenewSerializer,
+    CertBulkRenewRevokeSerializer,
     CertDetailSerializer,
     CertListSerializer,
     CertRevokeRenewSerializer,
@@ -62,26 +65,47 @@ class CaRenewView(ProtectedAPIMixin, GenericAPIView):
         Renews the CA.
         """
         instance = self.get_object()
-        instance.renew()
+        job = instance.renew()
         serializer = CaRenewSerializer(instance)
-        return Response(serializer.data, status=200)
+        # the certificates of the CA are renewed in the background
+        return Response(dict(serializer.data, certs_job=job), status=200)
 
 
 class CrlDownloadView(ProtectedAPIMixin, RetrieveAPIView):
     serializer_class = CaDetailSerializer
     queryset = Ca.objects.none()
 
+    delta = False
+
     def retrieve(self, request, *args, **kwargs):
         instance = get_object_or_404(Ca, pk=kwargs['pk'])
-        return HttpResponse(
-            instance.crl, status=200, content_type='application/x-pem-file'
-        )
+        return send_crl(request, instance, delta=self.delta)
+
+
+class DeltaCrlDownloadView(CrlDownloadView):
+    delta = True
+
+
+class CertFilter(filters.FilterSet):
+    expires_before = filters.IsoDateTimeFilter(
+        field_name='validity_end', lookup_expr='lte'
+    )
+    expires_after = filters.IsoDateTimeFilter(
+        field_name='validity_end', lookup_expr='gte'
+    )
+    ordering = filters.OrderingFilter(fields=['validity_end', 'created'])
+
+    class Meta:
+        model = Cert
+        fields = ['revoked', 'expires_before', 'expires_after']
 
 
 class CertListCreateView(ProtectedAPIMixin, ListCreateAPIView):
     serializer_class = CertListSerializer
     queryset = Cert.objects.order_by('-created')
     pagination_class = ListViewPagination
+    filter_backends = [filters.DjangoFilterBackend]
+    filterset_class = CertFilter
 
 
 class CertDetailView(ProtectedAPIMixin, RetrieveUpdateDestroyAPIView):
@@ -116,11 +140,61 @@ class CertRenewView(CertRevokeRenewBaseView):
         return Response(serializer.data, status=200)
 
 
+class CertBulkRenewRevokeBaseView(ProtectedAPIMixin, GenericAPIView):
+    serializer_class = CertBulkRenewRevokeSerializer
+    queryset = Cert.objects.all()
+    bulk_action = None
+
+    def post(self, request):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        pk_list = {cert.pk for cert in serializer.validated_data['certs']}
+        job = Cert.start_bulk_job(self.bulk_action, pk_list)
+        return Response(job, status=status.HTTP_202_ACCEPTED)
+
+
+class CertBulkRenewView(CertBulkRenewRevokeBaseView):
+    """
+    Renews the certificates in the background, the
+    progress can be retrieved with the job ID returned
+    """
+
+    bulk_action = 'renew'
+
+
+class CertBulkRevokeView(CertBulkRenewRevokeBaseView):
+    """
+    Revokes the certificates in the background, the
+    progress can be retrieved with the job ID returned
+    """
+
+    bulk_action = 'revoke'
+
+
+class CertBulkJobView(ProtectedAPIMixin, GenericAPIView):
+    """
+    Returns the progress of a bulk renewal or revocation of certificates
+    """
+
+    serializer_class = serializers.Serializer
+    queryset = Cert.objects.none()
+
+    def get(self, request, job_id):
+        job = Cert.get_bulk_job(job_id)
+        if not job:
+            raise NotFound()
+        return Response(job, status=200)
+
+
 ca_list = CaListCreateView.as_view()
 ca_detail = CaDetailView.as_view()
 ca_renew = CaRenewView.as_view()
 cert_list = CertListCreateView.as_view()
 cert_detail = CertDetailView.as_view()
 crl_download = CrlDownloadView.as_view()
+delta_crl_download = DeltaCrlDownloadView.as_view()
 cert_revoke = CertRevokeView.as_view()
 cert_renew = CertRenewView.as_view()
+cert_bulk_renew = CertBulkRenewView.as_view()
+cert_bulk_revoke = CertBulkRevokeView.as_view()
+cert_bulk_job = CertBulkJobView.as_view()
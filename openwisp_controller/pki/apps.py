@@ -1,10 +1,13 @@
 from django.conf import settings
+from django.db.models.signals import post_delete, post_save
 from django.utils.translation import ugettext_lazy as _
 from django_x509.apps import DjangoX509Config
-from swapper import get_model_name
+from swapper import get_model_name, load_model
 
 from openwisp_utils.admin_theme.menu import register_menu_group
 
+from .signals import certs_bulk_updated
+
 if not hasattr(settings, 'DJANGO_X509_CA_MODEL'):
     setattr(settings, 'DJANGO_X509_CA_MODEL', 'pki.Ca')
 if not hasattr(settings, 'DJANGO_X509_CERT_MODEL'):
@@ -18,6 +21,34 @@ class PkiConfig(DjangoX509Config):
     def ready(self):
         super().ready()
         self.register_menu_groups()
+        self.connect_signals()
+
+    def connect_signals(self):
+        """
+        keeps the cached CRLs up to date
+        """
+        Ca = load_model('django_x509', 'Ca')
+        Cert = load_model('django_x509', 'Cert')
+        post_save.connect(
+            Ca.cert_change_invalidates_crl,
+            sender=Cert,
+            dispatch_uid='cert_change_invalidates_crl',
+        )
+        post_delete.connect(
+            Ca.cert_delete_invalidates_crl,
+            sender=Cert,
+            dispatch_uid='cert_delete_invalidates_crl',
+        )
+        certs_bulk_updated.connect(
+            Ca.certs_bulk_change_invalidates_crl,
+            sender=Cert,
+            dispatch_uid='certs_bulk_change_invalidates_crl',
+        )
+        post_save.connect(
+            Ca.ca_change_invalidates_crl,
+            sender=Ca,
+            dispatch_uid='ca_change_invalidates_crl',
+        )
 
     def register_menu_groups(self):
         register_menu_group(
@@ -1,4 +1,15 @@
-from django.db import models
+import hashlib
+import os
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from cryptography import x509
+from cryptography.hazmat.backends import default_backend
+from cryptography.hazmat.primitives import hashes, serialization
+from django.core.cache import cache
+from django.db import models, transaction
+from django.utils import timezone
 from django.utils.translation import ugettext_lazy as _
 from django_x509.base.models import AbstractCa as BaseCa
 from django_x509.base.models import AbstractCert as BaseCert
@@ -6,10 +17,34 @@ from swapper import get_model_name
 
 from openwisp_users.mixins import ShareableOrgMixin
 
+from .. import settings as app_settings
+from ..signals import certs_bulk_updated
+from ..tasks import bulk_renew_revoke_certs
 from ..utils import UnqiueCommonNameMixin
 
 
-class AbstractCa(ShareableOrgMixin, UnqiueCommonNameMixin, BaseCa):
+class RenewalMixin(object):
+    def renew(self):
+        self._set_renewal_fields(validity_end=self.__class__().validity_end)
+        self._generate()
+        self.save()
+
+    def _set_renewal_fields(self, validity_end):
+        # must be set before generating the certificate,
+        # otherwise the certificate does not contain them
+        self.serial_number = self._generate_serial_number()
+        self.validity_end = validity_end
+
+
+class AbstractCa(ShareableOrgMixin, UnqiueCommonNameMixin, RenewalMixin, BaseCa):
+    # the state of the CRL (number, dates, checksum of the revoked
+    # certificates) and each signed CRL are stored in separate keys,
+    # so that every cache value stays small
+    _CRL_CACHE_KEY = 'pki_ca_crl_state_{}'
+    _CRL_PEM_CACHE_KEY = 'pki_ca_crl_pem_{}_{}'
+    _DELTA_CRL_PEM_CACHE_KEY = 'pki_ca_delta_crl_pem_{}_{}'
+    _CRL_VERSION_KEY = 'pki_ca_crl_version_{}'
+
     class Meta(BaseCa.Meta):
         abstract = True
         constraints = [
@@ -19,8 +54,224 @@ class AbstractCa(ShareableOrgMixin, UnqiueCommonNameMixin, BaseCa):
             ),
         ]
 
+    def renew(self):
+        """
+        Renews the CA, its certificates are renewed in the background
+        (see ``AbstractCert.start_bulk_job``); returns the information
+        about the renewal of the certificates
+        """
+        # skips the renewal of the certificates one by one
+        RenewalMixin.renew(self)
+        pk_list = self.cert_set.values_list('pk', flat=True)
+        return self.cert_set.model.start_bulk_job('renew', pk_list)
+
+    def load_keys(self):
+        """
+        Loads the certificate and the private key of the CA (both are
+        cached properties) and returns them; called before signing
+        certificates in parallel threads, so that the threads share
+        the same objects instead of loading them concurrently
+        """
+        return self.x509, self.pkey
+
+    @property
+    def crl(self):
+        """
+        Returns up to date CRL of this CA
+        """
+        return self.get_crl()['crl']
+
+    def get_crl(self, delta=False):
+        """
+        Returns a dictionary containing the CRL of this CA (``crl``),
+        its CRL number (``number``) and its issue date (``last_update``).
+
+        If ``delta`` is ``True``, returns a delta CRL which contains only
+        the certificates revoked after the last complete rebuild of the CRL.
+
+        The CRL is kept in the cache and the revoked certificates are
+        loaded from the database only after certificates of the CA have
+        changed: the CRL is signed again (with a new CRL number) only if
+        the list of revoked certificates is different.
+        The CRL is rebuilt from scratch when half of its validity has passed.
+        """
+        version_key = self._CRL_VERSION_KEY.format(self.pk)
+        # must be read before querying the database
+        version = cache.get(version_key)
+        if version is None:
+            version = uuid.uuid4().hex
+            cache.set(version_key, version, None)
+        now = timezone.now()
+        validity = timedelta(days=app_settings.CRL_VALIDITY)
+        state = cache.get(self._CRL_CACHE_KEY.format(self.pk))
+        if state is None or now - state['base_update'] > validity / 2:
+            state = self._build_crl_state(state, now)
+        entries = None
+        if state['version'] != version:
+            entries = self._sync_crl_state(state, version, now)
+        crl = cache.get(self._get_crl_pem_cache_key(state, delta))
+        if crl is None:
+            # the signed CRL has been evicted from the cache
+            if entries is None:
+                entries = self._sync_crl_state(state, version, now)
+            crl = self._sign_crl(state, entries, delta=delta)
+            cache.set(
+                self._get_crl_pem_cache_key(state, delta),
+                crl,
+                validity.total_seconds(),
+            )
+        return {
+            'crl': crl,
+            'number': state['number'],
+            'last_update': state['last_update'],
+        }
+
+    def _get_crl_entries(self):
+        """
+        Returns a list of tuples containing the serial number, the
+        revocation date and the validity of the revoked certificates
+        """
+        return list(
+            self.cert_set.filter(revoked=True, validity_end__gte=timezone.now())
+            .order_by('pk')
+            .values_list(
+                'serial_number', 'revoked_at', 'validity_start', 'validity_end'
+            )
+        )
+
+    def _build_crl_state(self, previous, now):
+        number = self._get_crl_number(previous, now)
+        return {
+            'number': number,
+            'last_update': now,
+            'base_number': number,
+            'base_update': now,
+            # set by _sync_crl_state
+            'version': None,
+            'checksum': None,
+        }
+
+    def _sync_crl_state(self, state, version, now):
+        """
+        Loads the revoked certificates, assigns a new CRL number to the
+        CRL if they changed and stores the state in the cache;
+        returns the revoked certificates
+        """
+        entries = self._get_crl_entries()
+        checksum = hashlib.md5(repr(entries).encode()).hexdigest()
+        if state['checksum'] is not None and state['checksum'] != checksum:
+            state.update(
+                {'number': self._get_crl_number(state, now), 'last_update': now}
+            )
+        state.update({'version': version, 'checksum': checksum})
+        cache.set(
+            self._CRL_CACHE_KEY.format(self.pk),
+            state,
+            timedelta(days=app_settings.CRL_VALIDITY).total_seconds(),
+        )
+        return entries
+
+    def _get_crl_pem_cache_key(self, state, delta=False):
+        key = self._DELTA_CRL_PEM_CACHE_KEY if delta else self._CRL_PEM_CACHE_KEY
+        return key.format(self.pk, state['number'])
+
+    def _get_crl_number(self, previous, now):
+        """
+        CRL numbers must always increase, timestamps (in microseconds)
+        are used in order to survive the eviction of the cache
+        """
+        number = int(now.timestamp()) * 10 ** 6 + now.microsecond
+        if previous:
+            number = max(number, previous['number'] + 1)
+        return number
+
+    def _sign_crl(self, state, entries, delta=False):
+        now = timezone.now()
+        last_update = state['last_update']
+        builder = (
+            x509.CertificateRevocationListBuilder()
+            .issuer_name(self.x509.to_cryptography().subject)
+            .last_update(last_update)
+            .next_update(last_update + timedelta(days=app_settings.CRL_VALIDITY))
+            .add_extension(x509.CRLNumber(state['number']), critical=False)
+        )
+        if delta:
+            builder = builder.add_extension(
+                x509.DeltaCRLIndicator(state['base_number']), critical=True
+            )
+        for serial_number, revoked_at, start, end in entries:
+            if not start <= now <= end:
+                continue
+            # certificates revoked before the complete rebuild
+            if delta and revoked_at and revoked_at < state['base_update']:
+                continue
+            revoked = (
+                x509.RevokedCertificateBuilder()
+                .serial_number(int(serial_number))
+                .revocation_date(revoked_at or last_update)
+                .build(default_backend())
+            )
+            builder = builder.add_revoked_certificate(revoked)
+        crl = builder.sign(
+            private_key=self.pkey.to_cryptography_key(),
+            algorithm=hashes.SHA256(),
+            backend=default_backend(),
+        )
+        return crl.public_bytes(serialization.Encoding.PEM)
+
+    @classmethod
+    def invalidate_crl(cls, ca_id):
+        """
+        Flags the cached CRL of the CA as outdated, the revoked
+        certificates are loaded again the next time it's requested
+        """
+
+        def invalidate():
+            cache.set(cls._CRL_VERSION_KEY.format(ca_id), uuid.uuid4().hex, None)
+
+        invalidate()
+        # the changes may not be visible to other
+        # connections until the transaction is committed
+        transaction.on_commit(invalidate)
 
-class AbstractCert(ShareableOrgMixin, UnqiueCommonNameMixin, BaseCert):
+    @classmethod
+    def delete_crl(cls, ca_id):
+        """
+        Deletes the cached CRL of the CA, the
+        CRL is rebuilt the next time it's requested
+        """
+
+        def delete():
+            cache.delete(cls._CRL_CACHE_KEY.format(ca_id))
+
+        delete()
+        transaction.on_commit(delete)
+
+    @classmethod
+    def cert_change_invalidates_crl(cls, instance, created=False, **kwargs):
+        # new certificates which are not revoked are not listed in the CRL
+        if created and not instance.revoked:
+            return
+        cls.invalidate_crl(instance.ca_id)
+
+    @classmethod
+    def cert_delete_invalidates_crl(cls, instance, **kwargs):
+        if instance.revoked:
+            cls.delete_crl(instance.ca_id)
+
+    @classmethod
+    def certs_bulk_change_invalidates_crl(cls, instances, **kwargs):
+        for ca_id in {cert.ca_id for cert in instances if cert.revoked}:
+            cls.invalidate_crl(ca_id)
+
+    @classmethod
+    def ca_change_invalidates_crl(cls, instance, created=False, **kwargs):
+        # the key of the CA may have changed (eg: renewal)
+        if not created:
+            cls.delete_crl(instance.pk)
+
+
+class AbstractCert(ShareableOrgMixin, UnqiueCommonNameMixin, RenewalMixin, BaseCert):
 
     ca = models.ForeignKey(
         get_model_name('django_x509', 'Ca'),
@@ -36,6 +287,116 @@ class AbstractCert(ShareableOrgMixin, UnqiueCommonNameMixin, BaseCert):
                 name='%(app_label)s_%(class)s_comman_name_and_organization_is_unique',
             ),
         ]
+        indexes = [
+            models.Index(
+                fields=['validity_end'], name='%(app_label)s_%(class)s_expiry'
+            ),
+        ]
+
+    _BULK_JOB_CACHE_KEY = 'pki_cert_bulk_job_{}'
+    _BULK_JOB_TIMEOUT = 60 * 60 * 24
 
     def clean(self):
         self._validate_org_relation('ca')
+
+    @classmethod
+    def get_expiring(cls, days):
+        """
+        returns the certificates which are not revoked and expire within
+        ``days`` days (expired ones included), ordered by expiration date
+        """
+        validity_end = timezone.now() + timedelta(days=days)
+        return cls.objects.filter(
+            revoked=False, validity_end__lte=validity_end
+        ).order_by('validity_end')
+
+    @classmethod
+    def start_bulk_job(cls, action, pk_list):
+        """
+        Renews or revokes (``action``) the certificates in ``pk_list``
+        in the background: the certificates are split in chunks which are
+        processed in parallel by ``bulk_renew_revoke_certs`` after the
+        current transaction is committed; returns the information about
+        the job (see ``get_bulk_job``)
+        """
+        assert action in ['renew', 'revoke']
+        pk_list = [str(pk) for pk in pk_list]
+        job_id = uuid.uuid4().hex
+        cache_key = cls._BULK_JOB_CACHE_KEY.format(job_id)
+        cache.set_many(
+            {
+                cache_key: {'id': job_id, 'action': action, 'total': len(pk_list)},
+                f'{cache_key}_done': 0,
+            },
+            timeout=cls._BULK_JOB_TIMEOUT,
+        )
+        size = app_settings.CERT_BULK_CHUNK_SIZE
+
+        def dispatch():
+            for start in range(0, len(pk_list), size):
+                end = start + size
+                bulk_renew_revoke_certs.delay(action, pk_list[start:end], job_id)
+
+        transaction.on_commit(dispatch)
+        return {'id': job_id, 'action': action, 'total': len(pk_list), 'done': 0}
+
+    @classmethod
+    def get_bulk_job(cls, job_id):
+        """
+        returns the progress of a bulk job, eg:
+        ``{'id': <job id>, 'action': 'renew', 'total': 10, 'done': 5}``;
+        returns ``None`` if the information is not available
+        """
+        cache_key = cls._BULK_JOB_CACHE_KEY.format(job_id)
+        job = cache.get(cache_key)
+        if not job:
+            return None
+        done = cache.get(f'{cache_key}_done', 0)
+        return dict(job, done=min(done, job['total']))
+
+    @classmethod
+    def _update_bulk_job_progress(cls, job_id, count):
+        try:
+            cache.incr(f'{cls._BULK_JOB_CACHE_KEY.format(job_id)}_done', count)
+        except ValueError:
+            # job information evicted from the cache
+            pass
+
+    @classmethod
+    def _bulk_renew_revoke(cls, action, pk_list):
+        """
+        renews or revokes the specified certificates: the new
+        certificates are generated in parallel (OpenSSL releases
+        the GIL while generating keys), the certificates are saved
+        with one query and ``certs_bulk_updated`` is emitted once
+        """
+        now = timezone.now()
+        certs = list(cls.objects.filter(pk__in=pk_list).select_related('ca'))
+        if action == 'revoke':
+            certs = [cert for cert in certs if not cert.revoked]
+            for cert in certs:
+                cert.revoked = True
+                cert.revoked_at = now
+            fields = ['revoked', 'revoked_at']
+        else:
+            validity_end = cls().validity_end
+            cas = {}
+            for cert in certs:
+                # the keys of each CA are loaded only once
+                cert.ca = cas.setdefault(cert.ca_id, cert.ca)
+                cert._set_renewal_fields(validity_end)
+            for ca in cas.values():
+                ca.load_keys()
+            if certs:
+                workers = min(len(certs), os.cpu_count() or 1)
+                with ThreadPoolExecutor(max_workers=workers) as executor:
+                    list(executor.map(lambda cert: cert._generate(), certs))
+            fields = ['certificate', 'private_key', 'serial_number', 'validity_end']
+        if not certs:
+            return
+        # bulk_update does not update the modification date automatically
+        for cert in certs:
+            cert.modified = now
+        with transaction.atomic():
+            cls.objects.bulk_update(certs, fields + ['modified'])
+            certs_bulk_updated.send(sender=cls, instances=certs, action=action)
@@ -0,0 +1,55 @@
+from django.core.management.base import BaseCommand, CommandError
+from swapper import load_model
+
+Cert = load_model('django_x509', 'Cert')
+Organization = load_model('openwisp_users', 'Organization')
+
+
+class Command(BaseCommand):
+    help = (
+        'Lists the certificates which are not revoked and expire '
+        'within the specified number of days (expired ones included)'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days',
+            type=int,
+            default=30,
+            help='number of days from now (default: 30)',
+        )
+        parser.add_argument(
+            '--organization',
+            help='slug of the organization of the certificates',
+        )
+        parser.add_argument(
+            '--renew',
+            action='store_true',
+            help='renews the certificates in the background',
+        )
+
+    def handle(self, *args, **options):
+        certs = Cert.get_expiring(options['days']).select_related('organization')
+        if options['organization']:
+            try:
+                organization = Organization.objects.get(slug=options['organization'])
+            except Organization.DoesNotExist:
+                raise CommandError(
+                    f'organization "{options["organization"]}" does not exist'
+                )
+            certs = certs.filter(organization=organization)
+        pk_list = []
+        for cert in certs.iterator():
+            organization = cert.organization.slug if cert.organization else '-'
+            self.stdout.write(
+                f'{cert.validity_end.isoformat()} {cert.pk} '
+                f'{organization} {cert.common_name}'
+            )
+            pk_list.append(cert.pk)
+        if not options['renew']:
+            self.stdout.write(f'{len(pk_list)} certificates expiring')
+            return
+        job = Cert.start_bulk_job('renew', pk_list)
+        self.stdout.write(
+            f'renewal of {len(pk_list)} certificates started (job: {job["id"]})'
+        )
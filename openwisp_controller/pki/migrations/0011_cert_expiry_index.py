@@ -0,0 +1,15 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pki', '0010_common_name_organization_unique'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='cert',
+            index=models.Index(fields=['validity_end'], name='pki_cert_expiry'),
+        ),
+    ]
@@ -0,0 +1,9 @@
+from django.conf import settings
+
+# number of days after which the CRLs expire
+CRL_VALIDITY = getattr(settings, 'OPENWISP_CONTROLLER_CRL_VALIDITY', 1)
+# number of certificates processed by each
+# task of the bulk renewal and revocation jobs
+CERT_BULK_CHUNK_SIZE = getattr(
+    settings, 'OPENWISP_CONTROLLER_CERT_BULK_CHUNK_SIZE', 100
+)
@@ -0,0 +1,3 @@
+from django.dispatch import Signal
+
+certs_bulk_updated = Signal(providing_args=['instances', 'action'])
@@ -0,0 +1,35 @@
+import logging
+
+from celery import shared_task
+from celery.exceptions import SoftTimeLimitExceeded
+from swapper import load_model
+
+logger = logging.getLogger(__name__)
+
+
+@shared_task(soft_time_limit=1200)
+def bulk_renew_revoke_certs(action, pk_list, job_id):
+    """
+    Renews or revokes (``action``) a chunk of the certificates
+    of a bulk job; if the soft time limit is hit the chunk is
+    split in two halves which are processed by two new tasks
+    """
+    Cert = load_model('django_x509', 'Cert')
+    try:
+        Cert._bulk_renew_revoke(action, pk_list)
+    except SoftTimeLimitExceeded:
+        if len(pk_list) < 2:
+            logger.error(
+                f'soft time limit hit while executing bulk {action} of '
+                f'certificates (job: {job_id}), certificate IDs: {pk_list}'
+            )
+            return
+        logger.warning(
+            f'soft time limit hit while executing bulk {action} of certificates '
+            f'(job: {job_id}), splitting chunk of {len(pk_list)} certificates'
+        )
+        half = len(pk_list) // 2
+        for chunk in (pk_list[:half], pk_list[half:]):
+            bulk_renew_revoke_certs.delay(action, chunk, job_id)
+        return
+    Cert._update_bulk_job_progress(job_id, len(pk_list))
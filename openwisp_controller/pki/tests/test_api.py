@@ -1,11 +1,17 @@
-from django.test import TestCase
+from datetime import timedelta
+from unittest import mock
+
+from django.test import TestCase, TransactionTestCase
 from django.urls import reverse
+from django.utils import timezone
+from OpenSSL import crypto
 from swapper import load_model
 
 from openwisp_controller.tests.utils import TestAdminMixin
 from openwisp_users.tests.utils import TestOrganizationMixin
 from openwisp_utils.tests import AssertNumQueriesSubTestMixin
 
+from .. import settings as app_settings
 from .utils import TestPkiMixin
 
 Ca = load_model('django_x509', 'Ca')
@@ -137,6 +143,54 @@ class TestPkiApi(
         with self.assertNumQueries(4):
             r = self.client.get(path)
         self.assertEqual(r.status_code, 200)
+        self.assertIn('Last-Modified', r)
+
+        with self.subTest('CRL not modified'):
+            with self.assertNumQueries(3):
+                r = self.client.get(path, HTTP_IF_NONE_MATCH=r['ETag'])
+            self.assertEqual(r.status_code, 304)
+
+        with self.subTest('CRL modified'):
+            etag = r['ETag']
+            self._create_cert(ca=ca1, organization=self._get_org(), revoked=True)
+            r = self.client.get(path, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(r.status_code, 200)
+            self.assertNotEqual(r['ETag'], etag)
+
+        with self.subTest('delta CRL'):
+            path = reverse('pki_api:delta_crl_download', args=[ca1.pk])
+            r = self.client.get(path)
+            self.assertEqual(r.status_code, 200)
+            self.assertEqual(r['Content-Type'], 'application/x-pem-file')
+
+    def test_cert_list_expiry_filter(self):
+        ca = self._create_ca()
+        now = timezone.now()
+        cert1 = self._create_cert(
+            ca=ca, name='cert1', common_name='cert1', validity_end=now + timedelta(10)
+        )
+        cert2 = self._create_cert(
+            ca=ca, name='cert2', common_name='cert2', validity_end=now + timedelta(5)
+        )
+        self._create_cert(ca=ca, name='cert3', common_name='cert3')
+        path = reverse('pki_api:cert_list')
+        r = self.client.get(
+            path,
+            {
+                'expires_before': (now + timedelta(30)).isoformat(),
+                'ordering': 'validity_end',
+            },
+        )
+        self.assertEqual(r.status_code, 200)
+        self.assertEqual(r.data['count'], 2)
+        self.assertEqual(
+            [cert['id'] for cert in r.data['results']], [cert2.pk, cert1.pk]
+        )
+        r = self.client.get(
+            path, {'expires_after': (now + timedelta(6)).isoformat(), 'revoked': False}
+        )
+        self.assertEqual(r.data['count'], 2)
+        self.assertNotIn(cert2.pk, [cert['id'] for cert in r.data['results']])
 
     def test_ca_delete_api(self):
         ca1 = self._create_ca(name='ca1', organization=self._get_org())
@@ -156,6 +210,12 @@ class TestPkiApi(
         self.assertEqual(r.status_code, 200)
         self.assertNotEqual(ca1.serial_number, old_serial_num)
         self.assertNotEqual(r.data['serial_number'], old_serial_num)
+        # the renewed certificate contains the new serial number and validity
+        x509 = crypto.load_certificate(crypto.FILETYPE_PEM, ca1.certificate)
+        self.assertEqual(x509.get_serial_number(), int(ca1.serial_number))
+        self.assertEqual(
+            x509.get_notAfter().decode(), ca1.validity_end.strftime('%Y%m%d%H%M%SZ')
+        )
 
     def test_cert_post_api(self):
         path = reverse('pki_api:cert_list')
@@ -291,3 +351,80 @@ class TestPkiApi(
         self.assertEqual(r.status_code, 200)
         self.assertTrue(cert1.revoked)
         self.assertTrue(r.data['revoked'])
+
+
+class TestPkiBulkJobApi(
+    TestAdminMixin, TestPkiMixin, TestOrganizationMixin, TransactionTestCase
+):
+    def setUp(self):
+        super().setUp()
+        self._login()
+
+    def _get_serial_number(self, cert):
+        x509 = crypto.load_certificate(crypto.FILETYPE_PEM, cert.certificate)
+        return x509.get_serial_number()
+
+    @mock.patch.object(app_settings, 'CERT_BULK_CHUNK_SIZE', 2)
+    def test_cert_bulk_renew_revoke_api(self):
+        ca = self._create_ca()
+        certs = [
+            self._create_cert(ca=ca, name=name, common_name=name)
+            for name in ['cert1', 'cert2', 'cert3']
+        ]
+        old_serial_numbers = [cert.serial_number for cert in certs]
+        data = {'certs': [cert.pk for cert in certs]}
+
+        with self.subTest('renew'):
+            path = reverse('pki_api:cert_bulk_renew')
+            r = self.client.post(path, data, content_type='application/json')
+            self.assertEqual(r.status_code, 202)
+            self.assertEqual(r.data['action'], 'renew')
+            self.assertEqual(r.data['total'], 3)
+            r = self.client.get(reverse('pki_api:cert_bulk_job', args=[r.data['id']]))
+            self.assertEqual(r.status_code, 200)
+            self.assertEqual(r.data['done'], 3)
+            for cert, old_serial_number in zip(certs, old_serial_numbers):
+                cert.refresh_from_db()
+                self.assertNotEqual(cert.serial_number, old_serial_number)
+                self.assertEqual(self._get_serial_number(cert), int(cert.serial_number))
+
+        with self.subTest('revoke'):
+            path = reverse('pki_api:cert_bulk_revoke')
+            r = self.client.post(
+                path, {'certs': [certs[0].pk]}, content_type='application/json'
+            )
+            self.assertEqual(r.status_code, 202)
+            self.assertEqual(r.data['total'], 1)
+            certs[0].refresh_from_db()
+            self.assertTrue(certs[0].revoked)
+            self.assertIsNotNone(certs[0].revoked_at)
+            self.assertEqual(Cert.objects.filter(revoked=True).count(), 1)
+            revoked_list = crypto.load_crl(crypto.FILETYPE_PEM, ca.crl).get_revoked()
+            self.assertEqual(len(revoked_list), 1)
+
+        with self.subTest('invalid certificates'):
+            r = self.client.post(path, {'certs': [0]}, content_type='application/json')
+            self.assertEqual(r.status_code, 400)
+            self.assertIn('certs', r.data)
+            r = self.client.post(path, {'certs': []}, content_type='application/json')
+            self.assertEqual(r.status_code, 400)
+
+        with self.subTest('job not found'):
+            r = self.client.get(reverse('pki_api:cert_bulk_job', args=['wrong']))
+            self.assertEqual(r.status_code, 404)
+
+    def test_ca_renew_api_renews_certs(self):
+        ca = self._create_ca()
+        cert = self._create_cert(ca=ca)
+        old_serial_number = cert.serial_number
+        r = self.client.post(reverse('pki_api:ca_renew', args=[ca.pk]))
+        self.assertEqual(r.status_code, 200)
+        self.assertEqual(r.data['certs_job']['total'], 1)
+        cert.refresh_from_db()
+        self.assertNotEqual(cert.serial_number, old_serial_number)
+        # the certificate is signed by the renewed CA
+        ca.refresh_from_db()
+        store = crypto.X509Store()
+        store.add_cert(crypto.load_certificate(crypto.FILETYPE_PEM, ca.certificate))
+        x509 = crypto.load_certificate(crypto.FILETYPE_PEM, cert.certificate)
+        crypto.X509StoreContext(store, x509).verify_certificate()
@@ -1,6 +1,14 @@
+from datetime import timedelta
+from io import StringIO
+
+from cryptography import x509
+from cryptography.hazmat.backends import default_backend
+from django.core.cache import cache
 from django.core.exceptions import ValidationError
+from django.core.management import CommandError, call_command
 from django.test import TestCase
 from django.urls import reverse
+from django.utils import timezone
 from OpenSSL import crypto
 from swapper import load_model
 
@@ -55,6 +63,99 @@ class TestModels(TestAdminMixin, TestPkiMixin, TestOrganizationMixin, TestCase):
         revoked_list = crl.get_revoked()
         self.assertIsNone(revoked_list)
 
+    def test_crl_cache(self):
+        ca = self._create_ca()
+        cert1 = self._create_cert(ca=ca, common_name='cert1')
+        cert2 = self._create_cert(ca=ca, common_name='cert2')
+        with self.assertNumQueries(1):
+            crl = ca.get_crl()
+        with self.assertNumQueries(0):
+            self.assertEqual(ca.get_crl(), crl)
+        self.assertIsNone(
+            crypto.load_crl(crypto.FILETYPE_PEM, crl['crl']).get_revoked()
+        )
+
+        with self.subTest('revoked certificates are loaded incrementally'):
+            cert1.revoke()
+            with self.assertNumQueries(1):
+                crl2 = ca.get_crl()
+            self.assertGreater(crl2['number'], crl['number'])
+            revoked_list = crypto.load_crl(
+                crypto.FILETYPE_PEM, crl2['crl']
+            ).get_revoked()
+            self.assertEqual(len(revoked_list), 1)
+            self.assertEqual(
+                int(revoked_list[0].get_serial(), 16), int(cert1.serial_number)
+            )
+            self.assertEqual(ca.crl, crl2['crl'])
+
+        with self.subTest('delta CRL'):
+            cert2.revoke()
+            crl3 = ca.get_crl()
+            delta = ca.get_crl(delta=True)
+            self.assertEqual(delta['number'], crl3['number'])
+            delta_crl = x509.load_pem_x509_crl(delta['crl'], default_backend())
+            indicator = delta_crl.extensions.get_extension_for_class(
+                x509.DeltaCRLIndicator
+            )
+            self.assertEqual(indicator.value.crl_number, crl['number'])
+            self.assertEqual(
+                sorted(revoked.serial_number for revoked in delta_crl),
+                sorted([int(cert1.serial_number), int(cert2.serial_number)]),
+            )
+
+        with self.subTest('CRL number changes only if revoked certs change'):
+            cert3 = self._create_cert(ca=ca, common_name='cert3')
+            cert3.name = 'changed'
+            cert3.save()
+            with self.assertNumQueries(1):
+                self.assertEqual(ca.get_crl(), crl3)
+
+        with self.subTest('cache values contain only the signed CRL'):
+            state = cache.get(ca._CRL_CACHE_KEY.format(ca.pk))
+            self.assertNotIn('crl', state)
+            self.assertEqual(state['number'], crl3['number'])
+            self.assertEqual(cache.get(ca._get_crl_pem_cache_key(state)), crl3['crl'])
+
+        with self.subTest('deleting a revoked certificate rebuilds the CRL'):
+            cert1.delete()
+            crl4 = ca.get_crl()
+            self.assertGreater(crl4['number'], crl3['number'])
+            revoked_list = crypto.load_crl(
+                crypto.FILETYPE_PEM, crl4['crl']
+            ).get_revoked()
+            self.assertEqual(len(revoked_list), 1)
+            with self.assertNumQueries(1):
+                delta = ca.get_crl(delta=True)
+            delta_crl = x509.load_pem_x509_crl(delta['crl'], default_backend())
+            self.assertEqual(len(delta_crl), 0)
+
+    def test_list_expiring_certs_command(self):
+        ca = self._create_ca()
+        cert = self._create_cert(
+            ca=ca, validity_end=timezone.now() + timedelta(days=10)
+        )
+        self._create_cert(ca=ca, common_name='not-expiring')
+        revoked = self._create_cert(
+            ca=ca,
+            common_name='revoked',
+            validity_end=timezone.now() + timedelta(days=10),
+        )
+        revoked.revoke()
+        stdout = StringIO()
+        call_command('list_expiring_certs', days=30, stdout=stdout)
+        output = stdout.getvalue()
+        self.assertIn(f'{cert.pk} - {cert.common_name}', output)
+        self.assertIn('1 certificates expiring', output)
+
+        with self.subTest('organization'):
+            org = self._get_org()
+            stdout = StringIO()
+            call_command('list_expiring_certs', organization=org.slug, stdout=stdout)
+            self.assertIn('0 certificates expiring', stdout.getvalue())
+            with self.assertRaises(CommandError):
+                call_command('list_expiring_certs', organization='wrong')
+
     def test_unique_together_org_none(self):
         ca = self._create_ca(organization=None, common_name='common_name')
         with self.assertRaises(ValidationError):
@@ -1,4 +1,7 @@
 from django.core.exceptions import ValidationError
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response, quote_etag
+from django.utils.http import http_date
 
 
 class UnqiueCommonNameMixin(object):
@@ -20,3 +23,22 @@ class UnqiueCommonNameMixin(object):
                     ]
                 }
             )
+
+
+def send_crl(request, ca, delta=False):
+    """
+    returns the (delta) CRL of ``ca``, or a response with status
+    code 304 if the client already has the latest version of the CRL
+    (``If-None-Match`` and ``If-Modified-Since`` are supported)
+    """
+    crl = ca.get_crl(delta=delta)
+    etag = quote_etag(str(crl['number']))
+    last_modified = int(crl['last_update'].timestamp())
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is None:
+        response = HttpResponse(
+            crl['crl'], status=200, content_type='application/x-pem-file'
+        )
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(last_modified)
+    return response
@@ -0,0 +1,234 @@
+#!/usr/bin/env python
+"""
+Benchmark suite for the controller endpoints polled by devices.
+
+Creates a throwaway database, simulates N devices which poll the checksum,
+report their status and download their configuration, then reports
+throughput, latency percentiles, query counts and cache hit ratio of
+each endpoint.
+
+Usage (from the root directory of the repository):
+
+    ./tests/benchmark.py --devices 100 --templates 5 --rounds 10
+
+The database can be changed in ``tests/openwisp2/local_settings.py``
+(eg: to benchmark PostgreSQL), the local memory cache is used by default.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from collections import defaultdict
+from statistics import mean, quantiles
+
+ENDPOINTS = ['device_checksum', 'device_report_status', 'device_download_config']
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[1])
+    parser.add_argument('--devices', type=int, default=50)
+    parser.add_argument('--templates', type=int, default=3)
+    parser.add_argument(
+        '--rounds', type=int, default=5, help='polling cycles performed by each device'
+    )
+    parser.add_argument(
+        '--output', help='writes results to the specified file in JSON format'
+    )
+    args = parser.parse_args()
+    # latency percentiles need at least two samples per endpoint
+    if args.devices < 1 or args.rounds < 1 or args.devices * args.rounds < 2:
+        parser.error('--devices multiplied by --rounds must be at least 2')
+    return args
+
+
+class CacheCounter(object):
+    """
+    wraps ``cache.get`` in order to count hits and misses
+    """
+
+    _missing = object()
+
+    def __init__(self, cache):
+        self.cache = cache
+        self.hits = 0
+        self.misses = 0
+
+    def __enter__(self):
+        self._get = self.cache.get
+        self.cache.get = self.get
+        return self
+
+    def __exit__(self, *args):
+        self.cache.get = self._get
+
+    def get(self, key, default=None, **kwargs):
+        value = self._get(key, self._missing, **kwargs)
+        if value is self._missing:
+            self.misses += 1
+            return default
+        self.hits += 1
+        return value
+
+
+def create_fixtures(num_devices, num_templates):
+    from swapper import load_model
+
+    Config = load_model('config', 'Config')
+    Device = load_model('config', 'Device')
+    Organization = load_model('openwisp_users', 'Organization')
+    Template = load_model('config', 'Template')
+
+    org = Organization.objects.create(name='benchmark', slug='benchmark')
+    templates = []
+    for i in range(num_templates):
+        template = Template(
+            name=f'benchmark-{i}',
+            organization=org,
+            backend='netjsonconfig.OpenWrt',
+            config={
+                'interfaces': [
+                    {
+                        'name': f'eth{i}',
+                        'type': 'ethernet',
+                        'addresses': [
+                            {
+                                'proto': 'static',
+                                'family': 'ipv4',
+                                'address': f'10.{i}.0.1',
+                                'mask': 24,
+                            }
+                        ],
+                    }
+                ]
+            },
+        )
+        template.full_clean()
+        template.save()
+        templates.append(template)
+    devices = []
+    for i in range(num_devices):
+        device = Device.objects.create(
+            name=f'benchmark-{i}',
+            organization=org,
+            mac_address='02:00:00:{:02x}:{:02x}:{:02x}'.format(
+                i >> 16 & 0xFF, i >> 8 & 0xFF, i & 0xFF
+            ),
+        )
+        config = Config.objects.create(
+            device=device,
+            backend='netjsonconfig.OpenWrt',
+            config={'general': {'hostname': f'benchmark-{i}'}},
+        )
+        config.templates.add(*templates)
+        devices.append(device)
+    return devices
+
+
+def poll(client, device, remote_addr):
+    """
+    yields (endpoint, callable) for each request
+    performed by a device during a polling cycle
+    """
+    from django.urls import reverse
+
+    params = {'key': device.key, 'management_ip': remote_addr}
+    kwargs = {'REMOTE_ADDR': remote_addr}
+    for endpoint in ENDPOINTS:
+        url = reverse(f'controller:{endpoint}', args=[device.pk])
+        if endpoint == 'device_report_status':
+            yield endpoint, lambda: client.post(
+                url, {'key': device.key, 'status': 'applied'}, **kwargs
+            )
+        else:
+            yield endpoint, lambda: client.get(url, params, **kwargs)
+
+
+def run(devices, rounds):
+    from django.core.cache import cache
+    from django.db import connection
+    from django.test import Client
+    from django.test.utils import CaptureQueriesContext
+
+    client = Client()
+    timings = defaultdict(list)
+    queries = defaultdict(list)
+    hits = defaultdict(int)
+    misses = defaultdict(int)
+    for _ in range(rounds):
+        for i, device in enumerate(devices):
+            remote_addr = f'10.255.{i >> 8 & 0xFF}.{i & 0xFF}'
+            for endpoint, request in poll(client, device, remote_addr):
+                with CacheCounter(cache) as counter, CaptureQueriesContext(
+                    connection
+                ) as captured:
+                    start = time.perf_counter()
+                    response = request()
+                    timings[endpoint].append(time.perf_counter() - start)
+                assert response.status_code == 200, (endpoint, response.status_code)
+                queries[endpoint].append(len(captured))
+                hits[endpoint] += counter.hits
+                misses[endpoint] += counter.misses
+    results = {}
+    for endpoint in ENDPOINTS:
+        durations = timings[endpoint]
+        percentiles = quantiles(durations, n=100, method='inclusive')
+        cache_lookups = hits[endpoint] + misses[endpoint]
+        results[endpoint] = {
+            'requests': len(durations),
+            'throughput': len(durations) / sum(durations),
+            'p50_ms': percentiles[49] * 1000,
+            'p99_ms': percentiles[98] * 1000,
+            'queries_avg': mean(queries[endpoint]),
+            'queries_max': max(queries[endpoint]),
+            'cache_hit_ratio': hits[endpoint] / cache_lookups if cache_lookups else 0,
+        }
+    return results
+
+
+def print_results(results):
+    columns = [
+        ('endpoint', 24, '{}'),
+        ('requests', 9, '{}'),
+        ('req/s', 9, '{:.1f}'),
+        ('p50 ms', 9, '{:.2f}'),
+        ('p99 ms', 9, '{:.2f}'),
+        ('queries', 9, '{:.2f}'),
+        ('max q.', 7, '{}'),
+        ('cache hit', 10, '{:.1%}'),
+    ]
+    print(''.join(name.ljust(width) for name, width, _ in columns))
+    for endpoint, result in results.items():
+        values = [endpoint] + list(result.values())
+        print(
+            ''.join(
+                fmt.format(value).ljust(width)
+                for (_, width, fmt), value in zip(columns, values)
+            )
+        )
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'openwisp2.settings')
+    # the test project settings use the same configuration used by tests
+    os.environ['BENCHMARK'] = '1'
+    import django
+
+    django.setup()
+    from django.db import connection
+    from django.test.utils import setup_test_environment, teardown_test_environment
+
+    setup_test_environment()
+    db_name = connection.creation.create_test_db(verbosity=0)
+    try:
+        devices = create_fixtures(args.devices, args.templates)
+        results = run(devices, args.rounds)
+    finally:
+        connection.creation.destroy_test_db(db_name, verbosity=0)
+        teardown_test_environment()
+    print_results(results)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=4)
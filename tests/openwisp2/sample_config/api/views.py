@@ -10,6 +10,9 @@ from openwisp_controller.config.api.views import (
 from openwisp_controller.config.api.views import (
     DeviceGroupListCreateView as BaseDeviceGroupListCreateView,
 )
+from openwisp_controller.config.api.views import (
+    DeviceImportView as BaseDeviceImportView,
+)
 from openwisp_controller.config.api.views import (
     DeviceListCreateView as BaseDeviceListCreateView,
 )
@@ -60,6 +63,10 @@ class DeviceListCreateView(BaseDeviceListCreateView):
     pass
 
 
+class DeviceImportView(BaseDeviceImportView):
+    pass
+
+
 class DeviceDetailView(BaseDeviceDetailView):
     pass
 
@@ -87,6 +94,7 @@ vpn_list = VpnListCreateView.as_view()
 vpn_detail = VpnDetailView.as_view()
 download_vpn_config = DownloadVpnView.as_view()
 device_list = DeviceListCreateView.as_view()
+device_import = DeviceImportView.as_view()
 device_detail = DeviceDetailView.as_view()
 download_device_config = DownloadDeviceView().as_view()
 devicegroup_list = DeviceGroupListCreateView.as_view()
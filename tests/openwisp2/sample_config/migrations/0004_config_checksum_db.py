@@ -0,0 +1,32 @@
+# Generated by Django 3.1.12 on 2021-07-05 10:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [('sample_config', '0003_name_unique_per_organization')]
+
+    operations = [
+        migrations.AddField(
+            model_name='config',
+            name='checksum_db',
+            field=models.CharField(
+                blank=True,
+                editable=False,
+                max_length=32,
+                null=True,
+                verbose_name='configuration checksum',
+            ),
+        ),
+        migrations.AddField(
+            model_name='config',
+            name='checksum_updated',
+            field=models.DateTimeField(
+                blank=True,
+                editable=False,
+                null=True,
+                verbose_name='checksum updated',
+            ),
+        ),
+    ]
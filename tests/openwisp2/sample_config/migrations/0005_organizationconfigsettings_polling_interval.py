@@ -0,0 +1,24 @@
+# Generated by Django 3.1.12 on 2021-07-12 09:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [('sample_config', '0004_config_checksum_db')]
+
+    operations = [
+        migrations.AddField(
+            model_name='organizationconfigsettings',
+            name='polling_interval',
+            field=models.PositiveIntegerField(
+                blank=True,
+                help_text=(
+                    'interval (in seconds) suggested to devices for checking '
+                    'configuration changes, overrides the global default'
+                ),
+                null=True,
+                verbose_name='polling interval',
+            ),
+        ),
+    ]
@@ -0,0 +1,54 @@
+import uuid
+
+import django.utils.timezone
+import model_utils.fields
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sample_config', '0005_organizationconfigsettings_polling_interval')
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DhParameters',
+            fields=[
+                (
+                    'id',
+                    models.UUIDField(
+                        default=uuid.uuid4,
+                        editable=False,
+                        primary_key=True,
+                        serialize=False,
+                    ),
+                ),
+                (
+                    'created',
+                    model_utils.fields.AutoCreatedField(
+                        default=django.utils.timezone.now,
+                        editable=False,
+                        verbose_name='created',
+                    ),
+                ),
+                (
+                    'modified',
+                    model_utils.fields.AutoLastModifiedField(
+                        default=django.utils.timezone.now,
+                        editable=False,
+                        verbose_name='modified',
+                    ),
+                ),
+                ('length', models.PositiveIntegerField(db_index=True)),
+                ('dh', models.TextField()),
+                ('details', models.CharField(blank=True, max_length=64, null=True)),
+            ],
+            options={
+                'verbose_name': 'DH parameters',
+                'verbose_name_plural': 'DH parameters',
+                'ordering': ('created',),
+                'abstract': False,
+            },
+        ),
+    ]
@@ -0,0 +1,16 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [('sample_config', '0006_dhparameters')]
+
+    operations = [
+        migrations.AddField(
+            model_name='config',
+            name='vpn_certs_pending',
+            field=models.BooleanField(
+                default=False, editable=False, verbose_name='VPN certificates pending'
+            ),
+        ),
+    ]
@@ -11,7 +11,11 @@ from openwisp_controller.config.base.tag import (
     AbstractTemplateTag,
 )
 from openwisp_controller.config.base.template import AbstractTemplate
-from openwisp_controller.config.base.vpn import AbstractVpn, AbstractVpnClient
+from openwisp_controller.config.base.vpn import (
+    AbstractDhParameters,
+    AbstractVpn,
+    AbstractVpnClient,
+)
 
 
 class DetailsModel(models.Model):
@@ -93,6 +97,15 @@ class VpnClient(DetailsModel, AbstractVpnClient):
         abstract = False
 
 
+class DhParameters(DetailsModel, AbstractDhParameters):
+    """
+    Pool of pre-generated DH parameters
+    """
+
+    class Meta(AbstractDhParameters.Meta):
+        abstract = False
+
+
 class OrganizationConfigSettings(DetailsModel, AbstractOrganizationConfigSettings):
     """
     Configuration management settings
@@ -1,3 +1,12 @@
+from openwisp_controller.connection.api.views import (
+    BatchCommandDetailView as BaseBatchCommandDetailView,
+)
+from openwisp_controller.connection.api.views import (
+    BatchCommandListCreateView as BaseBatchCommandListCreateView,
+)
+from openwisp_controller.connection.api.views import (
+    BatchCommandResultListView as BaseBatchCommandResultListView,
+)
 from openwisp_controller.connection.api.views import (
     CommandDetailsView as BaseCommandDetailsView,
 )
@@ -42,9 +51,24 @@ class DeviceConnectionDetailView(BaseDeviceConnectionDetailView):
     pass
 
 
+class BatchCommandListCreateView(BaseBatchCommandListCreateView):
+    pass
+
+
+class BatchCommandDetailView(BaseBatchCommandDetailView):
+    pass
+
+
+class BatchCommandResultListView(BaseBatchCommandResultListView):
+    pass
+
+
 command_list_create_view = CommandListCreateView.as_view()
 command_details_view = CommandDetailsView.as_view()
 credential_list_create_view = CredentialListCreateView.as_view()
 credential_detail_view = CredentialDetailView.as_view()
 deviceconnection_list_create_view = DeviceConnenctionListCreateView.as_view()
 deviceconnection_details_view = DeviceConnectionDetailView.as_view()
+batch_command_list_create_view = BatchCommandListCreateView.as_view()
+batch_command_detail_view = BatchCommandDetailView.as_view()
+batch_command_result_list_view = BatchCommandResultListView.as_view()
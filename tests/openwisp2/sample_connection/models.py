@@ -1,6 +1,7 @@
 from django.db import models
 
 from openwisp_controller.connection.base.models import (
+    AbstractBatchCommand,
     AbstractCommand,
     AbstractCredentials,
     AbstractDeviceConnection,
@@ -27,3 +28,8 @@ class DeviceConnection(DetailsModel, AbstractDeviceConnection):
 class Command(AbstractCommand):
     class Meta(AbstractCommand.Meta):
         abstract = False
+
+
+class BatchCommand(AbstractBatchCommand):
+    class Meta(AbstractBatchCommand.Meta):
+        abstract = False
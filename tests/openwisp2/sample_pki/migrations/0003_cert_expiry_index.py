@@ -0,0 +1,15 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sample_pki', '0002_default_group_permissions'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='cert',
+            index=models.Index(fields=['validity_end'], name='sample_pki_cert_expiry'),
+        ),
+    ]
@@ -3,7 +3,8 @@ import sys
 
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 DEBUG = True
-TESTING = sys.argv[1:2] == ['test']
+# the benchmark suite runs with the same configuration used by tests
+TESTING = sys.argv[1:2] == ['test'] or bool(os.environ.get('BENCHMARK', False))
 SELENIUM_HEADLESS = True if os.environ.get('SELENIUM_HEADLESS', False) else False
 SHELL = 'shell' in sys.argv or 'shell_plus' in sys.argv
 
@@ -233,6 +234,7 @@ if os.environ.get('SAMPLE_APP', False):
     CONFIG_TEMPLATE_MODEL = 'sample_config.Template'
     CONFIG_VPN_MODEL = 'sample_config.Vpn'
     CONFIG_VPNCLIENT_MODEL = 'sample_config.VpnClient'
+    CONFIG_DHPARAMETERS_MODEL = 'sample_config.DhParameters'
     CONFIG_ORGANIZATIONCONFIGSETTINGS_MODEL = 'sample_config.OrganizationConfigSettings'
     DJANGO_X509_CA_MODEL = 'sample_pki.Ca'
     DJANGO_X509_CERT_MODEL = 'sample_pki.Cert'
@@ -242,6 +244,7 @@ if os.environ.get('SAMPLE_APP', False):
     CONNECTION_CREDENTIALS_MODEL = 'sample_connection.Credentials'
     CONNECTION_DEVICECONNECTION_MODEL = 'sample_connection.DeviceConnection'
     CONNECTION_COMMAND_MODEL = 'sample_connection.Command'
+    CONNECTION_BATCHCOMMAND_MODEL = 'sample_connection.BatchCommand'
 else:
     # not needed, these are the default values, left here only for example purposes
     # DJANGO_X509_CA_MODEL = 'pki.Ca'